@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+History Backfill
+Fills the comparison tables from the Home Assistant history API.
+"""
+
+import asyncio
+import bisect
+from collections import deque
+import logging
+import sqlite3
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pv_database import PVDatabase
+from rollups import update_comparison_rollups
+
+logger = logging.getLogger(__name__)
+
+History = Dict[str, List[Tuple[float, Optional[float]]]]
+
+def create_backfill_table(conn: sqlite3.Connection):
+    """Create the table holding backfill checkpoints."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_state (
+            name TEXT PRIMARY KEY,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            completed_through TEXT,
+            updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def value_at(points: List[Tuple[float, Optional[float]]], ts: float) -> Optional[float]:
+    """Value of the last state at or before ts."""
+    index = bisect.bisect_right(points, ts, key=lambda point: point[0])
+    return points[index - 1][1] if index else None
+
+class RateLimiter:
+    """Spaces out request starts to at most rate per second."""
+    
+    def __init__(self, rate: float):
+        """Initialize the limiter; a rate of 0 disables it."""
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def wait(self):
+        """Wait until the next request may start."""
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, loop.time()) + self.interval
+
+class HistoryBackfill:
+    """Reconstructs time slot and daily rows from the history of the configured entities.
+    
+    The range is split into chunks of chunk_days that are fetched
+    concurrently (at most concurrency at a time and requests_per_second).
+    Results are written in date order in transactions of batch_days, each
+    also advancing the checkpoint, so an interrupted backfill continues
+    after the last written day. Existing rows are never overwritten.
+    """
+    
+    # Name of this backfill's row in backfill_state
+    checkpoint_name = 'history'
+    
+    def __init__(self, comparison, db: PVDatabase, collection_times: Dict[str, str],
+                 chunk_days: int = 1, concurrency: int = 2, requests_per_second: float = 2,
+                 batch_days: int = 7):
+        """Initialize the backfill for a PVForecastComparison and its database."""
+        self.comparison = comparison
+        self.db = db
+        self.collection_times = {slot: datetime.strptime(value, '%H:%M:%S').time()
+                                 for slot, value in collection_times.items()}
+        self.chunk_days = max(1, chunk_days)
+        self.concurrency = max(1, concurrency)
+        self.batch_days = max(1, batch_days)
+        self._limiter = RateLimiter(requests_per_second)
+        self._task: Optional[asyncio.Task] = None
+        self.status: Dict[str, Any] = {'state': 'idle'}
+        db.write_sync(create_backfill_table)
+    
+    @property
+    def running(self) -> bool:
+        """Whether a backfill is in progress."""
+        return self._task is not None and not self._task.done()
+    
+    async def get_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """Read the checkpoint row."""
+        def query(conn):
+            row = conn.execute('''
+                SELECT start_date, end_date, completed_through, updated
+                FROM backfill_state WHERE name = ?
+            ''', (self.checkpoint_name,)).fetchone()
+            if row is None:
+                return None
+            return dict(zip(('start_date', 'end_date', 'completed_through', 'updated'), row))
+        return await self.db.read(query)
+    
+    def start(self, start: date, end: date) -> bool:
+        """Start a backfill in the background; returns False if one is already running."""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self.run(start, end))
+        return True
+    
+    async def stop(self):
+        """Cancel a running backfill; it can be resumed later."""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def run(self, start: date, end: date) -> int:
+        """Backfill start..end (inclusive) and return the number of days written.
+        
+        If the checkpoint belongs to the same range, days up to its
+        completed_through date are skipped.
+        """
+        checkpoint = await self.get_checkpoint()
+        resume_from = start
+        if (checkpoint and checkpoint['completed_through']
+                and checkpoint['start_date'] == start.isoformat()
+                and checkpoint['end_date'] == end.isoformat()):
+            resume_from = date.fromisoformat(checkpoint['completed_through']) + timedelta(days=1)
+            logger.info(f"Resuming {self.checkpoint_name} backfill after {checkpoint['completed_through']}")
+        
+        chunks = []
+        day = resume_from
+        while day <= end:
+            chunk_end = min(day + timedelta(days=self.chunk_days - 1), end)
+            chunks.append((day, chunk_end))
+            day = chunk_end + timedelta(days=1)
+        
+        self.status = {
+            'state': 'running',
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'completed_through': (resume_from - timedelta(days=1)).isoformat() if resume_from > start else None,
+            'chunks_done': 0,
+            'chunks_total': len(chunks),
+            'days_written': 0,
+            'error': None
+        }
+        logger.info(f"Backfilling {start} to {end} from {self.checkpoint_name} in {len(chunks)} chunks")
+        try:
+            if resume_from > end:
+                self.status['state'] = 'completed'
+                return 0
+            await self.db.write(self._save_checkpoint, start, end, self.status['completed_through'])
+            await self._run_chunks(start, end, chunks)
+            self.status['state'] = 'completed'
+            logger.info(f"Backfill from {self.checkpoint_name} completed: {self.status['days_written']} days written")
+            return self.status['days_written']
+        except asyncio.CancelledError:
+            self.status['state'] = 'cancelled'
+            raise
+        except Exception as e:
+            logger.error(f"Backfill from {self.checkpoint_name} failed: {e}")
+            self.status.update({'state': 'failed', 'error': str(e)})
+            return self.status['days_written']
+    
+    async def _run_chunks(self, start: date, end: date, chunks: List[Tuple[date, date]]):
+        """Fetch chunks concurrently and write their rows in order."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def fetch(chunk):
+            async with semaphore:
+                return await self._fetch_chunk(*chunk)
+        
+        # Chunks are started in order, at most a small window ahead of the
+        # oldest unwritten one, so finished chunks never pile up in memory
+        window = self.concurrency * 2
+        remaining = iter(chunks)
+        pending: deque = deque()
+        
+        def schedule():
+            while len(pending) < window:
+                chunk = next(remaining, None)
+                if chunk is None:
+                    return
+                pending.append((chunk, asyncio.create_task(fetch(chunk))))
+        
+        try:
+            forecast_rows: List[tuple] = []
+            daily_rows: List[tuple] = []
+            batch_start = None
+            schedule()
+            while pending:
+                (chunk_start, chunk_end), task = pending[0]
+                chunk_forecast, chunk_daily = await task
+                pending.popleft()
+                schedule()
+                forecast_rows.extend(chunk_forecast)
+                daily_rows.extend(chunk_daily)
+                batch_start = batch_start or chunk_start
+                self.status['chunks_done'] += 1
+                if (chunk_end - batch_start).days + 1 >= self.batch_days or chunk_end == end:
+                    await self.db.write(self._store_batch, forecast_rows, daily_rows, start, end, chunk_end)
+                    self.status['days_written'] += (chunk_end - batch_start).days + 1
+                    self.status['completed_through'] = chunk_end.isoformat()
+                    forecast_rows, daily_rows, batch_start = [], [], None
+        finally:
+            for _, task in pending:
+                task.cancel()
+    
+    async def _fetch_chunk(self, start: date, end: date) -> Tuple[List[tuple], List[tuple]]:
+        """Fetch the history of one chunk and derive its rows."""
+        comparison = self.comparison
+        entities = comparison.all_entities
+        await self._limiter.wait()
+        history = await comparison.ha_client.get_history(
+            entities,
+            datetime.combine(start, time.min).astimezone(),
+            datetime.combine(end + timedelta(days=1), time.min).astimezone()
+        )
+        if history is None:
+            raise RuntimeError(f"Could not fetch history for {start} to {end}")
+        return self.rows_from_history(history, start, end)
+    
+    def rows_from_history(self, history: History, start: date,
+                          end: date) -> Tuple[List[tuple], List[tuple]]:
+        """Build pv_forecast and daily_production rows of every site from entity histories.
+        
+        Each time slot takes the values the entities had at its collection
+        time, choosing from each site's fallback chains as a live collection
+        would.
+        """
+        comparison = self.comparison
+        forecast_rows, daily_rows = [], []
+        day = start
+        while day <= end:
+            for slot, slot_time in self.collection_times.items():
+                ts = datetime.combine(day, slot_time).timestamp()
+                values = {entity: value_at(points, ts) for entity, points in history.items()}
+                for site in comparison.sites:
+                    provider = comparison.first_entity(site.forecast_entities, values)
+                    if provider is None:
+                        continue
+                    forecast_wh = values[provider]
+                    actual_entity = comparison.first_entity(site.production_entities, values)
+                    actual_wh = values[actual_entity] if actual_entity else 0
+                    forecast_rows.append((site.name, day.isoformat(), slot, forecast_wh, actual_wh, provider))
+                    if slot == '11pm':
+                        daily_entity = comparison.first_entity(site.daily_entities, values)
+                        if daily_entity:
+                            daily_rows.append((site.name, day.isoformat(), forecast_wh,
+                                               values[daily_entity], provider))
+            day += timedelta(days=1)
+        return forecast_rows, daily_rows
+    
+    @classmethod
+    def _save_checkpoint(cls, conn: sqlite3.Connection, start: date, end: date,
+                         completed_through: Optional[str]):
+        """Write the checkpoint row."""
+        conn.execute('''
+            INSERT INTO backfill_state (name, start_date, end_date, completed_through)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                start_date = excluded.start_date,
+                end_date = excluded.end_date,
+                completed_through = excluded.completed_through,
+                updated = CURRENT_TIMESTAMP
+        ''', (cls.checkpoint_name, start.isoformat(), end.isoformat(), completed_through))
+    
+    @classmethod
+    def _store_batch(cls, conn: sqlite3.Connection, forecast_rows: List[tuple], daily_rows: List[tuple],
+                     start: date, end: date, completed_through: date):
+        """Insert one batch, update its rollups and advance the checkpoint in one transaction."""
+        conn.executemany('''
+            INSERT OR IGNORE INTO pv_forecast (site, date, time_slot, forecast_wh, actual_wh, provider)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', forecast_rows)
+        conn.executemany('''
+            INSERT OR IGNORE INTO daily_production (site, date, total_forecast_wh, total_actual_wh, provider)
+            VALUES (?, ?, ?, ?, ?)
+        ''', daily_rows)
+        site_days: Dict[str, set] = {}
+        for row in forecast_rows + daily_rows:
+            site_days.setdefault(row[0], set()).add(row[1])
+        for site, days in site_days.items():
+            update_comparison_rollups(conn, days, site)
+        cls._save_checkpoint(conn, start, end, completed_through.isoformat())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Synthetic Database Generator
+Creates pv_forecast.db files covering several years for benchmarking.
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_stats import refresh_table_sizes
+from pv_forecast_comparison import PVForecastComparison
+from rollups import rebuild_rollups
+from sites import DEFAULT_SITE
+
+SLOT_TIMES = {'4am': 4, '11am': 11, '3pm': 15, '11pm': 23}
+PROVIDERS = ('sensor.pv_production_forecast', 'sensor.solar_forecast')
+SAMPLE_ENTITIES = ('sensor.pv_power', 'sensor.pv_daily_energy', 'sensor.pv_production_forecast')
+
+# Sunrise/sunset hours and peak daily production (Wh) at the summer solstice
+SUNRISE, SUNSET = 6.0, 20.0
+PEAK_DAILY_WH = 40000
+
+def seasonal_factor(day: date) -> float:
+    """Share of the solstice production expected on a day (about 0.15 in winter to 1 in summer)."""
+    return 0.575 + 0.425 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 172) / 365.25)
+
+def production_share(hour: float) -> float:
+    """Share of the day's production generated up to an hour (sine-shaped day)."""
+    if hour <= SUNRISE:
+        return 0.0
+    if hour >= SUNSET:
+        return 1.0
+    return (1 - math.cos(math.pi * (hour - SUNRISE) / (SUNSET - SUNRISE))) / 2
+
+class SyntheticDay:
+    """Forecast and actual production of one generated day."""
+    
+    def __init__(self, day: date, rng: random.Random):
+        """Draw the day's forecast, weather and provider."""
+        self.day = day
+        self.forecast_wh = round(PEAK_DAILY_WH * seasonal_factor(day) * rng.uniform(0.6, 1.0), 1)
+        # The weather makes the actual production miss the forecast in both directions
+        self.actual_wh = round(self.forecast_wh * min(max(rng.gauss(1.0, 0.25), 0.05), 1.6), 1)
+        # The primary forecast provider is occasionally unavailable
+        self.provider = PROVIDERS[0] if rng.random() > 0.05 else PROVIDERS[1]
+    
+    def actual_until(self, hour: float) -> float:
+        """Energy produced up to an hour of the day."""
+        return round(self.actual_wh * production_share(hour), 1)
+    
+    def power_at(self, hour: float) -> float:
+        """Instantaneous power (W) at an hour of the day."""
+        if not SUNRISE < hour < SUNSET:
+            return 0.0
+        span = SUNSET - SUNRISE
+        return round(self.actual_wh * math.pi / (2 * span) * math.sin(math.pi * (hour - SUNRISE) / span), 1)
+
+def days_back(years: float, end: Optional[date] = None) -> Iterator[date]:
+    """The dates of the last years, ending yesterday."""
+    end = end or date.today() - timedelta(days=1)
+    day = end - timedelta(days=round(years * 365.25) - 1)
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+def site_names(sites: int) -> List[str]:
+    """Names of generated sites: the default site, then site-001, site-002, ..."""
+    return [DEFAULT_SITE] + [f'site-{index:03d}' for index in range(1, sites)]
+
+def comparison_rows(days, site: str = DEFAULT_SITE) -> Tuple[list, list]:
+    """pv_forecast and daily_production rows of the generated days of one site."""
+    forecast_rows, daily_rows = [], []
+    for synthetic in days:
+        day = synthetic.day.isoformat()
+        for slot, hour in SLOT_TIMES.items():
+            stamp = f'{day} {hour:02d}:00:00'
+            forecast_rows.append((site, day, slot, synthetic.forecast_wh, synthetic.actual_until(hour),
+                                  synthetic.provider, stamp))
+        daily_rows.append((site, day, synthetic.forecast_wh, synthetic.actual_wh, synthetic.provider,
+                           f'{day} 23:00:00'))
+    return forecast_rows, daily_rows
+
+def sample_rows(days, interval: int) -> Iterator[Tuple[str, float, float]]:
+    """pv_samples rows: power, cumulative energy and forecast every interval seconds."""
+    for synthetic in days:
+        midnight = datetime.combine(synthetic.day, datetime.min.time()).timestamp()
+        for offset in range(0, 86400, interval):
+            hour = offset / 3600
+            ts = midnight + offset
+            yield (SAMPLE_ENTITIES[0], ts, synthetic.power_at(hour))
+            yield (SAMPLE_ENTITIES[1], ts, synthetic.actual_until(hour))
+            yield (SAMPLE_ENTITIES[2], ts, synthetic.forecast_wh)
+
+def generate(path: str, years: float, sample_interval: Optional[int] = None, seed: int = 42,
+             sites: int = 1) -> dict:
+    """Create a database at path with years of data and return a summary.
+    
+    The schema, statistics triggers and rollups come from the add-on's own
+    code, so the result matches a database the add-on built itself. With
+    sample_interval, pv_samples gets three entities at that resolution.
+    With several sites, each gets its own independently drawn days.
+    """
+    started = time.perf_counter()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(seed)
+    days = [SyntheticDay(day, rng) for day in days_back(years)]
+    forecast_rows, daily_rows = comparison_rows(days)
+    for site in site_names(sites)[1:]:
+        site_forecast, site_daily = comparison_rows([SyntheticDay(d.day, rng) for d in days], site)
+        forecast_rows.extend(site_forecast)
+        daily_rows.extend(site_daily)
+    
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    # REPLACE conflicts must fire the db_stats delete triggers, as on the add-on's writer
+    conn.execute('PRAGMA recursive_triggers = ON')
+    with conn:
+        PVForecastComparison._create_tables(conn)
+        conn.executemany('''
+            INSERT INTO pv_forecast (site, date, time_slot, forecast_wh, actual_wh, provider, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', forecast_rows)
+        conn.executemany('''
+            INSERT INTO daily_production (site, date, total_forecast_wh, total_actual_wh, provider, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', daily_rows)
+        sample_count = 0
+        if sample_interval:
+            cursor = conn.executemany('INSERT INTO pv_samples (entity_id, ts, value) VALUES (?, ?, ?)',
+                                      sample_rows(days, sample_interval))
+            sample_count = cursor.rowcount
+        rebuild_rollups(conn)
+        refresh_table_sizes(conn, max_age_minutes=0)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    
+    return {
+        'path': path,
+        'years': years,
+        'sites': sites,
+        'days': len(days),
+        'forecast_rows': len(forecast_rows),
+        'daily_rows': len(daily_rows),
+        'sample_rows': sample_count,
+        'sample_interval': sample_interval,
+        'size_bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+def database_name(years: float, sample_interval: Optional[int], sites: int = 1) -> str:
+    """File name of a generated database."""
+    name = f'pv_{years:g}y'
+    if sites > 1:
+        name += f'_sites{sites}'
+    if sample_interval:
+        name += f'_samples{sample_interval}s'
+    return name + '.db'
+
+def main():
+    """Generate the requested databases."""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5, 20],
+                        help='history lengths to generate (default: 1 5 20)')
+    parser.add_argument('--samples', type=int, nargs='*', default=[], metavar='SECONDS',
+                        help='also generate variants with pv_samples at these intervals, e.g. 300')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'),
+                        help='output directory (default: benchmarks/data)')
+    parser.add_argument('--sites', type=int, default=1,
+                        help='number of sites with their own comparison rows (default: 1)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    os.makedirs(args.output, exist_ok=True)
+    for years in args.years:
+        for interval in [None] + args.samples:
+            path = os.path.join(args.output, database_name(years, interval, args.sites))
+            summary = generate(path, years, interval, args.seed, args.sites)
+            print(f"{path}: {summary['forecast_rows']} slot rows, {summary['sample_rows']} samples, "
+                  f"{summary['size_bytes'] / 1e6:.1f} MB in {summary['seconds']} s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Home Assistant Stub
+Local stand-in for the Home Assistant REST API with configurable latency and failures.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiohttp import WSMsgType, web
+
+DEFAULT_ENTITIES = {
+    'sensor.pv_production_forecast': 25000,
+    'sensor.solar_forecast': 24000,
+    'sensor.pv_power': 3500,
+    'sensor.pv_daily_energy': 18000
+}
+
+class HAStub:
+    """Serves /api/states, /api/states/{entity_id}, /api/history/period/{start} and /api/websocket.
+    
+    Every REST request waits latency seconds plus a uniform jitter, then
+    fails with HTTP 500 with probability failure_rate; with probability
+    timeout_rate it never answers within timeout_delay instead. The state
+    list can be padded with filler entities to mimic a large instance.
+    
+    The history of an entity holds its current value every history_interval
+    seconds of the requested period, in the minimal_response format.
+    
+    WebSocket clients authenticate with any token (or only with token, if
+    given) and may subscribe_entities; set_state pushes changes to them and
+    drop_connections closes every connection.
+    """
+    
+    def __init__(self, entities: Optional[Dict[str, float]] = None, latency: float = 0.0,
+                 jitter: float = 0.0, failure_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout_delay: float = 30.0, extra_entities: int = 0, seed: Optional[int] = None,
+                 token: Optional[str] = None, history_interval: float = 3600):
+        """Initialize the stub."""
+        self.entities = dict(DEFAULT_ENTITIES if entities is None else entities)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.extra_entities = extra_entities
+        self.rng = random.Random(seed)
+        self.token = token
+        self.history_interval = history_interval
+        self.requests = 0
+        self.failures = 0
+        # History requests received, running now and most running at once
+        self.history_requests: List[Dict[str, str]] = []
+        self.history_in_flight = 0
+        self.max_history_in_flight = 0
+        self.ws_connections = 0
+        self.subscriptions = 0
+        # Open WebSocket connections with the subscription id and entities of each
+        self._subscribers: Dict[web.WebSocketResponse, Tuple[int, List[str]]] = {}
+        self._sockets: Set[web.WebSocketResponse] = set()
+        self._runner: Optional[web.AppRunner] = None
+    
+    def state(self, entity_id: str, value: float) -> Dict:
+        """A state object as returned by Home Assistant."""
+        now = datetime.now(timezone.utc).isoformat()
+        return {
+            'entity_id': entity_id,
+            'state': str(round(value * self.rng.uniform(0.95, 1.05), 1)),
+            'attributes': {'unit_of_measurement': 'Wh', 'device_class': 'energy', 'state_class': 'total'},
+            'last_changed': now,
+            'last_updated': now
+        }
+    
+    def all_states(self) -> Iterable[Dict]:
+        """States of the configured entities and the filler entities."""
+        for entity_id, value in self.entities.items():
+            yield self.state(entity_id, value)
+        for index in range(self.extra_entities):
+            yield self.state(f'sensor.filler_{index}', index)
+    
+    async def _delay_or_fail(self) -> Optional[web.Response]:
+        """Apply latency and return an error response for a simulated failure."""
+        self.requests += 1
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        roll = self.rng.random()
+        if roll < self.timeout_rate:
+            delay += self.timeout_delay
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if roll >= 1 - self.failure_rate:
+            self.failures += 1
+            return web.json_response({'message': 'Simulated failure'}, status=500)
+        return None
+    
+    async def handle_states(self, request: web.Request) -> web.Response:
+        """GET /api/states."""
+        error = await self._delay_or_fail()
+        return error or web.json_response(list(self.all_states()))
+    
+    async def handle_state(self, request: web.Request) -> web.Response:
+        """GET /api/states/{entity_id}."""
+        error = await self._delay_or_fail()
+        if error:
+            return error
+        entity_id = request.match_info['entity_id']
+        if entity_id not in self.entities:
+            return web.json_response({'message': 'Entity not found.'}, status=404)
+        return web.json_response(self.state(entity_id, self.entities[entity_id]))
+    
+    async def handle_history(self, request: web.Request) -> web.Response:
+        """GET /api/history/period/{start}?end_time=&filter_entity_id=."""
+        start = datetime.fromisoformat(request.match_info['start'])
+        end = datetime.fromisoformat(request.query['end_time'])
+        entity_ids = [entity_id for entity_id in request.query.get('filter_entity_id', '').split(',')
+                      if entity_id in self.entities]
+        self.history_requests.append({'start': start.isoformat(), 'end': end.isoformat()})
+        self.history_in_flight += 1
+        self.max_history_in_flight = max(self.max_history_in_flight, self.history_in_flight)
+        try:
+            error = await self._delay_or_fail()
+        finally:
+            self.history_in_flight -= 1
+        if error:
+            return error
+        
+        history = []
+        for entity_id in entity_ids:
+            states = []
+            ts = start.timestamp()
+            while ts < end.timestamp():
+                changed = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+                states.append({'state': str(self.entities[entity_id]), 'last_changed': changed})
+                ts += self.history_interval
+            if states:
+                # With minimal_response only the first state names the entity
+                states[0].update({'entity_id': entity_id, 'attributes': {}, 'last_updated': states[0]['last_changed']})
+                history.append(states)
+        return web.json_response(history)
+    
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        """GET /api/websocket: auth handshake, then subscribe_entities commands."""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.ws_connections += 1
+        self._sockets.add(ws)
+        try:
+            await ws.send_json({'type': 'auth_required'})
+            message = await ws.receive_json()
+            if message.get('type') != 'auth' or (self.token is not None and message.get('access_token') != self.token):
+                await ws.send_json({'type': 'auth_invalid', 'message': 'Invalid access token'})
+                return ws
+            await ws.send_json({'type': 'auth_ok'})
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                command = msg.json()
+                if command.get('type') != 'subscribe_entities':
+                    await ws.send_json({'id': command.get('id'), 'type': 'result', 'success': False,
+                                        'error': {'code': 'unknown_command', 'message': 'Unknown command'}})
+                    continue
+                self.subscriptions += 1
+                entity_ids = list(command.get('entity_ids') or self.entities)
+                self._subscribers[ws] = (command['id'], entity_ids)
+                await ws.send_json({'id': command['id'], 'type': 'result', 'success': True})
+                now = time.time()
+                await ws.send_json({'id': command['id'], 'type': 'event', 'event': {'a': {
+                    entity_id: {'s': str(self.entities[entity_id]), 'lu': now}
+                    for entity_id in entity_ids if entity_id in self.entities
+                }}})
+        finally:
+            self._subscribers.pop(ws, None)
+            self._sockets.discard(ws)
+        return ws
+    
+    async def set_state(self, entity_id: str, value: float):
+        """Change an entity's value and push the change to its WebSocket subscribers."""
+        added = entity_id not in self.entities
+        self.entities[entity_id] = value
+        state = {'s': str(value), 'lu': time.time()}
+        event = {'a': {entity_id: state}} if added else {'c': {entity_id: {'+': state}}}
+        for ws, (subscription_id, entity_ids) in list(self._subscribers.items()):
+            if entity_id in entity_ids and not ws.closed:
+                await ws.send_json({'id': subscription_id, 'type': 'event', 'event': event})
+    
+    async def drop_connections(self):
+        """Close every WebSocket connection, as a Home Assistant restart would."""
+        for ws in list(self._sockets):
+            await ws.close()
+    
+    def create_app(self) -> web.Application:
+        """The stub application."""
+        app = web.Application()
+        app.router.add_get('/api/states', self.handle_states)
+        app.router.add_get('/api/states/{entity_id}', self.handle_state)
+        app.router.add_get('/api/history/period/{start}', self.handle_history)
+        app.router.add_get('/api/websocket', self.handle_websocket)
+        return app
+    
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving and return the base URL (port 0 picks a free port)."""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        return f'http://{host}:{bound_port}'
+    
+    async def stop(self):
+        """Stop serving."""
+        await self.drop_connections()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def main():
+    """Run the stub until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8124)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per request (default: 0.05)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random seconds per request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of requests answered with 500')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='share of requests that hang')
+    parser.add_argument('--extra-entities', type=int, default=0, help='filler entities in /api/states')
+    args = parser.parse_args()
+    
+    stub = HAStub(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                  timeout_rate=args.timeout_rate, extra_entities=args.extra_entities)
+    web.run_app(stub.create_app(), host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
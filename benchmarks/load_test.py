@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Load Test
+Drives simulated dashboard clients and manual collections against the web API and reports latency, throughput and event-loop lag.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import aiohttp
+from aiohttp import web
+
+from collection_queue import CollectionQueue
+from generate_db import generate
+from ha_client import create_session
+from ha_stub import HAStub
+from pv_data_retriever import PVDataRetriever
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+from run import PVForecastAddon
+from run_benchmarks import benchmark_config, environment
+
+# Requests a dashboard tab makes: 'polling' is the older page refreshing four
+# endpoints on a timer, 'push' the current page (load once, then server-sent events)
+POLLING_REQUESTS = [
+    ('status', '/api/status'),
+    ('data', '/api/data'),
+    ('historical_7d', '/api/historical?days=7'),
+    ('historical_30d', '/api/historical?days=30')
+]
+PAGE_REQUESTS = [
+    ('index', '/'),
+    ('dashboard', '/api/dashboard?days=7')
+]
+
+TIME_SLOTS = ('4am', '11am', '3pm', '11pm')
+
+def latency_stats(durations: List[float]) -> Dict[str, float]:
+    """Count and percentiles of a list of durations, in milliseconds."""
+    if not durations:
+        return {'count': 0}
+    ms = sorted(d * 1000 for d in durations)
+    
+    def percentile(q: float) -> float:
+        return round(ms[max(0, math.ceil(q * len(ms)) - 1)], 3)
+    return {
+        'count': len(ms),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(ms[-1], 3),
+        'mean_ms': round(sum(ms) / len(ms), 3)
+    }
+
+class LoopLagMonitor:
+    """Measures how late the event loop resumes a task sleeping for interval seconds.
+    
+    Any callback that blocks the loop (a synchronous query, a large JSON
+    dump) delays every other request by the same amount, which shows up here.
+    """
+    
+    def __init__(self, interval: float = 0.05):
+        """Initialize the monitor."""
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+    
+    async def _run(self):
+        """Sleep in a loop and record the overshoot of every sleep."""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+    
+    def start(self):
+        """Start sampling."""
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop sampling."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+async def _serve(options: Dict[str, Any], ready, stop, results):
+    """Run the add-on web app until stop is set, then report its loop lag and CPU time."""
+    logging.basicConfig(level=getattr(logging, options['log_level'].upper()))
+    addon = PVForecastAddon(benchmark_config(
+        ha_url=options['ha_url'],
+        ha_token='load-test',
+        forecast_entities=options['forecast_entities'],
+        production_entities=['sensor.pv_power'],
+        daily_entities=['sensor.pv_daily_energy'],
+        websocket_ingestion=False,
+        db_path=options['db_path'],
+        static_dir=os.path.join(options['workdir'], 'static')
+    ))
+    addon.session = create_session()
+    addon.db = PVDatabase(options['db_path'])
+    addon.retriever = PVDataRetriever(addon.db)
+    addon.pv_comparison = PVForecastComparison(addon.config, session=addon.session, db=addon.db,
+                                               events=addon.events)
+    addon.collection_queue = CollectionQueue(addon.pv_comparison.collect_data, workers=options['workers'])
+    await addon.collection_queue.start()
+    
+    runner = web.AppRunner(addon.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    
+    monitor = LoopLagMonitor(options['lag_interval'])
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    monitor.start()
+    ready.put(runner.addresses[0][1])
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+    finally:
+        await monitor.stop()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        results.put({
+            'event_loop_lag': latency_stats(monitor.lags),
+            'cpu_seconds': round(usage.ru_utime + usage.ru_stime - cpu_start, 3),
+            'max_rss_kib': usage.ru_maxrss,
+            'event_clients': addon.events.client_count
+        })
+        await runner.cleanup()
+        await addon.collection_queue.stop()
+        await addon.session.close()
+        addon.db.close()
+
+def serve(options: Dict[str, Any], ready, stop, results):
+    """Entry point of the server process."""
+    asyncio.run(_serve(options, ready, stop, results))
+
+class LoadTest:
+    """Simulated dashboard clients and a manual collection driver against one server."""
+    
+    def __init__(self, base_url: str, clients: int, profile: str, interval: float,
+                 reload_interval: float, collect_interval: float):
+        """Initialize the load test."""
+        self.base_url = base_url
+        self.clients = clients
+        self.profile = profile
+        self.interval = interval
+        self.reload_interval = reload_interval
+        self.collect_interval = collect_interval
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.collection_times: List[float] = []
+        self.events_received = 0
+    
+    async def request(self, session: aiohttp.ClientSession, name: str, method: str, path: str,
+                      **kwargs) -> Optional[Any]:
+        """Make one request, record its latency and return the decoded JSON body (if any)."""
+        start = time.perf_counter()
+        try:
+            async with session.request(method, path, **kwargs) as response:
+                body = await response.read()
+                elapsed = time.perf_counter() - start
+                if response.status >= 400:
+                    self.errors[name] += 1
+                    return None
+                self.latencies[name].append(elapsed)
+                if response.content_type == 'application/json':
+                    return json.loads(body)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.errors[name] += 1
+        return None
+    
+    async def load_page(self, session: aiohttp.ClientSession):
+        """Fetch what the dashboard needs on page load, in parallel like a browser."""
+        await asyncio.gather(*(self.request(session, name, 'GET', path) for name, path in PAGE_REQUESTS))
+    
+    async def listen(self, session: aiohttp.ClientSession):
+        """Hold the event stream open and refresh the status on slot and daily events."""
+        refreshes = set()
+        try:
+            async with session.get('/api/events', timeout=aiohttp.ClientTimeout(total=None)) as response:
+                async for line in response.content:
+                    if not line.startswith(b'event:'):
+                        continue
+                    self.events_received += 1
+                    if line[6:].strip() in (b'slot', b'daily'):
+                        task = asyncio.create_task(self.request(session, 'status', 'GET', '/api/status'))
+                        refreshes.add(task)
+                        task.add_done_callback(refreshes.discard)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.errors['events'] += 1
+        finally:
+            for task in refreshes:
+                task.cancel()
+    
+    async def polling_client(self, session: aiohttp.ClientSession):
+        """Refresh the four polled endpoints every interval seconds."""
+        while True:
+            started = time.perf_counter()
+            await asyncio.gather(*(self.request(session, name, 'GET', path) for name, path in POLLING_REQUESTS))
+            await asyncio.sleep(max(0.0, self.interval - (time.perf_counter() - started)))
+    
+    async def push_client(self, session: aiohttp.ClientSession):
+        """Load the page, then follow server-sent events, reloading every reload_interval seconds."""
+        while True:
+            await self.load_page(session)
+            listener = asyncio.create_task(self.listen(session))
+            try:
+                if self.reload_interval > 0:
+                    await asyncio.sleep(self.reload_interval)
+                else:
+                    await listener
+                    return
+            finally:
+                listener.cancel()
+                await asyncio.gather(listener, return_exceptions=True)
+    
+    async def client(self):
+        """One dashboard tab; tabs start spread over the first interval."""
+        await asyncio.sleep(random.uniform(0, self.interval) if self.clients > 1 else 0)
+        # A tab opens at most six connections to one host
+        connector = aiohttp.TCPConnector(limit=6)
+        async with aiohttp.ClientSession(self.base_url, connector=connector) as session:
+            if self.profile == 'polling':
+                await self.polling_client(session)
+            else:
+                await self.push_client(session)
+    
+    async def collector(self):
+        """Start a manual collection every collect_interval seconds and follow it to the end."""
+        async with aiohttp.ClientSession(self.base_url) as session:
+            for number in range(sys.maxsize):
+                started = time.perf_counter()
+                job = await self.request(session, 'collect', 'POST', '/api/collect',
+                                         json={'time_slot': TIME_SLOTS[number % len(TIME_SLOTS)]})
+                job_id = job.get('job_id') if job else None
+                while job_id and job.get('status') in ('queued', 'running'):
+                    job = await self.request(session, 'collect_status', 'GET', f'/api/collect/{job_id}?wait=25')
+                    if job is None:
+                        break
+                if job and job.get('status') == 'succeeded':
+                    self.collection_times.append(time.perf_counter() - started)
+                await asyncio.sleep(max(0.0, self.collect_interval - (time.perf_counter() - started)))
+    
+    async def run(self, duration: float) -> float:
+        """Run all clients and the collector for duration seconds; returns the elapsed time."""
+        tasks = [asyncio.create_task(self.client()) for _ in range(self.clients)]
+        if self.collect_interval > 0:
+            tasks.append(asyncio.create_task(self.collector()))
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return time.perf_counter() - started
+    
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Latency, throughput and errors per endpoint and in total."""
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            stats = latency_stats(self.latencies[name])
+            stats['errors'] = self.errors[name]
+            stats['requests_per_second'] = round(len(self.latencies[name]) / elapsed, 2)
+            endpoints[name] = stats
+        # Long polls of collection jobs wait on purpose and would skew the totals
+        timed = [d for name, durations in self.latencies.items() if name != 'collect_status' for d in durations]
+        total = latency_stats(timed)
+        total['errors'] = sum(self.errors.values())
+        total['requests_per_second'] = round(len(timed) / elapsed, 2)
+        return {
+            'endpoints': endpoints,
+            'total': total,
+            'collections': latency_stats(self.collection_times),
+            'events_received': self.events_received
+        }
+
+async def run(args, db_path: str, workdir: str) -> Dict[str, Any]:
+    """Start the HA stub and the add-on process, run the load and combine both reports."""
+    stub = HAStub(latency=args.ha_latency, jitter=args.ha_latency / 2, seed=1)
+    ha_url = await stub.start()
+    context = multiprocessing.get_context('spawn')
+    ready, results, stop = context.Queue(), context.Queue(), context.Event()
+    options = {
+        'ha_url': ha_url,
+        'forecast_entities': list(stub.entities)[:2],
+        'db_path': db_path,
+        'workdir': workdir,
+        'workers': args.workers,
+        'lag_interval': args.lag_interval,
+        'log_level': args.log_level
+    }
+    server = context.Process(target=serve, args=(options, ready, stop, results), daemon=True)
+    server.start()
+    loop = asyncio.get_running_loop()
+    try:
+        port = await loop.run_in_executor(None, ready.get, True, 120)
+        test = LoadTest(f'http://127.0.0.1:{port}', args.clients, args.profile, args.interval,
+                        args.reload_interval, args.collect_interval)
+        elapsed = await test.run(args.duration)
+        stop.set()
+        server_report = await loop.run_in_executor(None, results.get, True, 60)
+    finally:
+        stop.set()
+        await loop.run_in_executor(None, server.join, 30)
+        if server.is_alive():
+            server.terminate()
+        await stub.stop()
+    
+    report = test.report(elapsed)
+    report['server'] = server_report
+    report['server']['cpu_percent'] = round(server_report['cpu_seconds'] / elapsed * 100, 1)
+    report['ha_requests'] = stub.requests
+    return report
+
+def print_report(report: Dict[str, Any]):
+    """Print the report as a table."""
+    print(f"{'endpoint':16} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(report['endpoints'].items()) + [('total', report['total'])]
+    for name, stats in rows:
+        if not stats['count']:
+            print(f"{name:16} {0:9d} {stats['errors']:7d}")
+            continue
+        print(f"{name:16} {stats['count']:9d} {stats['errors']:7d} {stats['requests_per_second']:8.2f} "
+              f"{stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['max_ms']:9.2f}")
+    collections = report['collections']
+    if collections['count']:
+        print(f"\nCollections: {collections['count']} completed, "
+              f"p50 {collections['p50_ms']:.1f} ms, p99 {collections['p99_ms']:.1f} ms")
+    lag = report['server']['event_loop_lag']
+    if lag['count']:
+        print(f"Event loop lag: p50 {lag['p50_ms']:.2f} ms, p99 {lag['p99_ms']:.2f} ms, max {lag['max_ms']:.2f} ms")
+    print(f"Server CPU: {report['server']['cpu_percent']:.1f}% of one core, "
+          f"max RSS {report['server']['max_rss_kib'] / 1024:.1f} MiB")
+
+def main():
+    """Parse arguments, run the load test and write the results."""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--database', help='database to serve, copied first (default: generate one with --years)')
+    parser.add_argument('--years', type=float, default=1, help='years of synthetic data to generate (default: 1)')
+    parser.add_argument('--clients', type=int, default=10, help='simulated dashboard tabs (default: 10)')
+    parser.add_argument('--profile', choices=['polling', 'push'], default='polling',
+                        help='polling: four endpoints every --interval; push: page load plus events (default: polling)')
+    parser.add_argument('--interval', type=float, default=30, help='polling interval in seconds (default: 30)')
+    parser.add_argument('--reload-interval', type=float, default=0,
+                        help='seconds between page reloads of push clients (default: 0, never)')
+    parser.add_argument('--collect-interval', type=float, default=10,
+                        help='seconds between manual collections (default: 10, 0 disables)')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run (default: 60)')
+    parser.add_argument('--workers', type=int, default=1, help='collection workers (default: 1)')
+    parser.add_argument('--ha-latency', type=float, default=0.05,
+                        help='latency of the Home Assistant stub in seconds (default: 0.05)')
+    parser.add_argument('--lag-interval', type=float, default=0.05,
+                        help='event loop lag sampling interval in seconds (default: 0.05)')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/load-<timestamp>.json)')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the add-on (default: WARNING)')
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='pv-load-')
+    try:
+        db_path = os.path.join(workdir, 'load.db')
+        if args.database:
+            # Collections write to the database, so never serve the original
+            shutil.copyfile(args.database, db_path)
+        else:
+            generate(db_path, args.years)
+        report = asyncio.run(run(args, db_path, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    report = {'environment': environment(), 'params': {key: value for key, value in vars(args).items()
+                                                       if key not in ('output', 'log_level')}, **report}
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results',
+                                         'load-' + datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"\nResults written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Benchmarks
+Times the data retriever, the web handlers and end-to-end collections and writes JSON results.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import aiohttp
+from aiohttp import web
+
+from ha_client import create_session
+from ha_stub import HAStub
+from pv_data_retriever import PVDataRetriever
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+from run import PVForecastAddon
+
+# (name, path, whether the response cache applies)
+HANDLER_REQUESTS = [
+    ('status', '/api/status', False),
+    ('dashboard', '/api/dashboard', True),
+    ('data', '/api/data', True),
+    ('historical_30d', '/api/historical?days=30', True),
+    ('historical_365d', '/api/historical?days=365', True),
+    ('historical_365d_lttb', '/api/historical?days=365&max_points=100', True),
+    ('historical_all', '/api/historical?days={days}', True),
+    ('metrics_365d_time_slot', '/api/metrics?from={year_ago}&group_by=time_slot', True),
+    ('export_pv_forecast', '/api/export?table=pv_forecast', False),
+    ('index', '/', False),
+    ('prometheus', '/metrics', False)
+]
+
+# Collection scenarios: HA stub settings and collection mode
+COLLECTION_SCENARIOS = [
+    ('per_entity', {'latency': 0.02}),
+    ('snapshot', {'latency': 0.02, 'extra_entities': 2000}),
+    ('per_entity_failures', {'latency': 0.02, 'failure_rate': 0.1}),
+]
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    """Statistics of a list of durations, in milliseconds."""
+    ms = sorted(d * 1000 for d in durations)
+    return {
+        'runs': len(ms),
+        'min_ms': round(ms[0], 3),
+        'median_ms': round(statistics.median(ms), 3),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'p95_ms': round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        'max_ms': round(ms[-1], 3),
+        'stdev_ms': round(statistics.stdev(ms), 3) if len(ms) > 1 else 0.0
+    }
+
+async def measure(func: Callable[[], Awaitable[Any]], repeat: int, warmup: int = 2,
+                  before: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """Run func warmup + repeat times and summarize the timed runs."""
+    durations = []
+    for index in range(warmup + repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        await func()
+        if index >= warmup:
+            durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+def benchmark_config(**options) -> Dict[str, Any]:
+    """Add-on configuration of a benchmark: the defaults with options, never the host's /data/options.json."""
+    return dict(PVForecastAddon.default_config(), **options)
+
+def database_sites(path: str) -> List[Dict[str, Any]]:
+    """'sites' option naming every site of a database, the default site first."""
+    with sqlite3.connect(path) as conn:
+        names = [name for (name,) in conn.execute(
+            "SELECT DISTINCT site FROM daily_production ORDER BY site != 'default', site")]
+    return [{'name': name} for name in names or ['default']]
+
+def database_days(path: str) -> int:
+    """Number of days from the oldest row to today."""
+    with sqlite3.connect(path) as conn:
+        first = conn.execute('SELECT MIN(date) FROM daily_production').fetchone()[0]
+    return (date.today() - date.fromisoformat(first)).days + 1 if first else 7
+
+async def bench_retriever(db_path: str, repeat: int) -> List[Dict[str, Any]]:
+    """Time the PVDataRetriever methods on one database."""
+    db = PVDatabase(db_path)
+    retriever = PVDataRetriever(db)
+    days = database_days(db_path)
+    cases = [
+        ('get_today_data', {}, retriever.get_today_data),
+        ('get_historical_data', {'days': 7}, lambda: retriever.get_historical_data(7)),
+        ('get_historical_data', {'days': 365}, lambda: retriever.get_historical_data(365)),
+        ('get_historical_data', {'days': 365, 'resolution': 'day'},
+         lambda: retriever.get_historical_data(365, 'day')),
+        ('get_historical_data', {'days': days}, lambda: retriever.get_historical_data(days)),
+        ('get_dashboard_data', {}, retriever.get_dashboard_data),
+        ('get_db_stats', {}, retriever.get_db_stats),
+        ('get_metrics', {'days': 365, 'group_by': 'month'},
+         lambda: retriever.get_metrics(date.today() - timedelta(days=364), date.today(), 'month')),
+        ('get_series_history', {'series': 'sensor.pv_power', 'days': 30},
+         lambda: retriever.get_series_history('sensor.pv_power', 30))
+    ]
+    results = []
+    try:
+        for name, params, func in cases:
+            results.append({'benchmark': f'retriever.{name}', 'params': params,
+                            'stats': await measure(func, repeat)})
+    finally:
+        db.close()
+    return results
+
+async def bench_handlers(db_path: str, repeat: int) -> List[Dict[str, Any]]:
+    """Time every web handler through HTTP, with a cleared and with a warm response cache."""
+    workdir = tempfile.mkdtemp(prefix='pv-bench-')
+    addon = PVForecastAddon(benchmark_config(static_dir=os.path.join(workdir, 'static'),
+                                             ha_url='http://127.0.0.1:9', sites=database_sites(db_path)))
+    addon.db = PVDatabase(db_path)
+    addon.retriever = PVDataRetriever(addon.db)
+    runner = web.AppRunner(addon.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base_url = f'http://127.0.0.1:{runner.addresses[0][1]}'
+    
+    values = {'days': database_days(db_path), 'year_ago': (date.today() - timedelta(days=364)).isoformat()}
+    results = []
+    try:
+        async with aiohttp.ClientSession(base_url) as session:
+            for name, path, cacheable in HANDLER_REQUESTS:
+                path = path.format(**values)
+                
+                async def request():
+                    async with session.get(path) as response:
+                        await response.read()
+                        if response.status != 200:
+                            raise RuntimeError(f'{path} returned {response.status}')
+                
+                results.append({'benchmark': f'handler.{name}', 'params': {'path': path, 'cache': 'cold'},
+                                'stats': await measure(request, repeat, before=addon.response_cache.clear)})
+                if cacheable:
+                    results.append({'benchmark': f'handler.{name}', 'params': {'path': path, 'cache': 'warm'},
+                                    'stats': await measure(request, repeat)})
+    finally:
+        await runner.cleanup()
+        addon.db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+async def bench_collection(collections: int, concurrency: int) -> List[Dict[str, Any]]:
+    """Time complete collections against the HA stub in several scenarios."""
+    results = []
+    for name, stub_options in COLLECTION_SCENARIOS:
+        stub = HAStub(seed=1, **stub_options)
+        ha_url = await stub.start()
+        workdir = tempfile.mkdtemp(prefix='pv-bench-')
+        db = PVDatabase(os.path.join(workdir, 'collect.db'))
+        session = create_session()
+        mode = 'snapshot' if name.startswith('snapshot') else 'per_entity'
+        comparison = PVForecastComparison({'ha_url': ha_url, 'collection_mode': mode,
+                                           'forecast_entities': list(stub.entities)[:2],
+                                           'production_entities': ['sensor.pv_power'],
+                                           'daily_entities': ['sensor.pv_daily_energy']},
+                                          session=session, db=db)
+        semaphore = asyncio.Semaphore(concurrency)
+        durations = []
+        
+        async def collect(slot):
+            async with semaphore:
+                start = time.perf_counter()
+                await comparison.collect_data(slot)
+                durations.append(time.perf_counter() - start)
+        
+        try:
+            started = time.perf_counter()
+            await asyncio.gather(*(collect(('4am', '11am', '3pm', '11pm')[i % 4]) for i in range(collections)))
+            elapsed = time.perf_counter() - started
+        finally:
+            await session.close()
+            await stub.stop()
+            db.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+        stats = summarize(durations)
+        stats['collections_per_second'] = round(collections / elapsed, 2)
+        stats['ha_requests'] = stub.requests
+        results.append({'benchmark': 'collection.collect_data',
+                        'params': dict(stub_options, scenario=name, mode=mode, collections=collections,
+                                       concurrency=concurrency),
+                        'stats': stats})
+    return results
+
+def environment() -> Dict[str, Any]:
+    """Description of the machine and code the results belong to."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=BENCHMARK_DIR, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+def result_key(result: Dict[str, Any]) -> str:
+    """Key matching the same benchmark across result files."""
+    return json.dumps([result['benchmark'], result.get('database'), result['params']], sort_keys=True)
+
+def compare(baseline_path: str, results: List[Dict[str, Any]]):
+    """Print the median change of every benchmark against a baseline result file."""
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+    print(f"\nMedian compared to {baseline_path}:")
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old is None:
+            continue
+        before, after = old['stats']['median_ms'], result['stats']['median_ms']
+        change = (after - before) / before * 100 if before else 0.0
+        label = f"{result['benchmark']} {result.get('database') or ''} {json.dumps(result['params'])}"
+        print(f"  {label}: {before:.3f} -> {after:.3f} ms ({change:+.1f}%)")
+
+async def run(args) -> Dict[str, Any]:
+    """Run the selected benchmark groups."""
+    results = []
+    for db_path in args.databases:
+        database = os.path.basename(db_path)
+        # Work on a copy so the handlers' writes never change the generated file
+        workdir = tempfile.mkdtemp(prefix='pv-bench-')
+        copy = os.path.join(workdir, database)
+        shutil.copyfile(db_path, copy)
+        try:
+            if 'retriever' in args.groups:
+                group = await bench_retriever(copy, args.repeat)
+                results.extend(dict(result, database=database) for result in group)
+            if 'handlers' in args.groups:
+                group = await bench_handlers(copy, args.repeat)
+                results.extend(dict(result, database=database) for result in group)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{database}: done")
+    if 'collection' in args.groups:
+        results.extend(await bench_collection(args.collections, args.concurrency))
+    return {'environment': environment(), 'results': results}
+
+def main():
+    """Parse arguments, run the benchmarks and write the results."""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('databases', nargs='*',
+                        help='databases to benchmark (default: all in benchmarks/data)')
+    parser.add_argument('--groups', nargs='+', default=['retriever', 'handlers', 'collection'],
+                        choices=['retriever', 'handlers', 'collection'])
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per benchmark (default: 20)')
+    parser.add_argument('--collections', type=int, default=200, help='collections per scenario (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel collections (default: 4)')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='print the change against an earlier result file')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the add-on (default: WARNING)')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    if not args.databases and set(args.groups) - {'collection'}:
+        args.databases = sorted(glob.glob(os.path.join(BENCHMARK_DIR, 'data', '*.db')))
+        if not args.databases:
+            parser.error('no databases found; create them with benchmarks/generate_db.py')
+    
+    report = asyncio.run(run(args))
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results',
+                                         datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    for result in report['results']:
+        stats = result['stats']
+        print(f"{result['benchmark']:32} {result.get('database') or '':24} {json.dumps(result['params']):60} "
+              f"median {stats['median_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms")
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(args.compare, report['results'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Collection Job Queue
+Runs data collections in background workers and merges duplicate requests.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CollectionJob:
+    """A single queued or running collection for one time slot."""
+    
+    def __init__(self, time_slot: str):
+        """Initialize a queued job."""
+        self.id = uuid.uuid4().hex[:12]
+        self.time_slot = time_slot
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._done = asyncio.Event()
+    
+    @property
+    def finished(self) -> bool:
+        """Whether the job has completed (successfully or not)."""
+        return self._done.is_set()
+    
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the job to finish; returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for the API."""
+        return {
+            'job_id': self.id,
+            'time_slot': self.time_slot,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class CollectionQueue:
+    """Queue of collection jobs processed by background workers.
+    
+    Requests for a time slot that already has a queued or running job are
+    merged into that job instead of starting another collection.
+    """
+    
+    def __init__(self, collect: Callable[[str], Awaitable[bool]],
+                 workers: int = 1, history_size: int = 100):
+        """Initialize the queue with the coroutine function that runs a collection."""
+        self.collect = collect
+        self.worker_count = max(1, workers)
+        self.history_size = history_size
+        self.jobs: 'OrderedDict[str, CollectionJob]' = OrderedDict()
+        self._in_flight: Dict[str, CollectionJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+    
+    async def start(self):
+        """Start the worker tasks."""
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        logger.info(f"Collection queue started with {self.worker_count} worker(s)")
+    
+    async def stop(self):
+        """Stop the worker tasks."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+    
+    def submit(self, time_slot: str) -> Tuple[CollectionJob, bool]:
+        """Queue a collection, returning (job, created).
+        
+        If a job for the slot is already queued or running it is returned
+        with created=False.
+        """
+        job = self._in_flight.get(time_slot)
+        if job is not None:
+            logger.info(f"Collection for {time_slot} already in progress as job {job.id}")
+            return job, False
+        
+        job = CollectionJob(time_slot)
+        self._in_flight[time_slot] = job
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history_size:
+            oldest_id = next(iter(self.jobs))
+            if not self.jobs[oldest_id].finished:
+                break
+            del self.jobs[oldest_id]
+        self._queue.put_nowait(job)
+        return job, True
+    
+    def get(self, job_id: str) -> Optional[CollectionJob]:
+        """Look up a job by id."""
+        return self.jobs.get(job_id)
+    
+    async def _worker(self):
+        """Process jobs from the queue until cancelled."""
+        while True:
+            job = await self._queue.get()
+            job.status = 'running'
+            job.started_at = datetime.now()
+            try:
+                success = await self.collect(job.time_slot)
+                job.status = 'succeeded' if success else 'failed'
+                if not success:
+                    job.error = 'Collection did not complete, see log for details'
+            except asyncio.CancelledError:
+                job.status = 'failed'
+                job.error = 'Cancelled'
+                raise
+            except Exception as e:
+                logger.error(f"Error in collection job {job.id} for {job.time_slot}: {e}")
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.now()
+                self._in_flight.pop(job.time_slot, None)
+                job._done.set()
+                self._queue.task_done()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Data Export
+Queries and serializers for streaming table exports as CSV or NDJSON.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from typing import Any, List, Optional, Sequence, Tuple
+
+from rollups import ROLLUP_TABLE_BY_RESOLUTION, bucket_range
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+ROLLUP_COLUMNS = ('series', 'bucket', 'value_sum', 'value_min', 'value_max', 'value_count',
+                  'forecast_sum', 'actual_sum', 'error_sum', 'abs_error_sum', 'sq_error_sum',
+                  'error_count')
+
+# Exported columns, the column the from/to range applies to, and the row order.
+# Every order follows the primary key or a unique index, so SQLite never sorts.
+EXPORT_TABLES = {
+    'pv_forecast': (('site', 'date', 'time_slot', 'forecast_wh', 'actual_wh', 'provider', 'timestamp'),
+                    'date', 'site, date, time_slot'),
+    'daily_production': (('site', 'date', 'total_forecast_wh', 'total_actual_wh', 'provider', 'timestamp'),
+                         'date', 'site, date'),
+    'pv_samples': (('entity_id', 'ts', 'value'), 'ts', 'entity_id, ts'),
+    'rollup_hourly': (ROLLUP_COLUMNS, 'bucket', 'series, bucket'),
+    'rollup_daily': (ROLLUP_COLUMNS, 'bucket', 'series, bucket'),
+    'rollup_monthly': (ROLLUP_COLUMNS, 'bucket', 'series, bucket')
+}
+
+# Tables with a site column, which the export can be limited to
+SITE_TABLES = ('pv_forecast', 'daily_production')
+
+RESOLUTION_BY_ROLLUP_TABLE = {table: resolution for resolution, table in ROLLUP_TABLE_BY_RESOLUTION.items()}
+
+def _range_bounds(table: str, start: date, end: date) -> Tuple[Any, Any]:
+    """Inclusive bounds of the range column for a local date range."""
+    range_column = EXPORT_TABLES[table][1]
+    if range_column == 'ts':
+        # Samples are stored as Unix seconds; cover the end date completely
+        first = datetime.combine(start, time.min).timestamp()
+        last = datetime.combine(end + timedelta(days=1), time.min).timestamp() - 1e-6
+        return first, last
+    if range_column == 'bucket':
+        return bucket_range(start, end, RESOLUTION_BY_ROLLUP_TABLE[table])
+    return start.isoformat(), end.isoformat()
+
+def export_query(table: str, start: Optional[date] = None, end: Optional[date] = None,
+                 site: Optional[str] = None) -> Tuple[List[str], str, list]:
+    """Build the columns, SQL and parameters exporting a table, optionally limited to a date range and site."""
+    columns, range_column, order = EXPORT_TABLES[table]
+    conditions, params = [], []
+    if site is not None and table in SITE_TABLES:
+        conditions.append('site = ?')
+        params.append(site)
+    if start is not None or end is not None:
+        # An open side borrows the other date; only the given bounds are used
+        first, last = _range_bounds(table, start or end, end or start)
+        if start is not None:
+            conditions.append(f'{range_column} >= ?')
+            params.append(first)
+        if end is not None:
+            conditions.append(f'{range_column} <= ?')
+            params.append(last)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    sql = f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY {order}"
+    return list(columns), sql, params
+
+class ExportWriter:
+    """Serializes chunks of rows, optionally gzip-compressing on the fly."""
+    
+    def __init__(self, columns: Sequence[str], fmt: str = 'csv', compress: bool = False):
+        """Initialize the writer for a column list and format."""
+        self.columns = list(columns)
+        self.fmt = fmt
+        # wbits=31 produces a complete gzip stream (header and trailer)
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    
+    @property
+    def content_type(self) -> str:
+        """Content type of the produced body."""
+        return 'application/gzip' if self._compressor else FORMATS[self.fmt]
+    
+    def filename(self, table: str) -> str:
+        """Download file name for a table."""
+        name = f'{table}.{self.fmt}'
+        return name + '.gz' if self._compressor else name
+    
+    def _encode(self, text: str) -> bytes:
+        """Encode text and pass it through the compressor, if any."""
+        data = text.encode('utf-8')
+        return self._compressor.compress(data) if self._compressor else data
+    
+    def header(self) -> bytes:
+        """Bytes to send before the first row."""
+        if self.fmt == 'csv':
+            return self._encode(self._csv([self.columns]))
+        return b''
+    
+    def rows(self, rows: List[tuple]) -> bytes:
+        """Serialize one chunk of rows."""
+        if self.fmt == 'csv':
+            return self._encode(self._csv(rows))
+        return self._encode(''.join(json.dumps(dict(zip(self.columns, row))) + '\n' for row in rows))
+    
+    def finish(self) -> bytes:
+        """Bytes to send after the last row."""
+        return self._compressor.flush() if self._compressor else b''
+    
+    @staticmethod
+    def _csv(rows: List[Sequence[Any]]) -> str:
+        """Format rows as CSV lines."""
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+PV Database Statistics
+Row counts and last write times maintained by the write path, and table sizes measured in the background.
+"""
+
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from pv_database import PVDatabase
+
+logger = logging.getLogger(__name__)
+
+# Tables tracked in db_stats and the expression giving the write time of an existing row
+STATS_TABLES = {
+    'pv_forecast': 'MAX(timestamp)',
+    'daily_production': 'MAX(timestamp)',
+    'pv_samples': "datetime(MAX(ts), 'unixepoch')"
+}
+
+def create_stats_table(conn: sqlite3.Connection):
+    """Create the db_stats table and the triggers that keep it current.
+    
+    Counts are seeded once from the existing rows; afterwards every insert,
+    update and delete adjusts them, so reading the statistics never scans
+    the data tables.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS db_stats (
+            table_name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            last_write DATETIME,
+            size_bytes INTEGER,
+            size_updated DATETIME
+        )
+    ''')
+    for table, last_write in STATS_TABLES.items():
+        conn.execute(f'''
+            INSERT OR IGNORE INTO db_stats (table_name, row_count, last_write)
+            SELECT ?, COUNT(*), {last_write} FROM {table}
+        ''', (table,))
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table}
+            BEGIN
+                UPDATE db_stats SET row_count = row_count + 1, last_write = CURRENT_TIMESTAMP
+                WHERE table_name = '{table}';
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_update AFTER UPDATE ON {table}
+            BEGIN
+                UPDATE db_stats SET last_write = CURRENT_TIMESTAMP
+                WHERE table_name = '{table}';
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE db_stats SET row_count = row_count - 1, last_write = CURRENT_TIMESTAMP
+                WHERE table_name = '{table}';
+            END
+        ''')
+
+def drop_stats_triggers(conn: sqlite3.Connection, table: str):
+    """Drop the triggers of a tracked table before it is rebuilt; create_stats_table restores them."""
+    for event in ('insert', 'update', 'delete'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {table}_stats_{event}')
+
+def table_sizes_stale(conn: sqlite3.Connection, max_age_minutes: int = 60) -> bool:
+    """Whether any table size is missing or older than max_age_minutes."""
+    return bool(conn.execute('''
+        SELECT COUNT(*) FROM db_stats
+        WHERE size_updated IS NULL OR size_updated < datetime('now', ?)
+    ''', (f'-{max_age_minutes} minutes',)).fetchone()[0])
+
+def measure_table_sizes(conn: sqlite3.Connection) -> Optional[List[Tuple[str, int]]]:
+    """(table, bytes) of the tracked tables, or None if the dbstat virtual table is unavailable.
+    
+    dbstat walks every page of the database, so run this on a read-only
+    connection: the walk then never holds the writer.
+    """
+    try:
+        return conn.execute(f'''
+            SELECT name, SUM(pgsize) FROM dbstat
+            WHERE name IN ({', '.join('?' for _ in STATS_TABLES)})
+            GROUP BY name
+        ''', tuple(STATS_TABLES)).fetchall()
+    except sqlite3.OperationalError as e:
+        logger.debug(f"Table sizes unavailable: {e}")
+        return None
+
+def store_table_sizes(conn: sqlite3.Connection, sizes: Optional[List[Tuple[str, int]]]):
+    """Store measured sizes; None only marks them as checked."""
+    conn.execute("UPDATE db_stats SET size_updated = CURRENT_TIMESTAMP")
+    conn.executemany('UPDATE db_stats SET size_bytes = ? WHERE table_name = ?',
+                     [(size, name) for name, size in sizes or ()])
+
+def refresh_table_sizes(conn: sqlite3.Connection, max_age_minutes: int = 60) -> bool:
+    """Update the per-table sizes on one connection if they are older than max_age_minutes.
+    
+    For offline use such as generating databases; the add-on measures on a
+    reader with update_table_sizes. Returns False if the refresh was skipped
+    or unavailable.
+    """
+    if not table_sizes_stale(conn, max_age_minutes):
+        return False
+    sizes = measure_table_sizes(conn)
+    store_table_sizes(conn, sizes)
+    return sizes is not None
+
+async def update_table_sizes(db: PVDatabase, max_age_minutes: int = 60) -> bool:
+    """Refresh stale table sizes, walking the pages on a reader so the writer only runs the UPDATE.
+    
+    Returns False if the refresh was skipped or unavailable.
+    """
+    if not await db.read(table_sizes_stale, max_age_minutes):
+        return False
+    sizes = await db.read(measure_table_sizes)
+    await db.write(store_table_sizes, sizes)
+    return sizes is not None
+
+def read_stats(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """Read the maintained statistics, keyed by table name."""
+    cursor = conn.execute('SELECT table_name, row_count, last_write, size_bytes FROM db_stats')
+    return {
+        table: {'row_count': row_count, 'last_write': last_write, 'size_bytes': size_bytes}
+        for table, row_count, last_write, size_bytes in cursor
+    }
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Downsampling
+Largest-Triangle-Three-Buckets (LTTB) reduction of chart series.
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+def lttb_indices(values: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points LTTB keeps from equally spaced values.
+    
+    values has one row per point and one column per series; the triangle
+    areas of all series are added, so the kept points preserve the shape of
+    every series and the series stay aligned. The first and last points are
+    always kept.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    count = len(values)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+    
+    x = np.arange(count, dtype=float)
+    # Bucket edges for the points between the fixed first and last point
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = count - 1
+    
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The third triangle corner is the average of the next bucket
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = values[next_start:next_end].mean(axis=0)
+        else:
+            next_x, next_y = x[-1], values[-1]
+        
+        # Twice the triangle area for every candidate, summed over the series
+        areas = np.abs(
+            (x[previous] - next_x) * (values[start:end] - values[previous])
+            - (x[previous] - x[start:end, None]) * (next_y - values[previous])
+        ).sum(axis=1)
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def downsample_series(data: Dict[str, List], keys: Sequence[str], max_points: int,
+                      label_key: str = 'dates') -> Dict[str, List]:
+    """Reduce aligned chart series to at most max_points with LTTB.
+    
+    keys name the numeric series that drive the selection; the label
+    series and those series are thinned with the same indices. Missing
+    values count as 0 for the selection only.
+    """
+    labels = data.get(label_key, [])
+    if not max_points or len(labels) <= max_points:
+        return data
+    columns = np.column_stack([
+        np.array([0 if v is None else v for v in data[key]], dtype=float) for key in keys
+    ])
+    indices = lttb_indices(columns, max_points)
+    result = dict(data)
+    for key in (label_key,) + tuple(keys):
+        series = data[key]
+        result[key] = [series[i] for i in indices]
+    return result
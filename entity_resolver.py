@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Entity Resolver
+Discovers energy and power sensors and remembers which entities of each fallback chain work.
+"""
+
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+ENERGY_UNITS = ('Wh', 'kWh', 'MWh')
+POWER_UNITS = ('W', 'kW', 'MW')
+
+# Words in an entity id or friendly name that mark forecasts and PV systems
+FORECAST_WORDS = frozenset(('forecast', 'estimated', 'prediction', 'predicted', 'solcast'))
+PV_WORDS = frozenset(('pv', 'solar', 'photovoltaic', 'inverter'))
+
+# Per chain: the kind of sensor, the unit stored without conversion and whether it is a forecast
+CHAIN_KINDS = {
+    'forecast': ('energy', 'Wh', True),
+    'production': ('power', 'W', False),
+    'daily': ('energy', 'Wh', False)
+}
+
+def classify(state_obj: Dict[str, Any]) -> Optional[str]:
+    """'energy' or 'power' for a sensor by device class or unit of measurement, else None."""
+    attributes = state_obj.get('attributes') or {}
+    device_class = attributes.get('device_class')
+    unit = attributes.get('unit_of_measurement')
+    if device_class == 'energy' or unit in ENERGY_UNITS:
+        return 'energy'
+    if device_class == 'power' or unit in POWER_UNITS:
+        return 'power'
+    return None
+
+def _words(candidate: Dict[str, Any]) -> set:
+    """Lower-case words of a candidate's entity id and name."""
+    return set(re.split(r'[^a-z0-9]+', f"{candidate['entity_id']} {candidate['name']}".lower()))
+
+class EntityResolver:
+    """Decides which entities of a fallback chain to request, and in which order.
+    
+    Entities that do not exist or are unavailable are remembered as missing
+    for ttl seconds and skipped. The entity of a chain that last had a
+    value is tried first, so a chain normally takes one request; only an
+    entity ahead of it whose missing entry expired is checked again first,
+    which lets the chain return to a preferred entity once it appears.
+    """
+    
+    def __init__(self, ttl: float = 3600, clock: Callable[[], float] = time.monotonic):
+        """Initialize an empty resolver."""
+        self.ttl = ttl
+        self.clock = clock
+        self.discovered = False
+        # Energy and power sensors found by discover()
+        self.candidates: List[Dict[str, Any]] = []
+        # Entity id -> time its missing entry expires; kept after expiry until it is checked again
+        self._missing: Dict[str, float] = {}
+        self._last_success: Dict[Tuple[str, ...], str] = {}
+    
+    def is_missing(self, entity_id: str) -> bool:
+        """Whether the entity is known to be missing or unavailable."""
+        expires = self._missing.get(entity_id)
+        return expires is not None and expires > self.clock()
+    
+    def mark_missing(self, entity_id: str):
+        """Remember that the entity does not exist or has no usable state."""
+        self._missing[entity_id] = self.clock() + self.ttl
+    
+    def record_success(self, chain: List[str], entity_id: str):
+        """Remember the entity that supplied the chain's value."""
+        self._last_success[tuple(chain)] = entity_id
+        self._missing.pop(entity_id, None)
+    
+    def viable(self, entities: Iterable[str]) -> List[str]:
+        """The entities not known to be missing, in order."""
+        return [entity for entity in entities if not self.is_missing(entity)]
+    
+    def order(self, chain: List[str]) -> List[str]:
+        """The chain's entities to request, in the order to try them."""
+        candidates = self.viable(chain)
+        last = self._last_success.get(tuple(chain))
+        if last not in candidates:
+            return candidates
+        position = chain.index(last)
+        recheck = [entity for entity in candidates if chain.index(entity) < position and entity in self._missing]
+        rest = [entity for entity in candidates if entity != last and entity not in recheck]
+        return recheck + [last] + rest
+    
+    def discover(self, states: Iterable[Dict[str, Any]], configured: Iterable[str]):
+        """Index the energy and power sensors of a state list and check the configured entities.
+        
+        states must contain every configured entity that exists; those that
+        are absent or unavailable are marked missing.
+        """
+        found = {}
+        candidates = []
+        for state_obj in states:
+            entity_id = state_obj.get('entity_id')
+            found[entity_id] = state_obj
+            kind = classify(state_obj)
+            if kind is None:
+                continue
+            attributes = state_obj.get('attributes') or {}
+            candidates.append({
+                'entity_id': entity_id,
+                'name': attributes.get('friendly_name', ''),
+                'kind': kind,
+                'device_class': attributes.get('device_class'),
+                'unit': attributes.get('unit_of_measurement'),
+                'state': state_obj.get('state')
+            })
+        for entity_id in configured:
+            state_obj = found.get(entity_id)
+            if state_obj is None or state_obj.get('state') in ('unavailable', 'unknown'):
+                self.mark_missing(entity_id)
+        self.candidates = sorted(candidates, key=lambda candidate: candidate['entity_id'])
+        self.discovered = True
+    
+    def candidates_for(self, chain: str) -> List[str]:
+        """Discovered entities that fit a chain ('forecast', 'production' or 'daily').
+        
+        Only sensors in the unit the chain stores qualify, as values are not
+        converted; their id or name must name a PV system or, for the
+        forecast chain, a forecast.
+        """
+        kind, unit, forecast = CHAIN_KINDS[chain]
+        matches = []
+        for candidate in self.candidates:
+            words = _words(candidate)
+            if candidate['kind'] != kind or candidate['unit'] != unit:
+                continue
+            if candidate['state'] in ('unavailable', 'unknown') or self.is_missing(candidate['entity_id']):
+                continue
+            if forecast and words & FORECAST_WORDS:
+                matches.append(candidate['entity_id'])
+            elif not forecast and words & PV_WORDS and not words & FORECAST_WORDS:
+                matches.append(candidate['entity_id'])
+        return matches
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Resolver state for the API."""
+        return {
+            'discovered': self.discovered,
+            'candidates': self.candidates,
+            'missing': sorted(entity for entity in self._missing if self.is_missing(entity)),
+            'last_success': [{'chain': list(chain), 'entity_id': entity}
+                             for chain, entity in self._last_success.items()]
+        }
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Event Stream
+Server-sent events channel that pushes data changes to open dashboards.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Set
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+class EventBroadcaster:
+    """Fans out change events to all connected SSE clients.
+    
+    Nothing is sent while nothing is written; an idle client only receives
+    a comment line every keepalive seconds so dead connections are noticed.
+    """
+    
+    def __init__(self, queue_size: int = 100, keepalive: float = 60):
+        """Initialize the broadcaster."""
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self._subscribers: Set[asyncio.Queue] = set()
+    
+    @property
+    def client_count(self) -> int:
+        """Number of connected clients."""
+        return len(self._subscribers)
+    
+    def publish(self, event: str, data: Dict[str, Any]):
+        """Queue an event for every connected client."""
+        if not self._subscribers:
+            return
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # The client is not keeping up; drop it and let EventSource reconnect
+                logger.warning("Dropping slow event stream client")
+                self._subscribers.discard(queue)
+    
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """Serve the event stream to one client."""
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        await response.prepare(request)
+        
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            await response.write(b"retry: 5000\n\n")
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if queue not in self._subscribers:
+                    break
+                await response.write(message)
+        except ConnectionResetError:
+            pass
+        finally:
+            self._subscribers.discard(queue)
+        return response
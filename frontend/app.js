@@ -0,0 +1,351 @@
+const timeSlots = ['4am', '11am', '3pm', '11pm'];
+let todayChart, dailyChart;
+let todayData = {};
+// Site shown on the page; null until the dashboard names the default site
+let currentSite = null;
+// Day shown as today (the server's date of the last dashboard load)
+let loadedDate = null;
+let siteCount = 1;
+
+async function collectData(timeSlot) {
+    const button = document.getElementById(`btn-${timeSlot}`);
+    button.disabled = true;
+    button.textContent = 'Collecting...';
+
+    try {
+        const response = await fetch('/api/collect', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({time_slot: timeSlot})
+        });
+        let job = await response.json();
+
+        if (!job.success) {
+            showNotification('❌ ' + job.error, 'error');
+            return;
+        }
+
+        // Long-poll the job until the collection has finished
+        while (job.status === 'queued' || job.status === 'running') {
+            const statusResponse = await fetch(`/api/collect/${job.job_id}?wait=25`);
+            job = await statusResponse.json();
+        }
+
+        // New values arrive through the event stream
+        if (job.status === 'succeeded') {
+            showNotification(`✅ Data collected for ${timeSlot}`, 'success');
+        } else {
+            showNotification('❌ ' + (job.error || 'Collection failed'), 'error');
+        }
+    } catch (error) {
+        showNotification('❌ Error: ' + error.message, 'error');
+    } finally {
+        button.disabled = false;
+        button.textContent = `Collect ${timeSlot.toUpperCase()} Data`;
+    }
+}
+
+function showNotification(message, type) {
+    const notification = document.createElement('div');
+    notification.className = `status ${type}`;
+    notification.textContent = message;
+    notification.style.position = 'fixed';
+    notification.style.top = '20px';
+    notification.style.right = '20px';
+    notification.style.zIndex = '1000';
+    document.body.appendChild(notification);
+
+    setTimeout(() => {
+        notification.remove();
+    }, 3000);
+}
+
+function updateStatus(status) {
+    // Record count and last update cover every site, not just the one shown
+    const scope = status.scope === 'all_sites' && siteCount > 1 ? ' (all sites)' : '';
+    document.getElementById('status').innerHTML = 
+            `<div class="status ${status.online ? 'success' : 'error'}">
+                <strong>Status:</strong> ${status.online ? '🟢 Online' : '🔴 Offline'}<br>
+                <strong>Last Update${scope}:</strong> ${status.last_update}<br>
+                <strong>Database Records${scope}:</strong> ${status.db_records}
+            </div>`;
+}
+
+function showStatusError() {
+    document.getElementById('status').innerHTML = 
+        '<div class="status error">❌ Error loading status</div>';
+}
+
+async function loadStatus() {
+    try {
+        const response = await fetch('/api/status');
+        updateStatus(await response.json());
+    } catch (error) {
+        showStatusError();
+    }
+}
+
+// Everything the page shows comes from one request
+async function loadDashboard() {
+    try {
+        const site = currentSite ? `&site=${encodeURIComponent(currentSite)}` : '';
+        const response = await fetch(`/api/dashboard?days=7${site}`);
+        const dashboard = await response.json();
+        currentSite = dashboard.site;
+        loadedDate = dashboard.historical.dates[dashboard.historical.dates.length - 1];
+        todayData = dashboard.today;
+        updateStatus(dashboard.status);
+        updateDataGrid(todayData);
+        updateTodayChart(todayData);
+        updateDailyChart(dashboard.historical);
+    } catch (error) {
+        console.error('Error loading dashboard:', error);
+        showStatusError();
+    }
+}
+
+// The site picker is only shown when more than one site is configured
+async function loadSites() {
+    try {
+        const response = await fetch('/api/sites');
+        const sites = (await response.json()).sites;
+        siteCount = sites.length;
+        if (sites.length < 2) {
+            return;
+        }
+        loadStatus();
+        const select = document.getElementById('siteSelect');
+        select.innerHTML = sites.map(site => `<option value="${site.name}">${site.name}</option>`).join('');
+        select.value = currentSite || sites[0].name;
+        select.hidden = false;
+    } catch (error) {
+        console.error('Error loading sites:', error);
+    }
+}
+
+function selectSite(site) {
+    currentSite = site;
+    loadDashboard();
+}
+
+function updateDataGrid(data) {
+    const grid = document.getElementById('dataGrid');
+
+    let html = '';
+    timeSlots.forEach(slot => {
+        const slotData = data[slot] || { forecast: 0, actual: 0 };
+        const forecast = slotData.forecast || 0;
+        const actual = slotData.actual || 0;
+        const accuracy = forecast > 0 ? ((actual / forecast) * 100).toFixed(1) : 0;
+
+        html += `
+            <div class="data-item">
+                <div class="data-label">${slot.toUpperCase()}</div>
+                <div class="data-value">${forecast.toFixed(1)} Wh</div>
+                <div class="data-label">Forecast</div>
+                <div class="data-value">${actual.toFixed(1)} Wh</div>
+                <div class="data-label">Actual</div>
+                <div class="accuracy ${accuracy > 90 ? 'good' : accuracy > 70 ? 'warning' : 'poor'}">
+                    ${accuracy}% Accuracy
+                </div>
+            </div>
+        `;
+    });
+
+    // Add daily totals
+    const dailyData = data.daily || { forecast: 0, actual: 0 };
+    const dailyForecast = dailyData.forecast || 0;
+    const dailyActual = dailyData.actual || 0;
+    const dailyAccuracy = dailyForecast > 0 ? ((dailyActual / dailyForecast) * 100).toFixed(1) : 0;
+
+    html += `
+        <div class="data-item">
+            <div class="data-label">DAILY TOTAL</div>
+            <div class="data-value">${dailyForecast.toFixed(1)} Wh</div>
+            <div class="data-label">Forecast</div>
+            <div class="data-value">${dailyActual.toFixed(1)} Wh</div>
+            <div class="data-label">Actual</div>
+            <div class="accuracy ${dailyAccuracy > 90 ? 'good' : dailyAccuracy > 70 ? 'warning' : 'poor'}">
+                ${dailyAccuracy}% Accuracy
+            </div>
+        </div>
+    `;
+
+    grid.innerHTML = html;
+}
+
+function chartOptions(title) {
+    return {
+        responsive: true,
+        maintainAspectRatio: false,
+        scales: {
+            y: {
+                beginAtZero: true,
+                title: {
+                    display: true,
+                    text: 'Energy (Wh)'
+                }
+            }
+        },
+        plugins: {
+            title: {
+                display: true,
+                text: title
+            }
+        }
+    };
+}
+
+function updateTodayChart(data) {
+    const forecastData = timeSlots.map(slot => data[slot]?.forecast || 0);
+    const actualData = timeSlots.map(slot => data[slot]?.actual || 0);
+
+    // Patch the datasets in place once the chart exists
+    if (todayChart) {
+        todayChart.data.datasets[0].data = forecastData;
+        todayChart.data.datasets[1].data = actualData;
+        todayChart.update('none');
+        return;
+    }
+
+    const ctx = document.getElementById('todayChart').getContext('2d');
+    todayChart = new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: timeSlots.map(slot => slot.toUpperCase()),
+            datasets: [{
+                label: 'Forecast (Wh)',
+                data: forecastData,
+                backgroundColor: 'rgba(54, 162, 235, 0.6)',
+                borderColor: 'rgba(54, 162, 235, 1)',
+                borderWidth: 1
+            }, {
+                label: 'Actual (Wh)',
+                data: actualData,
+                backgroundColor: 'rgba(75, 192, 192, 0.6)',
+                borderColor: 'rgba(75, 192, 192, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: chartOptions('Today\'s Forecast vs Actual')
+    });
+}
+
+function updateDailyChart(data) {
+    if (dailyChart) {
+        dailyChart.data.labels = data.dates || [];
+        dailyChart.data.datasets[0].data = data.forecast || [];
+        dailyChart.data.datasets[1].data = data.actual || [];
+        dailyChart.update('none');
+        return;
+    }
+
+    const ctx = document.getElementById('dailyChart').getContext('2d');
+    dailyChart = new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: data.dates || [],
+            datasets: [{
+                label: 'Daily Forecast (Wh)',
+                data: data.forecast || [],
+                borderColor: 'rgba(54, 162, 235, 1)',
+                backgroundColor: 'rgba(54, 162, 235, 0.1)',
+                tension: 0.1
+            }, {
+                label: 'Daily Actual (Wh)',
+                data: data.actual || [],
+                borderColor: 'rgba(75, 192, 192, 1)',
+                backgroundColor: 'rgba(75, 192, 192, 0.1)',
+                tension: 0.1
+            }]
+        },
+        options: chartOptions('7-Day Historical Comparison')
+    });
+}
+
+function localDate() {
+    const now = new Date();
+    return `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, '0')}-${String(now.getDate()).padStart(2, '0')}`;
+}
+
+function isToday(dateStr) {
+    return dateStr === loadedDate;
+}
+
+// A change for a later day means the page is showing yesterday: reload everything
+function isNewDay(dateStr) {
+    return loadedDate !== null && dateStr > loadedDate;
+}
+
+// Nothing may be pushed around midnight, so also reload when the local date changes
+function watchDateChange() {
+    let shownDate = localDate();
+    setInterval(() => {
+        const today = localDate();
+        if (today !== shownDate) {
+            shownDate = today;
+            loadDashboard();
+        }
+    }, 60000);
+}
+
+// Apply pushed changes instead of polling
+function connectEvents() {
+    const events = new EventSource('/api/events');
+    let connectedBefore = false;
+
+    events.onopen = () => {
+        // Anything may have changed while disconnected
+        if (connectedBefore) {
+            loadDashboard();
+        }
+        connectedBefore = true;
+    };
+
+    events.addEventListener('slot', event => {
+        const change = JSON.parse(event.data);
+        if (change.site !== currentSite) {
+            return;
+        }
+        if (isNewDay(change.date)) {
+            loadDashboard();
+            return;
+        }
+        if (isToday(change.date)) {
+            todayData[change.time_slot] = {forecast: change.forecast, actual: change.actual};
+            updateDataGrid(todayData);
+            updateTodayChart(todayData);
+        }
+        loadStatus();
+    });
+
+    events.addEventListener('daily', event => {
+        const change = JSON.parse(event.data);
+        if (change.site !== currentSite) {
+            return;
+        }
+        if (isNewDay(change.date)) {
+            loadDashboard();
+            return;
+        }
+        if (isToday(change.date)) {
+            todayData.daily = {forecast: change.forecast, actual: change.actual};
+            updateDataGrid(todayData);
+        }
+        if (dailyChart) {
+            const index = dailyChart.data.labels.indexOf(change.date);
+            if (index >= 0) {
+                dailyChart.data.datasets[0].data[index] = change.forecast;
+                dailyChart.data.datasets[1].data[index] = change.actual;
+                dailyChart.update('none');
+            }
+        }
+        loadStatus();
+    });
+}
+
+// Load initial data
+loadDashboard();
+loadSites();
+connectEvents();
+watchDateChange();
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Home Assistant Client
+Async client for the Home Assistant REST API built on a shared aiohttp session.
+"""
+
+import asyncio
+import codecs
+import json
+import logging
+import time
+import aiohttp
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, List, AsyncIterator, Awaitable, Callable, Tuple
+
+import resilience
+import tracing
+from resilience import AdaptiveTimeout, Backoff, CircuitBreaker
+from telemetry import HA_REQUEST_SECONDS, HA_RESILIENCE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limited, or Home Assistant / Supervisor temporarily failing
+TRANSIENT_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+class HAClient:
+    """Async Home Assistant REST client with bounded request concurrency.
+    
+    Every request goes through a circuit breaker, gets a timeout adapted
+    to its endpoint's observed latency and capped by the deadline of the
+    current collection, and is retried with jittered backoff after
+    transient failures (timeouts, connection errors, 429 and 5xx).
+    """
+    
+    def __init__(self, ha_url: str, ha_token: str,
+                 session: Optional[aiohttp.ClientSession] = None,
+                 max_concurrency: int = 4, timeout: float = 10, min_timeout: float = 1,
+                 retries: int = 2, backoff: float = 0.5, failure_threshold: int = 5,
+                 reset_timeout: float = 60):
+        """Initialize the client.
+        
+        If no session is given, one keep-alive session is created lazily and
+        owned (and closed) by this client. timeout is the timeout of a first
+        request to an endpoint and the upper bound of adapted timeouts.
+        """
+        self.ha_url = ha_url.rstrip('/')
+        self.ha_token = ha_token
+        self.session = session
+        self._owns_session = session is None
+        self.timeouts = AdaptiveTimeout(timeout, min(min_timeout, timeout))
+        self.retries = max(0, retries)
+        self.backoff = Backoff(backoff)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # Slow or failing history requests of a backfill must not reject live collections
+        self.history_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Authorization headers for Home Assistant API requests."""
+        return {
+            'Authorization': f'Bearer {self.ha_token}',
+            'Content-Type': 'application/json'
+        }
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating an owned one if needed."""
+        if self.session is None or self.session.closed:
+            self.session = create_session()
+            self._owns_session = True
+        return self.session
+    
+    async def close(self):
+        """Close the session if this client created it."""
+        if self._owns_session and self.session is not None and not self.session.closed:
+            await self.session.close()
+    
+    def status(self) -> Dict[str, Any]:
+        """Circuit breaker state and adapted timeouts for the status API."""
+        return {'circuit': self.breaker.to_dict(), 'history_circuit': self.history_breaker.to_dict(),
+                'timeouts': self.timeouts.to_dict()}
+    
+    @staticmethod
+    def parse_state(state_obj: Optional[Dict[str, Any]], entity_id: str) -> Optional[float]:
+        """Convert a Home Assistant state object to a float, or None."""
+        if not state_obj:
+            return None
+        state = state_obj.get('state')
+        if state and state != 'unavailable' and state != 'unknown':
+            try:
+                return float(state)
+            except (ValueError, TypeError):
+                logger.warning(f"Could not convert state '{state}' to float for {entity_id}")
+        return None
+    
+    async def _request(self, call: str, url: str, read: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+                       description: str, entity: str = '', params: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None, not_found: Any = None,
+                       breaker: Optional[CircuitBreaker] = None, span=tracing.NULL_SPAN) -> Any:
+        """GET url and return read(response) of its 200 response, not_found for a 404, or None.
+        
+        Without an explicit timeout, each attempt's timeout is adapted from
+        the call's observed latency. Attempts stop when the retries, the
+        deadline budget or the circuit breaker (the client's own unless
+        breaker is given) say so.
+        """
+        breaker = breaker or self.breaker
+        attempt = 0
+        while True:
+            budget = resilience.remaining()
+            if budget is not None and budget <= 0:
+                HA_RESILIENCE_EVENTS.inc(call=call, event='deadline')
+                logger.warning(f"No time left in the collection deadline to get {description}")
+                return None
+            if not breaker.allow():
+                HA_RESILIENCE_EVENTS.inc(call=call, event='rejected')
+                logger.debug(f"Circuit open, not requesting {description}")
+                return None
+            limit = self.timeouts.timeout(call, attempt) if timeout is None else timeout
+            if budget is not None:
+                limit = min(limit, budget)
+            span.set(attempts=attempt + 1, timeout=round(limit, 3))
+            
+            recorded = False
+            error = None
+            status = 'error'
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    try:
+                        async with self._get_session().get(url, headers=self.headers, params=params,
+                                                           timeout=aiohttp.ClientTimeout(total=limit)) as response:
+                            if response.status == 200:
+                                result = await read(response)
+                                status = response.status
+                                self.timeouts.observe(call, time.perf_counter() - start)
+                                breaker.record_success()
+                                recorded = True
+                                return result
+                            status = response.status
+                            if response.status == 404 and not_found is not None:
+                                breaker.record_success()
+                                recorded = True
+                                logger.debug(f"Not found: {description}")
+                                return not_found
+                            if response.status not in TRANSIENT_STATUSES:
+                                # Home Assistant answered; the request itself is wrong
+                                breaker.record_success()
+                                recorded = True
+                                logger.warning(f"Failed to get {description}: {response.status}")
+                                return None
+                            error = f"HTTP {response.status}"
+                    except asyncio.TimeoutError:
+                        status = 'timeout'
+                        error = f"timeout after {limit:.2f} s"
+                        HA_RESILIENCE_EVENTS.inc(call=call, event='timeout')
+                    except aiohttp.ClientError as e:
+                        error = repr(e)
+                    finally:
+                        HA_REQUEST_SECONDS.observe(time.perf_counter() - start, call=call,
+                                                   entity=entity, status=status)
+                        span.set(status=status)
+            finally:
+                if not recorded and error is None:
+                    breaker.release()
+            
+            breaker.record_failure()
+            attempt += 1
+            if attempt > self.retries:
+                logger.warning(f"Failed to get {description} after {attempt} attempt(s): {error}")
+                return None
+            delay = self.backoff.delay(attempt)
+            budget = resilience.remaining()
+            if budget is not None and budget < delay + self.timeouts.minimum:
+                HA_RESILIENCE_EVENTS.inc(call=call, event='deadline')
+                logger.warning(f"Failed to get {description} ({error}), no time left to retry")
+                return None
+            HA_RESILIENCE_EVENTS.inc(call=call, event='retry')
+            logger.info(f"Retrying {description} in {delay:.2f} s after {error}")
+            await asyncio.sleep(delay)
+    
+    async def get_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """Get the raw state object for a single entity.
+        
+        Returns an empty dict if the entity does not exist and None if the
+        request failed.
+        """
+        url = f"{self.ha_url}/api/states/{entity_id}"
+        
+        async def read(response: aiohttp.ClientResponse) -> Dict[str, Any]:
+            return await response.json()
+        try:
+            with tracing.span('ha.state', entity=entity_id) as span:
+                return await self._request('state', url, read, f"data for {entity_id}",
+                                           entity=entity_id, not_found={}, span=span)
+        except Exception as e:
+            logger.error(f"Error getting data for {entity_id}: {e!r}")
+        return None
+    
+    async def get_value(self, entity_id: str) -> Optional[float]:
+        """Get the numeric state of a single entity."""
+        return self.parse_state(await self.get_state(entity_id), entity_id)
+    
+    async def get_values(self, entity_ids: Iterable[str]) -> Dict[str, Optional[float]]:
+        """Get the numeric states of several entities concurrently."""
+        unique_ids = list(dict.fromkeys(entity_ids))
+        values = await asyncio.gather(*(self.get_value(entity_id) for entity_id in unique_ids))
+        return dict(zip(unique_ids, values))
+    
+    async def find_states(self, match: Callable[[Dict[str, Any]], bool],
+                          entities: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """Fetch /api/states once and return the state objects match accepts.
+        
+        The response is parsed incrementally so only the accepted state
+        objects are kept in memory, no matter how many entities the instance
+        has. Returns None if the states could not be fetched.
+        """
+        url = f"{self.ha_url}/api/states"
+        
+        async def read(response: aiohttp.ClientResponse) -> List[Dict[str, Any]]:
+            return [state_obj async for state_obj in iter_json_array(response.content)
+                    if isinstance(state_obj, dict) and match(state_obj)]
+        try:
+            with tracing.span('ha.snapshot', entities=entities) as span:
+                return await self._request('snapshot', url, read, "state snapshot", span=span)
+        except Exception as e:
+            logger.error(f"Error getting state snapshot: {e!r}")
+        return None
+    
+    async def get_states_snapshot(self, entity_ids: Iterable[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Fetch /api/states once and index the wanted entities by entity_id.
+        
+        Returns None if the snapshot could not be fetched.
+        """
+        wanted = set(entity_ids)
+        states = await self.find_states(lambda state_obj: state_obj.get('entity_id') in wanted, len(wanted))
+        if states is None:
+            return None
+        return {state_obj['entity_id']: state_obj for state_obj in states}
+    
+    async def get_snapshot_values(self, entity_ids: Iterable[str]) -> Optional[Dict[str, Optional[float]]]:
+        """Get the numeric states of several entities from one /api/states snapshot."""
+        unique_ids = list(dict.fromkeys(entity_ids))
+        index = await self.get_states_snapshot(unique_ids)
+        if index is None:
+            return None
+        return {entity_id: self.parse_state(index.get(entity_id), entity_id)
+                for entity_id in unique_ids}
+    
+    async def get_history(self, entity_ids: Iterable[str], start: datetime, end: datetime,
+                          timeout: float = 60) -> Optional[Dict[str, List[Tuple[float, Optional[float]]]]]:
+        """Get the state history of entities between start and end.
+        
+        Returns (timestamp, value) lists sorted by time per entity, where the
+        first point is the state at start. Returns None if the request failed.
+        History requests differ too much in size to adapt their timeout, so
+        every attempt gets timeout. They have a circuit breaker of their own,
+        so a failing backfill does not reject live collections.
+        """
+        unique_ids = list(dict.fromkeys(entity_ids))
+        url = f"{self.ha_url}/api/history/period/{start.isoformat()}"
+        params = {
+            'end_time': end.isoformat(),
+            'filter_entity_id': ','.join(unique_ids),
+            'minimal_response': '',
+            'no_attributes': ''
+        }
+        
+        async def read(response: aiohttp.ClientResponse) -> Dict[str, List[Tuple[float, Optional[float]]]]:
+            history = {}
+            # One list per entity; with minimal_response only the first item has the entity_id
+            async for states in iter_json_array(response.content):
+                if not states:
+                    continue
+                entity_id = states[0].get('entity_id')
+                history[entity_id] = [
+                    (datetime.fromisoformat(state.get('last_changed') or state['last_updated']).timestamp(),
+                     self.parse_state(state, entity_id))
+                    for state in states
+                ]
+            return history
+        try:
+            with tracing.span('ha.history', entities=len(unique_ids)) as span:
+                return await self._request('history', url, read, f"history from {start}",
+                                           params=params, timeout=timeout,
+                                           breaker=self.history_breaker, span=span)
+        except Exception as e:
+            logger.error(f"Error getting history from {start}: {e!r}")
+        return None
+
+class JSONArrayParser:
+    """Incremental parser yielding the elements of a top-level JSON array."""
+    
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._started = False
+        self.done = False
+    
+    def feed(self, text: str) -> List[Any]:
+        """Feed more text and return every element completed by it."""
+        buffer = self._buffer + text
+        pos = 0
+        items = []
+        while not self.done:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            char = buffer[pos]
+            if not self._started:
+                if char != '[':
+                    raise ValueError(f"Expected JSON array, got {char!r}")
+                self._started = True
+                pos += 1
+            elif char == ',':
+                pos += 1
+            elif char == ']':
+                self.done = True
+                pos += 1
+            else:
+                try:
+                    item, pos = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Element not complete yet, wait for more data
+                    break
+                items.append(item)
+        self._buffer = buffer[pos:]
+        return items
+
+async def iter_json_array(content: aiohttp.StreamReader, chunk_size: int = 65536) -> AsyncIterator[Any]:
+    """Yield the elements of a JSON array streamed from a response body."""
+    parser = JSONArrayParser()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    async for chunk in content.iter_chunked(chunk_size):
+        for item in parser.feed(decoder.decode(chunk)):
+            yield item
+    for item in parser.feed(decoder.decode(b'', final=True)):
+        yield item
+    if not parser.done:
+        raise ValueError("Truncated JSON array in response")
+
+def create_session(limit: int = 10, keepalive_timeout: float = 60) -> aiohttp.ClientSession:
+    """Create a keep-alive client session suitable for talking to Home Assistant."""
+    connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=keepalive_timeout)
+    return aiohttp.ClientSession(connector=connector)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Home Assistant State Stream
+Push-based ingestion of entity states over the Home Assistant WebSocket API.
+"""
+
+import asyncio
+import logging
+import time
+import aiohttp
+from typing import Optional, Dict, Any, List, Callable
+from urllib.parse import urlsplit, urlunsplit
+
+from ha_client import HAClient
+
+logger = logging.getLogger(__name__)
+
+def websocket_url(ha_url: str) -> str:
+    """Derive the WebSocket API URL from the configured Home Assistant URL."""
+    parts = urlsplit(ha_url.rstrip('/'))
+    scheme = 'wss' if parts.scheme == 'https' else 'ws'
+    # The Supervisor proxy exposes the API at /core/websocket, Core itself at /api/websocket
+    suffix = '/websocket' if parts.path.endswith('/core') else '/api/websocket'
+    return urlunsplit((scheme, parts.netloc, parts.path + suffix, '', ''))
+
+class HAStateStream:
+    """Keeps the latest value of the configured entities via a WebSocket subscription.
+    
+    Uses the subscribe_entities command, which delivers the current state of
+    the requested entities followed by their state_changed updates only.
+    The connection is re-established (and the subscription renewed) whenever
+    it drops. While it is down, ``ready`` is False and callers are expected
+    to fall back to the REST API. set_entities changes the subscribed
+    entities by reconnecting.
+    """
+    
+    def __init__(self, ws_url: str, ha_token: str, entity_ids: List[str],
+                 session: Optional[aiohttp.ClientSession] = None,
+                 reconnect_delay: float = 1, max_reconnect_delay: float = 60,
+                 heartbeat: float = 30):
+        """Initialize the state stream."""
+        self.ws_url = ws_url
+        self.ha_token = ha_token
+        self.entity_ids = list(dict.fromkeys(entity_ids))
+        self.session = session
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.heartbeat = heartbeat
+        self.values: Dict[str, Optional[float]] = {}
+        self.updated: Dict[str, float] = {}
+        self.ready = False
+        self._listeners: List[Callable[[str, Optional[float], float], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._msg_id = 0
+    
+    def add_listener(self, callback: Callable[[str, Optional[float], float], None]):
+        """Register a callback invoked as callback(entity_id, value, timestamp) on every update."""
+        self._listeners.append(callback)
+    
+    def get_values(self, entity_ids: List[str]) -> Optional[Dict[str, Optional[float]]]:
+        """Return the latest known values, or None while the stream is not live or misses an entity."""
+        if not self.ready or not set(entity_ids) <= set(self.entity_ids):
+            return None
+        return {entity_id: self.values.get(entity_id) for entity_id in entity_ids}
+    
+    async def set_entities(self, entity_ids: List[str]):
+        """Subscribe to a different entity list; the connection is renewed to subscribe to it."""
+        entity_ids = list(dict.fromkeys(entity_ids))
+        if entity_ids == self.entity_ids:
+            return
+        self.entity_ids = entity_ids
+        self.ready = False
+        if self._ws is not None:
+            logger.info(f"Entity list changed, resubscribing to {len(entity_ids)} entities")
+            await self._ws.close()
+    
+    async def start(self):
+        """Start the background connection task."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the background connection task."""
+        self.ready = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        """Connect, subscribe and consume updates, reconnecting with backoff."""
+        delay = self.reconnect_delay
+        while True:
+            try:
+                await self._connect_and_listen()
+                # Clean close by the server: reconnect promptly
+                delay = self.reconnect_delay
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"State stream disconnected: {e!r}")
+            self.ready = False
+            logger.info(f"Reconnecting state stream in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+    
+    async def _connect_and_listen(self):
+        """Run a single connection until it closes."""
+        session = self.session
+        owns_session = session is None or session.closed
+        if owns_session:
+            session = aiohttp.ClientSession()
+        try:
+            async with session.ws_connect(self.ws_url, heartbeat=self.heartbeat) as ws:
+                self._ws = ws
+                await self._authenticate(ws)
+                subscription_id = await self._subscribe(ws)
+                logger.info(f"Subscribed to {len(self.entity_ids)} entities via {self.ws_url}")
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    data = msg.json()
+                    if data.get('type') == 'event' and data.get('id') == subscription_id:
+                        self.handle_event(data.get('event') or {})
+        finally:
+            self.ready = False
+            self._ws = None
+            if owns_session:
+                await session.close()
+    
+    async def _authenticate(self, ws: aiohttp.ClientWebSocketResponse):
+        """Perform the auth handshake."""
+        message = await ws.receive_json()
+        if message.get('type') != 'auth_required':
+            raise ConnectionError(f"Unexpected handshake message: {message.get('type')}")
+        await ws.send_json({'type': 'auth', 'access_token': self.ha_token})
+        message = await ws.receive_json()
+        if message.get('type') != 'auth_ok':
+            raise PermissionError(f"Authentication failed: {message.get('message', message.get('type'))}")
+    
+    async def _subscribe(self, ws: aiohttp.ClientWebSocketResponse) -> int:
+        """Subscribe to the configured entities and return the subscription id."""
+        self._msg_id += 1
+        subscription_id = self._msg_id
+        await ws.send_json({
+            'id': subscription_id,
+            'type': 'subscribe_entities',
+            'entity_ids': self.entity_ids
+        })
+        while True:
+            message = await ws.receive_json()
+            if message.get('id') != subscription_id:
+                continue
+            if message.get('type') == 'result':
+                if not message.get('success'):
+                    raise ConnectionError(f"Subscription failed: {message.get('error')}")
+                return subscription_id
+            if message.get('type') == 'event':
+                # Initial states may arrive before the result is processed
+                self.handle_event(message.get('event') or {})
+    
+    def handle_event(self, event: Dict[str, Any]):
+        """Apply a subscribe_entities event (additions, changes and removals)."""
+        for entity_id, state in (event.get('a') or {}).items():
+            self._update(entity_id, state.get('s'), state.get('lu') or state.get('lc'))
+        for entity_id, diff in (event.get('c') or {}).items():
+            added = diff.get('+') or {}
+            if 's' in added:
+                self._update(entity_id, added['s'], added.get('lu') or added.get('lc'))
+        for entity_id in event.get('r') or []:
+            self._update(entity_id, None, None)
+        # The first event carries the current state of every subscribed entity
+        self.ready = True
+    
+    def _update(self, entity_id: str, state: Optional[str], timestamp: Optional[float]):
+        """Store a new value and notify listeners."""
+        value = HAClient.parse_state({'state': state}, entity_id)
+        timestamp = timestamp or time.time()
+        self.values[entity_id] = value
+        self.updated[entity_id] = timestamp
+        for callback in self._listeners:
+            try:
+                callback(entity_id, value, timestamp)
+            except Exception as e:
+                logger.error(f"Error in state listener for {entity_id}: {e}")
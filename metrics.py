@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+PV Forecast Metrics
+Vectorized forecast accuracy metrics over the comparison tables.
+"""
+
+import sqlite3
+from datetime import date
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from sites import DEFAULT_SITE
+
+# Sources: time slot rows from pv_forecast or daily totals from daily_production
+# of one site, with the date as days since 1970-01-01
+SOURCES = {
+    'slots': '''
+        SELECT CAST(julianday(date) - 2440587.5 AS INTEGER), time_slot, provider, forecast_wh, actual_wh
+        FROM pv_forecast
+        WHERE site = ? AND date >= ? AND date <= ?
+          AND forecast_wh IS NOT NULL AND actual_wh IS NOT NULL
+    ''',
+    'daily': '''
+        SELECT CAST(julianday(date) - 2440587.5 AS INTEGER), 'daily', provider,
+               total_forecast_wh, total_actual_wh
+        FROM daily_production
+        WHERE site = ? AND date >= ? AND date <= ?
+          AND total_forecast_wh IS NOT NULL AND total_actual_wh IS NOT NULL
+    '''
+}
+
+GROUP_BY = ('none', 'time_slot', 'weekday', 'month', 'provider')
+
+TIME_SLOT_ORDER = ('4am', '11am', '3pm', '11pm', 'daily')
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+def _encode(values) -> tuple:
+    """Map labels to dense integer ids; returns (ids, labels)."""
+    ids: Dict[str, int] = {}
+    codes = np.fromiter((ids.setdefault(value, len(ids)) for value in values), dtype=np.int64,
+                        count=len(values))
+    return codes, list(ids)
+
+def load_comparison(conn: sqlite3.Connection, source: str, start: date, end: date,
+                    site: str = DEFAULT_SITE) -> Dict[str, Any]:
+    """Load the forecast/actual pairs of a site and date range into column arrays.
+    
+    Text columns are encoded as integer ids (with their labels alongside),
+    so grouping never touches Python strings per row.
+    """
+    rows = conn.execute(SOURCES[source], (site, start.isoformat(), end.isoformat())).fetchall()
+    days, slots, providers, forecast, actual = zip(*rows) if rows else ((), (), (), (), ())
+    slot_ids, slot_labels = _encode(slots)
+    provider_ids, provider_labels = _encode([p or 'unknown' for p in providers])
+    return {
+        'day': np.array(days, dtype=np.int64),
+        'slot': slot_ids,
+        'slot_labels': slot_labels,
+        'provider': provider_ids,
+        'provider_labels': provider_labels,
+        'forecast': np.array(forecast, dtype=float),
+        'actual': np.array(actual, dtype=float)
+    }
+
+def persistence_reference(day: np.ndarray, slot: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """Actual value of the same slot on the previous day (NaN where missing).
+    
+    Persistence ("tomorrow is like today") is the baseline the skill score
+    is measured against.
+    """
+    reference = np.full(actual.shape, np.nan)
+    if actual.size < 2:
+        return reference
+    order = np.lexsort((day, slot))
+    sorted_day = day[order]
+    sorted_slot = slot[order]
+    follows = (np.diff(sorted_day) == 1) & (np.diff(sorted_slot) == 0)
+    reference[order[1:][follows]] = actual[order[:-1][follows]]
+    return reference
+
+def _group_ids(data: Dict[str, Any], group_by: str) -> tuple:
+    """Dense group id of every row and the label of each id."""
+    if group_by in ('time_slot', 'provider'):
+        column = 'slot' if group_by == 'time_slot' else 'provider'
+        return data[column], data[column + '_labels']
+    if group_by == 'weekday':
+        # 1970-01-01 was a Thursday; shift so Monday is 0
+        return (data['day'] + 3) % 7, list(WEEKDAYS)
+    # Months since 1970-01 from the day numbers; only the distinct ones become strings
+    months = data['day'].astype('datetime64[D]').astype('datetime64[M]')
+    unique, ids = np.unique(months, return_inverse=True)
+    return ids, [str(month) for month in unique]
+
+def _slot_order(label: str):
+    """Sort key putting time slots in chronological order."""
+    if label in TIME_SLOT_ORDER:
+        return TIME_SLOT_ORDER.index(label), label
+    return len(TIME_SLOT_ORDER), label
+
+def _metrics(sums: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """Turn the summed components of one group into metrics."""
+    count = sums['count']
+    if not count:
+        return {'count': 0, 'mae': None, 'rmse': None, 'mape': None, 'bias': None,
+                'skill': None, 'forecast_total': 0.0, 'actual_total': 0.0}
+    mse = sums['sq_error'] / count
+    skill = None
+    if sums['ref_count'] and sums['ref_sq_error']:
+        skill = 1 - sums['paired_sq_error'] / sums['ref_sq_error']
+    return {
+        'count': int(count),
+        'mae': sums['abs_error'] / count,
+        'rmse': float(np.sqrt(mse)),
+        'mape': 100 * sums['pct_error'] / sums['pct_count'] if sums['pct_count'] else None,
+        'bias': sums['error'] / count,
+        'skill': skill,
+        'forecast_total': sums['forecast'],
+        'actual_total': sums['actual']
+    }
+
+def compute_metrics(data: Dict[str, np.ndarray], group_by: str = 'none') -> Dict[str, Any]:
+    """Compute MAE, RMSE, MAPE, bias and skill overall and per group.
+    
+    Errors are forecast minus actual, so a positive bias means the forecast
+    was too high. MAPE skips rows with zero actual production. Skill is
+    1 - MSE / MSE of the persistence forecast over the rows that have a
+    previous-day reference; 1 is perfect, 0 is no better than persistence.
+    
+    Every metric is a ratio of per-group sums, so each is one bincount over
+    the rows regardless of the number of groups.
+    """
+    forecast, actual = data['forecast'], data['actual']
+    error = forecast - actual
+    reference = persistence_reference(data['day'], data['slot'], actual)
+    has_reference = ~np.isnan(reference)
+    has_pct = actual != 0
+    pct_error = np.zeros_like(error)
+    np.divide(np.abs(error), np.abs(actual), out=pct_error, where=has_pct)
+    
+    components = {
+        'count': np.ones_like(error),
+        'error': error,
+        'abs_error': np.abs(error),
+        'sq_error': error * error,
+        'pct_error': pct_error,
+        'pct_count': has_pct.astype(float),
+        'ref_count': has_reference.astype(float),
+        'ref_sq_error': np.where(has_reference, (reference - actual) ** 2, 0.0),
+        'paired_sq_error': np.where(has_reference, error * error, 0.0),
+        'forecast': forecast,
+        'actual': actual
+    }
+    
+    overall = _metrics({name: float(values.sum()) for name, values in components.items()})
+    result = {'overall': overall, 'groups': []}
+    if group_by == 'none' or error.size == 0:
+        return result
+    
+    group_ids, labels = _group_ids(data, group_by)
+    sums = {name: np.bincount(group_ids, weights=values, minlength=len(labels))
+            for name, values in components.items()}
+    groups = []
+    for index, label in enumerate(labels):
+        if not sums['count'][index]:
+            continue
+        group = {'group': label}
+        group.update(_metrics({name: float(values[index]) for name, values in sums.items()}))
+        groups.append(group)
+    if group_by in ('time_slot', 'provider'):
+        # Labels are in order of first appearance
+        key = _slot_order if group_by == 'time_slot' else str
+        groups.sort(key=lambda group: key(group['group']))
+    result['groups'] = groups
+    return result
+
+def query_metrics(conn: sqlite3.Connection, source: str, start: date, end: date,
+                  group_by: str = 'none', site: str = DEFAULT_SITE) -> Dict[str, Any]:
+    """Load a site's date range and compute its metrics (runs on a database reader thread)."""
+    result = compute_metrics(load_comparison(conn, source, start, end, site), group_by)
+    result.update({'site': site, 'from': start.isoformat(), 'to': end.isoformat(),
+                   'source': source, 'group_by': group_by})
+    return result
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Profiler
+On-demand CPU (cProfile) and memory (tracemalloc) profiling of the running add-on.
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import tracemalloc
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+class Profiler:
+    """Profiles the event loop for a number of seconds and returns a text report.
+    
+    The profilers only run during a request and one profile may run at a
+    time; the endpoint answers 403 unless enabled.
+    """
+    
+    def __init__(self, enabled: bool = False, max_seconds: float = 300):
+        """Initialize the profiler."""
+        self.enabled = enabled
+        self.max_seconds = max_seconds
+        self._lock = asyncio.Lock()
+    
+    async def cpu_profile(self, seconds: float, limit: int = 40, sort: str = 'cumulative') -> str:
+        """Profile the event loop thread with cProfile and return the pstats report."""
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+    
+    async def memory_profile(self, seconds: float, limit: int = 40) -> str:
+        """Trace allocations with tracemalloc and report the lines whose memory grew most."""
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(10)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+        lines = [f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB",
+                 f"Top {limit} allocation changes over {seconds:g} s:"]
+        lines.extend(str(stat) for stat in after.compare_to(before, 'lineno')[:limit])
+        return '\n'.join(lines) + '\n'
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        """Run a profile: POST with optional JSON {"mode": "cpu"|"memory", "seconds", "limit", "sort"}."""
+        if not self.enabled:
+            return web.json_response({'error': 'Profiling is disabled (set profiling: true)'}, status=403)
+        try:
+            data = await request.json() if request.can_read_body else {}
+            mode = data.get('mode', 'cpu')
+            seconds = float(data.get('seconds', 10))
+            limit = int(data.get('limit', 40))
+            sort = data.get('sort', 'cumulative')
+        except (ValueError, TypeError, AttributeError):
+            return web.json_response({'error': 'Invalid JSON'}, status=400)
+        if mode not in ('cpu', 'memory') or sort not in SORT_KEYS or limit < 1:
+            return web.json_response({'error': f'mode must be cpu or memory, sort one of {", ".join(SORT_KEYS)}'},
+                                     status=400)
+        if not 0 < seconds <= self.max_seconds:
+            return web.json_response({'error': f'seconds must be between 0 and {self.max_seconds:g}'}, status=400)
+        if self._lock.locked():
+            return web.json_response({'error': 'A profile is already running'}, status=409)
+        
+        async with self._lock:
+            logger.info(f"Running {mode} profile for {seconds:g} s")
+            if mode == 'cpu':
+                report = await self.cpu_profile(seconds, limit, sort)
+            else:
+                report = await self.memory_profile(seconds, limit)
+        return web.Response(text=report, content_type='text/plain')
@@ -4,68 +4,31 @@ PV Data Retriever
 Retrieves data from the SQLite database for the web interface.
 """
 
+import os
 import sqlite3
-import json
-from datetime import datetime, date, timedelta
-from typing import Dict, Any, List, Optional
+from datetime import date, timedelta
+from typing import Dict, Any, Optional
+
+from pv_database import PVDatabase
+from db_stats import read_stats
+from metrics import query_metrics
+from downsampling import downsample_series
+from rollups import (DAILY_SERIES, ROLLUP_TABLE_BY_RESOLUTION, bucket_labels, bucket_range,
+                     choose_resolution, site_series)
+from sites import DEFAULT_SITE
 
 class PVDataRetriever:
     """Class for retrieving PV forecast data from the database."""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db: PVDatabase):
         """Initialize the data retriever."""
-        self.db_path = db_path
+        self.db = db
     
-    def get_today_data(self) -> Dict[str, Any]:
-        """Get today's data for all time slots."""
+    async def get_today_data(self, site: str = DEFAULT_SITE) -> Dict[str, Any]:
+        """Get today's data of a site for all time slots."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            today = date.today().isoformat()
-            
-            # Get data for all time slots
-            cursor.execute('''
-                SELECT time_slot, forecast_wh, actual_wh 
-                FROM pv_forecast 
-                WHERE date = ?
-                ORDER BY time_slot
-            ''', (today,))
-            
-            result = {
-                '4am': {'forecast': 0, 'actual': 0},
-                '11am': {'forecast': 0, 'actual': 0},
-                '3pm': {'forecast': 0, 'actual': 0},
-                '11pm': {'forecast': 0, 'actual': 0},
-                'daily': {'forecast': 0, 'actual': 0}
-            }
-            
-            for row in cursor.fetchall():
-                time_slot, forecast_wh, actual_wh = row
-                if time_slot in result:
-                    result[time_slot] = {
-                        'forecast': forecast_wh or 0,
-                        'actual': actual_wh or 0
-                    }
-            
-            # Get daily totals
-            cursor.execute('''
-                SELECT total_forecast_wh, total_actual_wh 
-                FROM daily_production 
-                WHERE date = ?
-            ''', (today,))
-            
-            daily_row = cursor.fetchone()
-            if daily_row:
-                total_forecast_wh, total_actual_wh = daily_row
-                result['daily'] = {
-                    'forecast': total_forecast_wh or 0,
-                    'actual': total_actual_wh or 0
-                }
-            
-            conn.close()
-            return result
-            
+            return await self.db.read(self._query_today_data, date.today().isoformat(), site)
+        
         except Exception as e:
             print(f"Error getting today's data: {e}")
             return {
@@ -76,60 +39,81 @@ class PVDataRetriever:
                 'daily': {'forecast': 0, 'actual': 0}
             }
     
-    def get_historical_data(self, days: int = 7) -> Dict[str, Any]:
-        """Get historical data for the specified number of days."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get dates for the last N days
-            end_date = date.today()
-            start_date = end_date - timedelta(days=days-1)
-            
-            # Get daily production data
-            cursor.execute('''
-                SELECT date, total_forecast_wh, total_actual_wh 
-                FROM daily_production 
-                WHERE date >= ? AND date <= ?
-                ORDER BY date
-            ''', (start_date.isoformat(), end_date.isoformat()))
-            
-            dates = []
-            forecast_data = []
-            actual_data = []
-            
-            # Generate all dates in range
-            current_date = start_date
-            while current_date <= end_date:
-                dates.append(current_date.strftime('%Y-%m-%d'))
-                current_date += timedelta(days=1)
-            
-            # Fill in data from database
-            db_data = {}
-            for row in cursor.fetchall():
-                db_date, forecast_wh, actual_wh = row
-                db_data[db_date] = {
+    @staticmethod
+    def _query_today_data(conn: sqlite3.Connection, today: str, site: str = DEFAULT_SITE) -> Dict[str, Any]:
+        """Query the time slot rows and daily totals of one day of a site."""
+        cursor = conn.cursor()
+        
+        # Get data for all time slots
+        cursor.execute('''
+            SELECT time_slot, forecast_wh, actual_wh
+            FROM pv_forecast
+            WHERE site = ? AND date = ?
+            ORDER BY time_slot
+        ''', (site, today))
+        
+        result = {
+            '4am': {'forecast': 0, 'actual': 0},
+            '11am': {'forecast': 0, 'actual': 0},
+            '3pm': {'forecast': 0, 'actual': 0},
+            '11pm': {'forecast': 0, 'actual': 0},
+            'daily': {'forecast': 0, 'actual': 0}
+        }
+        
+        for row in cursor.fetchall():
+            time_slot, forecast_wh, actual_wh = row
+            if time_slot in result:
+                result[time_slot] = {
                     'forecast': forecast_wh or 0,
                     'actual': actual_wh or 0
                 }
-            
-            # Create arrays with data (0 for missing dates)
-            for date_str in dates:
-                if date_str in db_data:
-                    forecast_data.append(db_data[date_str]['forecast'])
-                    actual_data.append(db_data[date_str]['actual'])
-                else:
-                    forecast_data.append(0)
-                    actual_data.append(0)
-            
-            conn.close()
-            
-            return {
-                'dates': dates,
-                'forecast': forecast_data,
-                'actual': actual_data
+        
+        # Get daily totals
+        cursor.execute('''
+            SELECT total_forecast_wh, total_actual_wh
+            FROM daily_production
+            WHERE site = ? AND date = ?
+        ''', (site, today))
+        
+        daily_row = cursor.fetchone()
+        if daily_row:
+            total_forecast_wh, total_actual_wh = daily_row
+            result['daily'] = {
+                'forecast': total_forecast_wh or 0,
+                'actual': total_actual_wh or 0
             }
+        
+        return result
+    
+    async def get_historical_data(self, days: int = 7, resolution: str = 'auto',
+                                  max_points: Optional[int] = None, site: str = DEFAULT_SITE) -> Dict[str, Any]:
+        """Get historical data of a site for the specified number of days.
+        
+        With resolution 'auto' long ranges are answered from the monthly rollup.
+        Comparisons have no hourly rollup, so 'hour' raises ValueError (short
+        'auto' ranges get daily data). With max_points, longer series are
+        reduced to that many points (LTTB).
+        """
+        if resolution == 'hour':
+            raise ValueError("Comparison data has no hourly resolution")
+        try:
+            # Get dates for the last N days
+            end_date = date.today()
+            start_date = end_date - timedelta(days=days-1)
             
+            if resolution == 'auto':
+                resolution = choose_resolution(start_date, end_date)
+            if resolution == 'month':
+                data = await self.db.read(self._query_rollup_comparison, site_series(site, DAILY_SERIES),
+                                          start_date, end_date, resolution)
+            else:
+                data = await self.db.read(self._query_historical_data, start_date, end_date, site)
+                resolution = 'day'
+            data['resolution'] = resolution
+            if max_points:
+                data = downsample_series(data, ('forecast', 'actual'), max_points)
+            return data
+        
         except Exception as e:
             print(f"Error getting historical data: {e}")
             return {
@@ -138,37 +122,196 @@ class PVDataRetriever:
                 'actual': []
             }
     
-    def get_db_stats(self) -> Dict[str, Any]:
-        """Get database statistics."""
+    @staticmethod
+    def _query_historical_data(conn: sqlite3.Connection, start_date: date, end_date: date,
+                               site: str = DEFAULT_SITE) -> Dict[str, Any]:
+        """Query daily totals of a site for a date range, filling missing days with 0.
+        
+        The dates come from a recursive CTE joined to the data, so the gaps
+        are filled by SQLite in the same pass that reads the rows.
+        """
+        cursor = conn.execute('''
+            WITH RECURSIVE days(day) AS (
+                SELECT :start WHERE :start <= :end
+                UNION ALL
+                SELECT date(day, '+1 day') FROM days WHERE day < :end
+            )
+            SELECT days.day,
+                   COALESCE(daily_production.total_forecast_wh, 0),
+                   COALESCE(daily_production.total_actual_wh, 0)
+            FROM days
+            LEFT JOIN daily_production
+                ON daily_production.site = :site AND daily_production.date = days.day
+            ORDER BY days.day
+        ''', {'start': start_date.isoformat(), 'end': end_date.isoformat(), 'site': site})
+        
+        rows = cursor.fetchall()
+        dates, forecast_data, actual_data = zip(*rows) if rows else ((), (), ())
+        return {
+            'dates': list(dates),
+            'forecast': list(forecast_data),
+            'actual': list(actual_data)
+        }
+    
+    @staticmethod
+    def _query_rollup_comparison(conn: sqlite3.Connection, series: str, start_date: date,
+                                 end_date: date, resolution: str) -> Dict[str, Any]:
+        """Query forecast and actual sums of a comparison series from a rollup table."""
+        table = ROLLUP_TABLE_BY_RESOLUTION[resolution]
+        first, last = bucket_range(start_date, end_date, resolution)
+        cursor = conn.execute(f'''
+            SELECT bucket, forecast_sum, actual_sum
+            FROM {table}
+            WHERE series = ? AND bucket BETWEEN ? AND ?
+        ''', (series, first, last))
+        db_data = {bucket: (forecast or 0, actual or 0) for bucket, forecast, actual in cursor}
+        
+        dates = bucket_labels(start_date, end_date, resolution)
+        return {
+            'dates': dates,
+            'forecast': [db_data.get(bucket, (0, 0))[0] for bucket in dates],
+            'actual': [db_data.get(bucket, (0, 0))[1] for bucket in dates]
+        }
+    
+    async def get_series_history(self, series: str, days: int = 7, resolution: str = 'auto',
+                                 max_points: Optional[int] = None) -> Dict[str, Any]:
+        """Get aggregated sample values of one entity from the coarsest fitting rollup.
+        
+        With max_points, longer series are reduced to that many points (LTTB).
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Count records in pv_forecast table
-            cursor.execute('SELECT COUNT(*) FROM pv_forecast')
-            forecast_count = cursor.fetchone()[0]
+            end_date = date.today()
+            start_date = end_date - timedelta(days=days-1)
+            if resolution == 'auto':
+                resolution = choose_resolution(start_date, end_date)
             
-            # Count records in daily_production table
-            cursor.execute('SELECT COUNT(*) FROM daily_production')
-            daily_count = cursor.fetchone()[0]
+            data = await self.db.read(self._query_rollup_values, series, start_date, end_date, resolution)
+            data['resolution'] = resolution
+            if max_points:
+                data = downsample_series(data, ('sum', 'min', 'max', 'avg'), max_points)
+            return data
             
-            # Get latest timestamp
-            cursor.execute('''
-                SELECT MAX(timestamp) FROM (
-                    SELECT timestamp FROM pv_forecast
-                    UNION ALL
-                    SELECT timestamp FROM daily_production
-                )
-            ''')
-            latest_timestamp = cursor.fetchone()[0]
+        except Exception as e:
+            print(f"Error getting series history: {e}")
+            return {
+                'dates': [],
+                'sum': [],
+                'min': [],
+                'max': [],
+                'avg': []
+            }
+    
+    @staticmethod
+    def _query_rollup_values(conn: sqlite3.Connection, series: str, start_date: date,
+                             end_date: date, resolution: str) -> Dict[str, Any]:
+        """Query sum/min/max/avg of a sample series from a rollup table (None for empty buckets)."""
+        table = ROLLUP_TABLE_BY_RESOLUTION[resolution]
+        first, last = bucket_range(start_date, end_date, resolution)
+        cursor = conn.execute(f'''
+            SELECT bucket, value_sum, value_min, value_max, value_count
+            FROM {table}
+            WHERE series = ? AND bucket BETWEEN ? AND ?
+        ''', (series, first, last))
+        db_data = {row[0]: row[1:] for row in cursor}
+        
+        dates = bucket_labels(start_date, end_date, resolution)
+        result = {'dates': dates, 'sum': [], 'min': [], 'max': [], 'avg': []}
+        for bucket in dates:
+            value_sum, value_min, value_max, value_count = db_data.get(bucket, (None, None, None, 0))
+            result['sum'].append(value_sum)
+            result['min'].append(value_min)
+            result['max'].append(value_max)
+            result['avg'].append(value_sum / value_count if value_count else None)
+        return result
+    
+    async def get_dashboard_data(self, days: int = 7, site: str = DEFAULT_SITE) -> Dict[str, Any]:
+        """Get status, today's data and the daily history of a site for the dashboard in one read."""
+        end_date = date.today()
+        start_date = end_date - timedelta(days=days-1)
+        return await self.db.read(self._query_dashboard, start_date, end_date, site)
+    
+    @staticmethod
+    def _query_dashboard(conn: sqlite3.Connection, start_date: date, end_date: date,
+                         site: str = DEFAULT_SITE) -> Dict[str, Any]:
+        """Query everything the dashboard shows with a single statement.
+        
+        One SELECT reads from a single snapshot, so status, today's slots and
+        the history are always consistent with each other.
+        """
+        cursor = conn.execute('''
+            SELECT 'status', NULL, row_count, last_write
+            FROM db_stats
+            WHERE table_name = 'pv_forecast'
+            UNION ALL
+            SELECT 'slot', time_slot, forecast_wh, actual_wh
+            FROM pv_forecast
+            WHERE site = ? AND date = ?
+            UNION ALL
+            SELECT 'daily', date, total_forecast_wh, total_actual_wh
+            FROM daily_production
+            WHERE site = ? AND date >= ? AND date <= ?
+        ''', (site, end_date.isoformat(), site, start_date.isoformat(), end_date.isoformat()))
+        
+        # Status counts come from db_stats and cover every site
+        status = {'online': True, 'db_records': 0, 'last_update': "Never", 'scope': 'all_sites'}
+        today = {
+            '4am': {'forecast': 0, 'actual': 0},
+            '11am': {'forecast': 0, 'actual': 0},
+            '3pm': {'forecast': 0, 'actual': 0},
+            '11pm': {'forecast': 0, 'actual': 0},
+            'daily': {'forecast': 0, 'actual': 0}
+        }
+        daily = {}
+        for kind, key, first, second in cursor:
+            if kind == 'status':
+                status['db_records'] = first or 0
+                status['last_update'] = second or "Never"
+            elif kind == 'slot':
+                if key in today:
+                    today[key] = {'forecast': first or 0, 'actual': second or 0}
+            else:
+                daily[key] = (first or 0, second or 0)
+        
+        today_key = end_date.isoformat()
+        if today_key in daily:
+            today['daily'] = {'forecast': daily[today_key][0], 'actual': daily[today_key][1]}
+        
+        dates = bucket_labels(start_date, end_date, 'day')
+        return {
+            'site': site,
+            'status': status,
+            'today': today,
+            'historical': {
+                'dates': dates,
+                'forecast': [daily.get(day, (0, 0))[0] for day in dates],
+                'actual': [daily.get(day, (0, 0))[1] for day in dates],
+                'resolution': 'day'
+            }
+        }
+    
+    async def get_metrics(self, start_date: date, end_date: date, group_by: str = 'none',
+                          source: str = 'daily', site: str = DEFAULT_SITE) -> Dict[str, Any]:
+        """Get forecast accuracy metrics of a site for a date range, optionally grouped."""
+        return await self.db.read(query_metrics, source, start_date, end_date, group_by, site)
+    
+    async def get_db_stats(self) -> Dict[str, Any]:
+        """Get database statistics from the maintained db_stats table."""
+        try:
+            stats = await self.db.read(read_stats)
             
-            conn.close()
+            forecast_count = stats.get('pv_forecast', {}).get('row_count', 0)
+            daily_count = stats.get('daily_production', {}).get('row_count', 0)
+            sample_count = stats.get('pv_samples', {}).get('row_count', 0)
+            write_times = [s['last_write'] for s in stats.values() if s['last_write']]
             
             return {
                 'forecast_records': forecast_count,
                 'daily_records': daily_count,
-                'total_records': forecast_count + daily_count,
-                'latest_timestamp': latest_timestamp
+                'sample_records': sample_count,
+                'total_records': forecast_count + daily_count + sample_count,
+                'latest_timestamp': max(write_times) if write_times else None,
+                'tables': stats,
+                'file_size_bytes': self._file_size()
             }
             
         except Exception as e:
@@ -176,6 +319,26 @@ class PVDataRetriever:
             return {
                 'forecast_records': 0,
                 'daily_records': 0,
+                'sample_records': 0,
                 'total_records': 0,
-                'latest_timestamp': None
-            } 
\ No newline at end of file
+                'latest_timestamp': None,
+                'tables': {},
+                'file_size_bytes': None
+            }
+    
+    def _file_size(self) -> Optional[int]:
+        """Size of the database file including its WAL."""
+        size = None
+        for path in (self.db.db_path, self.db.db_path + '-wal'):
+            if os.path.exists(path):
+                size = (size or 0) + os.path.getsize(path)
+        return size
+    
+    async def get_status(self) -> Dict[str, Any]:
+        """Get the record count and last update shown on the status card."""
+        stats = await self.db.read(read_stats)
+        forecast = stats.get('pv_forecast', {})
+        return {
+            'db_records': forecast.get('row_count', 0),
+            'last_update': forecast.get('last_write') or "Never"
+        }
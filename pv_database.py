@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+PV Database
+Shared SQLite access layer with one writer and a pool of read-only connections.
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Sequence
+
+import tracing
+from telemetry import SQL_SECONDS
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('pv_database.slow_queries')
+
+def operation_name(func: Callable[..., Any]) -> str:
+    """Metric label of a database operation: its qualified name, without bound-method or partial wrappers."""
+    while isinstance(func, partial):
+        func = func.func
+    name = getattr(func, '__qualname__', None) or type(func).__name__
+    return name.replace('.<locals>', '')
+
+class PVDatabase:
+    """SQLite database shared by the collector and the web interface.
+    
+    All writes go through a single connection owned by a dedicated writer
+    thread. Reads use a small pool of read-only connections in their own
+    threads. With WAL enabled, readers see the last committed state and are
+    never blocked by a running write.
+    """
+    
+    def __init__(self, db_path: str, read_connections: int = 2, slow_query_ms: float = 0):
+        """Initialize the database layer (connections are opened lazily)."""
+        self.db_path = db_path
+        self.read_connections = max(1, read_connections)
+        self._writer: Optional[sqlite3.Connection] = None
+        self._readers: 'queue.LifoQueue[sqlite3.Connection]' = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        # Bumped after every committed write; lets caches detect stale results
+        self.generation = 0
+        # Operations taking at least this many milliseconds are logged with their statements (0 disables)
+        self.slow_query_ms = slow_query_ms
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pv-db-write')
+        self._read_executor = ThreadPoolExecutor(max_workers=self.read_connections,
+                                                 thread_name_prefix='pv-db-read')
+    
+    def _configure(self, conn: sqlite3.Connection):
+        """Apply pragmas shared by all connections."""
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA cache_size = -4000')
+        conn.execute('PRAGMA mmap_size = 33554432')
+    
+    def _open_writer(self) -> sqlite3.Connection:
+        """Open the writer connection and switch the database to WAL."""
+        if self._writer is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+            conn.execute('PRAGMA synchronous = NORMAL')
+            # Let REPLACE conflict resolution fire delete triggers so db_stats counts stay exact
+            conn.execute('PRAGMA recursive_triggers = ON')
+            self._configure(conn)
+            self._writer = conn
+        return self._writer
+    
+    def _open_reader(self) -> sqlite3.Connection:
+        """Open a new read-only connection."""
+        # Make sure the database file and WAL exist before opening read-only
+        self._write_executor.submit(self._open_writer).result()
+        uri = Path(self.db_path).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True,
+                               check_same_thread=False, isolation_level=None)
+        self._configure(conn)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+    
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection from the pool (blocking, for worker threads)."""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._reader_lock:
+                can_open = self._reader_count < self.read_connections
+                if can_open:
+                    self._reader_count += 1
+            if can_open:
+                try:
+                    conn = self._open_reader()
+                except Exception:
+                    with self._reader_lock:
+                        self._reader_count -= 1
+                    raise
+            else:
+                conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    @contextmanager
+    def _timed(self, conn: sqlite3.Connection, kind: str, func: Callable[..., Any]) -> Iterator[None]:
+        """Time one operation and log its statements if it exceeds the slow query threshold.
+        
+        Statements are only captured (with SQLite's trace callback) while a
+        threshold is set.
+        """
+        operation = operation_name(func)
+        statements = None
+        if self.slow_query_ms:
+            statements = []
+            conn.set_trace_callback(statements.append)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            SQL_SECONDS.observe(duration, kind=kind, operation=operation)
+            if statements is not None:
+                conn.set_trace_callback(None)
+                if duration * 1000 >= self.slow_query_ms:
+                    slow_logger.warning(
+                        f"Slow {kind} {operation}: {duration * 1000:.1f} ms\n"
+                        # Trigger steps repeat their statement, so collapse consecutive duplicates
+                        + '\n'.join(' '.join(sql.split())[:500]
+                                    for i, sql in enumerate(statements) if not i or sql != statements[i - 1]))
+    
+    def _run_write(self, func: Callable[..., Any], *args) -> Any:
+        """Run func(conn, *args) in one transaction on the writer connection."""
+        conn = self._open_writer()
+        try:
+            with self._timed(conn, 'write', func):
+                with conn:
+                    return func(conn, *args)
+        finally:
+            self.generation += 1
+    
+    def _run_read(self, func: Callable[..., Any], *args) -> Any:
+        """Run func(conn, *args) on a pooled read-only connection."""
+        with self.reader() as conn:
+            with self._timed(conn, 'read', func):
+                return func(conn, *args)
+    
+    async def write(self, func: Callable[..., Any], *args) -> Any:
+        """Run func(conn, *args) in a write transaction in the writer thread."""
+        loop = asyncio.get_running_loop()
+        with tracing.span('db.write', operation=operation_name(func)) as span:
+            return await loop.run_in_executor(self._write_executor,
+                                              span.wrap(partial(self._run_write, func, *args)))
+    
+    async def read(self, func: Callable[..., Any], *args) -> Any:
+        """Run func(conn, *args) on a read-only connection in a reader thread."""
+        loop = asyncio.get_running_loop()
+        with tracing.span('db.read', operation=operation_name(func)) as span:
+            return await loop.run_in_executor(self._read_executor,
+                                              span.wrap(partial(self._run_read, func, *args)))
+    
+    async def stream(self, sql: str, params: Sequence[Any] = (),
+                     chunk_rows: int = 1000) -> AsyncIterator[List[tuple]]:
+        """Yield the rows of a query in chunks of at most chunk_rows.
+        
+        Uses its own read-only connection so a long export never holds a
+        pooled connection, and runs each fetchmany in a reader thread. Only
+        one chunk is in memory at a time; the caller should aclose() the
+        generator if it stops early.
+        """
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(self._read_executor, self._open_reader)
+        try:
+            cursor = await loop.run_in_executor(self._read_executor, conn.execute, sql, params)
+            while True:
+                rows = await loop.run_in_executor(self._read_executor, cursor.fetchmany, chunk_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            await loop.run_in_executor(self._read_executor, conn.close)
+    
+    def write_sync(self, func: Callable[..., Any], *args) -> Any:
+        """Blocking variant of write() for startup code and worker threads."""
+        return self._write_executor.submit(self._run_write, func, *args).result()
+    
+    def close(self):
+        """Close all connections and stop the worker threads."""
+        self._read_executor.shutdown(wait=True)
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        self._reader_count = 0
+        
+        def close_writer():
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        
+        self._write_executor.submit(close_writer).result()
+        self._write_executor.shutdown(wait=True)
+        logger.info("Database connections closed")
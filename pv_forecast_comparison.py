@@ -5,37 +5,92 @@ Compares PV production forecasts with actual production data.
 """
 
 import os
-import sys
 import json
+import asyncio
 import sqlite3
 import logging
-import requests
+import time
 from datetime import datetime, date
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from ha_client import HAClient
+from pv_database import PVDatabase
+from entity_resolver import EntityResolver, classify
+from db_stats import create_stats_table, drop_stats_triggers
+from rollups import (create_rollup_tables, rebuild_rollups, rollups_need_rebuild,
+                     update_comparison_rollups)
+import resilience
+from sites import DEFAULT_SITE, Site, load_sites
+import tracing
+from telemetry import CACHE_REQUESTS, COLLECTION_SECONDS, FALLBACK_DEPTH
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/data/pv_forecast.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Comparison tables. Rows are unique per site, and these unique keys are the
+# per-site indexes every retriever query goes through.
+COMPARISON_TABLES = {
+    'pv_forecast': '''
+        CREATE TABLE IF NOT EXISTS pv_forecast (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            time_slot TEXT NOT NULL,
+            forecast_wh REAL,
+            actual_wh REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            provider TEXT,
+            site TEXT NOT NULL DEFAULT 'default',
+            UNIQUE(site, date, time_slot)
+        )
+    ''',
+    'daily_production': '''
+        CREATE TABLE IF NOT EXISTS daily_production (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            total_forecast_wh REAL,
+            total_actual_wh REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            provider TEXT,
+            site TEXT NOT NULL DEFAULT 'default',
+            UNIQUE(site, date)
+        )
+    '''
+}
+
 class PVForecastComparison:
     """Main class for PV forecast comparison functionality."""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], session=None, state_stream=None,
+                 db: Optional[PVDatabase] = None, events=None):
         """Initialize the PV forecast comparison system."""
         self.config = config
-        self.db_path = '/data/pv_forecast.db'
+        self.db_path = config.get('db_path', '/data/pv_forecast.db')
+        self.db = db or PVDatabase(self.db_path)
         self.ha_url = config.get('ha_url', 'http://supervisor/core')
         self.ha_token = config.get('ha_token', '')
-        self.forecast_entities = config.get('forecast_entities', [])
-        self.production_entities = config.get('production_entities', [])
-        self.daily_entities = config.get('daily_entities', [])
+        self.sites = load_sites(config)
+        # Sites collected at the same time, and the time limit of one collection across all of them
+        self.site_concurrency = max(1, config.get('site_concurrency', 8))
+        self.collection_deadline = config.get('collection_deadline', 120)
+        self.ha_client = HAClient(
+            self.ha_url,
+            self.ha_token,
+            session=session,
+            max_concurrency=config.get('max_concurrent_requests', 4),
+            timeout=config.get('request_timeout', 10),
+            retries=config.get('request_retries', 2),
+            failure_threshold=config.get('circuit_breaker_threshold', 5),
+            reset_timeout=config.get('circuit_breaker_reset', 60)
+        )
+        # 'per_entity', 'snapshot' or 'auto' (snapshot once the entity list is large enough)
+        self.collection_mode = config.get('collection_mode', 'auto')
+        self.snapshot_threshold = config.get('snapshot_threshold', 8)
+        # Remembers missing entities and the entity of each chain that last had a value
+        self.resolver = EntityResolver(config.get('entity_cache_ttl', 3600))
+        self.entity_discovery = config.get('entity_discovery', True)
+        # Optional HAStateStream; while it is live, values are read from it without network I/O
+        self.state_stream = state_stream
+        # Optional EventBroadcaster notified after every stored row
+        self.events = events
         
         # Initialize database
         self.init_database()
@@ -43,169 +98,374 @@ class PVForecastComparison:
     def init_database(self):
         """Initialize the SQLite database."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create pv_forecast table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS pv_forecast (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT NOT NULL,
-                    time_slot TEXT NOT NULL,
-                    forecast_wh REAL,
-                    actual_wh REAL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(date, time_slot)
-                )
-            ''')
-            
-            # Create daily_production table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS daily_production (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT NOT NULL,
-                    total_forecast_wh REAL,
-                    total_actual_wh REAL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(date)
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            self.db.write_sync(self._create_tables)
             logger.info("Database initialized successfully")
             
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
     
-    def get_ha_data(self, entity_id: str) -> Optional[float]:
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        """Create the add-on tables if they do not exist."""
+        cursor = conn.cursor()
+        
+        # Create pv_forecast and daily_production, moving tables from before sites existed
+        for table, create in COMPARISON_TABLES.items():
+            PVForecastComparison._migrate_to_sites(conn, table)
+            cursor.execute(create)
+        
+        # Create pv_samples table (high-resolution entity values, ts in Unix seconds)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pv_samples (
+                entity_id TEXT NOT NULL,
+                ts REAL NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (entity_id, ts)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Create hourly/daily/monthly rollups and build them once for existing data
+        create_rollup_tables(conn)
+        if rollups_need_rebuild(conn):
+            logger.info("Building rollup tables from existing data")
+            rebuild_rollups(conn)
+        
+        # Create db_stats, kept current by triggers on the data tables
+        create_stats_table(conn)
+    
+    @staticmethod
+    def _migrate_to_sites(conn: sqlite3.Connection, table: str):
+        """Rebuild a comparison table created before sites existed.
+        
+        The unique key has to include the site, and SQLite can only change it
+        by copying the rows into a new table. The existing rows (which may
+        also predate the provider column) all belong to the default site.
+        """
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if not columns or 'site' in columns:
+            return
+        logger.info(f"Adding the site column to {table}")
+        drop_stats_triggers(conn, table)
+        conn.execute(f'ALTER TABLE {table} RENAME TO {table}_before_sites')
+        conn.execute(COMPARISON_TABLES[table])
+        column_list = ', '.join(columns)
+        conn.execute(f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {table}_before_sites')
+        conn.execute(f'DROP TABLE {table}_before_sites')
+    
+    @property
+    def all_entities(self) -> List[str]:
+        """All configured entities across the fallback chains of every site."""
+        return list(dict.fromkeys(entity for site in self.sites for entity in site.all_entities))
+    
+    def get_site(self, name: str) -> Optional[Site]:
+        """The configured site with this name, or None."""
+        return next((site for site in self.sites if site.name == name), None)
+    
+    async def get_ha_data(self, entity_id: str) -> Optional[float]:
         """Get data from Home Assistant API."""
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.ha_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            url = f"{self.ha_url}/api/states/{entity_id}"
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                state = data.get('state')
-                if state and state != 'unavailable' and state != 'unknown':
-                    try:
-                        return float(state)
-                    except (ValueError, TypeError):
-                        logger.warning(f"Could not convert state '{state}' to float for {entity_id}")
-                        return None
-            else:
-                logger.warning(f"Failed to get data for {entity_id}: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error getting data for {entity_id}: {e}")
-            
-        return None
+        return await self.ha_client.get_value(entity_id)
     
-    def get_forecast_data(self) -> Optional[float]:
-        """Get PV forecast data from Home Assistant."""
-        for entity in self.forecast_entities:
-            value = self.get_ha_data(entity)
-            if value is not None:
-                logger.info(f"Found forecast data: {value}Wh from {entity}")
-                return value
+    async def discover_entities(self) -> bool:
+        """Scan /api/states once for energy and power sensors and check the configured entities.
         
-        logger.warning("No forecast data found from any configured entities")
-        return None
+        Configured entities that do not exist or are unavailable are cached
+        as missing. With a single site, a chain none of whose entities exist
+        is extended by the discovered sensors that fit it, and the state
+        stream is resubscribed to include them. Returns False if the states
+        could not be fetched.
+        """
+        configured = set(self.all_entities)
+        states = await self.ha_client.find_states(
+            lambda state_obj: state_obj.get('entity_id') in configured or classify(state_obj) is not None)
+        if states is None:
+            logger.warning("Entity discovery failed, retrying at the next collection")
+            return False
+        self.resolver.discover(states, configured)
+        logger.info(f"Discovered {len(self.resolver.candidates)} energy and power sensors, "
+                    f"{len(configured) - len(self.resolver.viable(configured))} of "
+                    f"{len(configured)} configured entities are missing or unavailable")
+        
+        if len(self.sites) == 1:
+            site = self.sites[0]
+            for chain, entities in (('forecast', site.forecast_entities),
+                                    ('production', site.production_entities),
+                                    ('daily', site.daily_entities)):
+                if self.resolver.viable(entities):
+                    continue
+                found = [entity for entity in self.resolver.candidates_for(chain) if entity not in entities]
+                if found:
+                    logger.info(f"No configured {chain} entity exists, using discovered {', '.join(found)}")
+                    entities.extend(found)
+            if self.state_stream is not None:
+                # Entities added to the chains must be subscribed to, or they would never be read
+                await self.state_stream.set_entities(self.all_entities)
+        return True
+    
+    def use_snapshot(self, entities: List[str]) -> bool:
+        """Decide whether a single /api/states snapshot beats per-entity requests."""
+        if self.collection_mode == 'snapshot':
+            return True
+        if self.collection_mode == 'auto':
+            return len(self.resolver.viable(set(entities))) >= self.snapshot_threshold
+        return False
     
-    def get_production_data(self) -> Optional[float]:
-        """Get current PV production data from Home Assistant."""
-        for entity in self.production_entities:
-            value = self.get_ha_data(entity)
+    async def resolve_chain(self, chain: List[str]) -> Dict[str, Optional[float]]:
+        """Request a fallback chain's entities one at a time, in the resolver's order, until one has a value.
+        
+        Entities that do not exist or have no numeric state are cached as
+        missing; failed requests are not. In steady state a chain takes one
+        request.
+        """
+        values = {}
+        for attempt, entity in enumerate(self.resolver.order(chain)):
+            state_obj = await self.ha_client.get_state(entity)
+            value = self.ha_client.parse_state(state_obj, entity)
+            values[entity] = value
             if value is not None:
-                logger.info(f"Found production data: {value}Wh from {entity}")
-                return value
+                self.resolver.record_success(chain, entity)
+                CACHE_REQUESTS.inc(cache='entity_resolver', result='hit' if attempt == 0 else 'miss')
+                return values
+            if state_obj is not None:
+                self.resolver.mark_missing(entity)
+        CACHE_REQUESTS.inc(cache='entity_resolver', result='miss')
+        return values
+    
+    async def fetch_entity_values(self, entities: List[str],
+                                  chains: Optional[List[List[str]]] = None) -> Dict[str, Optional[float]]:
+        """Fetch the current values of all given entities.
         
-        logger.warning("No production data found from any configured entities")
-        return None
+        Reads from the WebSocket state stream when it is live. Otherwise uses
+        one /api/states snapshot for long entity lists (see use_snapshot) and
+        per-entity requests for short ones (or if the snapshot fails). Given
+        the fallback chains the entities form, per-entity requests resolve
+        each chain concurrently, stopping at its first value; entities not
+        requested are None.
+        """
+        if self.state_stream is not None:
+            values = self.state_stream.get_values(entities)
+            CACHE_REQUESTS.inc(cache='state_stream', result='miss' if values is None else 'hit')
+            if values is not None:
+                return values
+            logger.info("State stream not live, falling back to REST API")
+        if self.use_snapshot(entities):
+            values = await self.ha_client.get_snapshot_values(entities)
+            if values is not None:
+                return values
+            logger.warning("State snapshot failed, falling back to per-entity requests")
+        if chains is None:
+            return await self.ha_client.get_values(entities)
+        values = {}
+        for chain_values in await asyncio.gather(*(self.resolve_chain(chain) for chain in chains)):
+            values.update(chain_values)
+        return values
+    
+    @staticmethod
+    def first_entity(entities: List[str], values: Dict[str, Optional[float]]) -> Optional[str]:
+        """Return the first entity of a fallback chain that has a value."""
+        return next((entity for entity in entities if values.get(entity) is not None), None)
     
-    def get_daily_pv_production(self) -> Optional[float]:
-        """Get daily PV production data from Home Assistant."""
-        for entity in self.daily_entities:
-            value = self.get_ha_data(entity)
+    def _first_value(self, entities: List[str], values: Dict[str, Optional[float]],
+                     label: str) -> Optional[float]:
+        """Return the first available value of a fallback chain."""
+        for depth, entity in enumerate(entities):
+            value = values.get(entity)
             if value is not None:
-                logger.info(f"Found daily production data: {value}Wh from {entity}")
+                logger.info(f"Found {label} data: {value}Wh from {entity}")
+                FALLBACK_DEPTH.inc(chain=label, depth=depth)
                 return value
         
-        logger.warning("No daily production data found from any configured entities")
+        logger.warning(f"No {label} data found from any configured entities")
+        FALLBACK_DEPTH.inc(chain=label, depth='none')
         return None
     
-    def store_forecast_data(self, time_slot: str, forecast_wh: float, actual_wh: float):
+    async def get_forecast_data(self, values: Optional[Dict[str, Optional[float]]] = None,
+                                site: Optional[Site] = None) -> Optional[float]:
+        """Get PV forecast data of a site (default: the first) from Home Assistant."""
+        entities = (site or self.sites[0]).forecast_entities
+        if values is None:
+            values = await self.fetch_entity_values(entities, [entities])
+        return self._first_value(entities, values, 'forecast')
+    
+    async def get_production_data(self, values: Optional[Dict[str, Optional[float]]] = None,
+                                  site: Optional[Site] = None) -> Optional[float]:
+        """Get current PV production data of a site (default: the first) from Home Assistant."""
+        entities = (site or self.sites[0]).production_entities
+        if values is None:
+            values = await self.fetch_entity_values(entities, [entities])
+        return self._first_value(entities, values, 'production')
+    
+    async def get_daily_pv_production(self, values: Optional[Dict[str, Optional[float]]] = None,
+                                      site: Optional[Site] = None) -> Optional[float]:
+        """Get daily PV production data of a site (default: the first) from Home Assistant."""
+        entities = (site or self.sites[0]).daily_entities
+        if values is None:
+            values = await self.fetch_entity_values(entities, [entities])
+        return self._first_value(entities, values, 'daily production')
+    
+    def publish(self, event: str, data: Dict[str, Any]):
+        """Push a change to connected dashboards, if an event channel is attached."""
+        if self.events is not None:
+            self.events.publish(event, data)
+    
+    async def store_forecast_data(self, time_slot: str, forecast_wh: float, actual_wh: float,
+                                  provider: Optional[str] = None, site: str = DEFAULT_SITE):
         """Store forecast and actual data in the database."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             today = date.today().isoformat()
             
-            cursor.execute('''
-                INSERT OR REPLACE INTO pv_forecast 
-                (date, time_slot, forecast_wh, actual_wh) 
-                VALUES (?, ?, ?, ?)
-            ''', (today, time_slot, forecast_wh, actual_wh))
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"Stored data for {time_slot}: forecast={forecast_wh}Wh, actual={actual_wh}Wh")
+            await self.db.write(self._insert_forecast, today, time_slot, forecast_wh, actual_wh, provider, site)
+            logger.info(f"Stored data for {site} {time_slot}: forecast={forecast_wh}Wh, actual={actual_wh}Wh")
+            self.publish('slot', {'site': site, 'date': today, 'time_slot': time_slot,
+                                  'forecast': forecast_wh, 'actual': actual_wh})
             
         except Exception as e:
             logger.error(f"Error storing forecast data: {e}")
     
-    def store_daily_production(self, forecast_wh: float, actual_wh: float):
+    @staticmethod
+    def _insert_forecast(conn: sqlite3.Connection, day: str, time_slot: str,
+                         forecast_wh: float, actual_wh: float, provider: Optional[str] = None,
+                         site: str = DEFAULT_SITE):
+        """Insert or update one time slot row and refresh its rollups."""
+        conn.execute('''
+            INSERT INTO pv_forecast 
+            (site, date, time_slot, forecast_wh, actual_wh, provider) 
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(site, date, time_slot) DO UPDATE SET
+                forecast_wh = excluded.forecast_wh,
+                actual_wh = excluded.actual_wh,
+                provider = excluded.provider,
+                timestamp = CURRENT_TIMESTAMP
+        ''', (site, day, time_slot, forecast_wh, actual_wh, provider))
+        update_comparison_rollups(conn, [day], site)
+    
+    async def store_daily_production(self, forecast_wh: float, actual_wh: float,
+                                     provider: Optional[str] = None, site: str = DEFAULT_SITE):
         """Store daily production totals in the database."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             today = date.today().isoformat()
             
-            cursor.execute('''
-                INSERT OR REPLACE INTO daily_production 
-                (date, total_forecast_wh, total_actual_wh) 
-                VALUES (?, ?, ?)
-            ''', (today, forecast_wh, actual_wh))
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"Stored daily production: forecast={forecast_wh}Wh, actual={actual_wh}Wh")
+            await self.db.write(self._insert_daily, today, forecast_wh, actual_wh, provider, site)
+            logger.info(f"Stored daily production for {site}: forecast={forecast_wh}Wh, actual={actual_wh}Wh")
+            self.publish('daily', {'site': site, 'date': today, 'forecast': forecast_wh, 'actual': actual_wh})
             
         except Exception as e:
             logger.error(f"Error storing daily production: {e}")
     
-    def collect_data(self, time_slot: str):
+    @staticmethod
+    def _insert_daily(conn: sqlite3.Connection, day: str, forecast_wh: float, actual_wh: float,
+                      provider: Optional[str] = None, site: str = DEFAULT_SITE):
+        """Insert or update one daily totals row and refresh its rollups."""
+        conn.execute('''
+            INSERT INTO daily_production 
+            (site, date, total_forecast_wh, total_actual_wh, provider) 
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(site, date) DO UPDATE SET
+                total_forecast_wh = excluded.total_forecast_wh,
+                total_actual_wh = excluded.total_actual_wh,
+                provider = excluded.provider,
+                timestamp = CURRENT_TIMESTAMP
+        ''', (site, day, forecast_wh, actual_wh, provider))
+        update_comparison_rollups(conn, [day], site)
+    
+    async def collect_data(self, time_slot: str):
         """Collect forecast and actual data for a specific time slot."""
+        start = time.perf_counter()
+        result = 'error'
+        with tracing.span('collect', time_slot=time_slot) as span, resilience.deadline(self.collection_deadline):
+            try:
+                collected = await self._collect_data(time_slot)
+                result = 'ok' if collected else 'failed'
+                return collected
+            finally:
+                COLLECTION_SECONDS.observe(time.perf_counter() - start, time_slot=time_slot, result=result)
+                span.set(result=result)
+    
+    async def _collect_data(self, time_slot: str) -> bool:
+        """Collect every site in parallel, at most site_concurrency at a time and within the deadline.
+        
+        Returns True only if every site was collected. Home Assistant
+        requests time out and stop retrying within the deadline budget; sites
+        still running at the deadline are cancelled and count as failed.
+        """
         logger.info(f"Collecting data for time slot: {time_slot}")
         
-        # Get forecast data
-        forecast_wh = self.get_forecast_data()
-        if forecast_wh is None:
-            logger.error("Could not get forecast data")
-            return False
+        if self.entity_discovery and not self.resolver.discovered:
+            with tracing.span('collect.discover'):
+                await self.discover_entities()
         
-        # Get actual production data
-        actual_wh = self.get_production_data()
-        if actual_wh is None:
-            logger.warning("Could not get actual production data, using 0")
-            actual_wh = 0
+        # For many sites one /api/states snapshot (or stream read) serves them all
+        values = None
+        if len(self.sites) > 1:
+            entities = list(dict.fromkeys(entity for site in self.sites
+                                          for entity in site.slot_entities(time_slot)))
+            if self.use_snapshot(entities):
+                with tracing.span('collect.fetch', entities=len(entities)):
+                    values = await self.fetch_entity_values(entities)
         
-        # Store the data
-        self.store_forecast_data(time_slot, forecast_wh, actual_wh)
+        semaphore = asyncio.Semaphore(self.site_concurrency)
         
-        # For 11pm, store daily totals (complete day data)
-        if time_slot == '11pm':
-            daily_actual = self.get_daily_pv_production()
-            if daily_actual is not None:
-                logger.info(f"Daily production: {daily_actual}Wh")
-                self.store_daily_production(forecast_wh, daily_actual)
+        async def collect(site: Site) -> bool:
+            async with semaphore:
+                return await self.collect_site(site, time_slot, values)
         
+        tasks = {asyncio.create_task(collect(site)): site for site in self.sites}
+        done, pending = await asyncio.wait(tasks, timeout=resilience.remaining())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        
+        failed = []
+        for task, site in tasks.items():
+            if task in pending:
+                logger.error(f"Site {site.name} not collected within {self.collection_deadline} s")
+            elif task.exception() is not None:
+                logger.error(f"Error collecting site {site.name}: {task.exception()!r}")
+            elif task.result():
+                continue
+            failed.append(site.name)
+        
+        if failed:
+            logger.warning(f"Data collection for {time_slot} failed for {len(failed)} of "
+                           f"{len(self.sites)} site(s): {', '.join(failed)}")
+            return False
         logger.info(f"Data collection completed for {time_slot}")
-        return True 
\ No newline at end of file
+        return True
+    
+    async def collect_site(self, site: Site, time_slot: str,
+                           values: Optional[Dict[str, Optional[float]]] = None) -> bool:
+        """Fetch, store and publish one site's values for a time slot.
+        
+        values may hold entity values already fetched for several sites;
+        otherwise the site's entities are fetched with fetch_entity_values.
+        """
+        with tracing.span('collect.site', site=site.name):
+            if values is None:
+                entities = site.slot_entities(time_slot)
+                with tracing.span('collect.fetch', entities=len(entities)):
+                    values = await self.fetch_entity_values(entities, site.slot_chains(time_slot))
+            
+            # Get forecast data
+            forecast_wh = await self.get_forecast_data(values, site)
+            if forecast_wh is None:
+                logger.error(f"Could not get forecast data for site {site.name}")
+                return False
+            
+            # Get actual production data
+            actual_wh = await self.get_production_data(values, site)
+            if actual_wh is None:
+                logger.warning(f"Could not get actual production data for site {site.name}, using 0")
+                actual_wh = 0
+            
+            # Store the data
+            provider = self.first_entity(site.forecast_entities, values)
+            with tracing.span('collect.store', provider=provider):
+                await self.store_forecast_data(time_slot, forecast_wh, actual_wh, provider, site.name)
+            
+            # For 11pm, store daily totals (complete day data)
+            if time_slot == '11pm':
+                with tracing.span('collect.daily'):
+                    daily_actual = await self.get_daily_pv_production(values, site)
+                    if daily_actual is not None:
+                        logger.info(f"Daily production of site {site.name}: {daily_actual}Wh")
+                        await self.store_daily_production(forecast_wh, daily_actual, provider, site.name)
+            return True
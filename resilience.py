@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Resilience
+Deadline budgets, adaptive timeouts, retry backoff and a circuit breaker for Home Assistant requests.
+"""
+
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Monotonic time by which the current collection must be done, or None
+_deadline: ContextVar[Optional[float]] = ContextVar('pv_deadline', default=None)
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Limit everything inside (also tasks it creates) to seconds; nested budgets keep the tighter one."""
+    if not seconds:
+        yield
+        return
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(end if outer is None else min(outer, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left of the current deadline budget, or None without one."""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+class AdaptiveTimeout:
+    """Per-endpoint request timeouts derived from observed latency.
+    
+    Keeps a smoothed latency and its mean deviation per endpoint as TCP does
+    for its retransmission timeout (RFC 6298): the timeout is the latency
+    plus four deviations, between minimum and maximum. Until an endpoint
+    has answered once it gets initial, and every retry doubles the timeout.
+    """
+    
+    def __init__(self, initial: float = 10, minimum: float = 1, maximum: Optional[float] = None):
+        """Initialize without observations."""
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        # Per endpoint: (smoothed latency, mean deviation)
+        self._estimates: Dict[str, Tuple[float, float]] = {}
+    
+    def observe(self, endpoint: str, seconds: float):
+        """Record the latency of a successful request."""
+        estimate = self._estimates.get(endpoint)
+        if estimate is None:
+            self._estimates[endpoint] = (seconds, seconds / 2)
+            return
+        latency, deviation = estimate
+        deviation = 0.75 * deviation + 0.25 * abs(latency - seconds)
+        latency = 0.875 * latency + 0.125 * seconds
+        self._estimates[endpoint] = (latency, deviation)
+    
+    def timeout(self, endpoint: str, attempt: int = 0) -> float:
+        """Timeout of an endpoint's request; attempt counts the retries so far."""
+        estimate = self._estimates.get(endpoint)
+        if estimate is None:
+            base = self.initial
+        else:
+            latency, deviation = estimate
+            base = max(self.minimum, latency + 4 * deviation)
+        return min(self.maximum, base * 2 ** attempt)
+    
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """Current estimates and timeouts per endpoint."""
+        return {endpoint: {'latency': round(latency, 4), 'deviation': round(deviation, 4),
+                           'timeout': round(self.timeout(endpoint), 3)}
+                for endpoint, (latency, deviation) in self._estimates.items()}
+
+class Backoff:
+    """Exponential backoff with full jitter between retries."""
+    
+    def __init__(self, base: float = 0.5, maximum: float = 10, rng: Optional[random.Random] = None):
+        """Initialize the backoff."""
+        self.base = base
+        self.maximum = maximum
+        self.rng = rng or random.Random()
+    
+    def delay(self, retry: int) -> float:
+        """Seconds to wait before retry number retry (1 is the first)."""
+        return self.rng.uniform(0, min(self.maximum, self.base * 2 ** (retry - 1)))
+
+class CircuitBreaker:
+    """Fails requests fast while Home Assistant keeps failing.
+    
+    After failure_threshold consecutive transient failures the circuit
+    opens and requests are rejected without touching the network. After
+    reset_timeout seconds a single probe request is let through (half-open):
+    its success closes the circuit, its failure opens it again.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60,
+                 clock: Callable[[], float] = time.monotonic):
+        """Initialize a closed circuit."""
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+    
+    @property
+    def state(self) -> str:
+        """closed, open, or half_open once reset_timeout has passed since opening."""
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+    
+    def allow(self) -> bool:
+        """Whether a request may go out now; in half-open state only one probe at a time."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+    
+    def record_success(self):
+        """A request reached Home Assistant; close the circuit."""
+        if self._opened_at is not None:
+            logger.info("Home Assistant is answering again, closing the circuit")
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+    
+    def record_failure(self):
+        """A request failed transiently; open the circuit at the threshold or after a failed probe."""
+        self.failures += 1
+        if self._probing or (self._opened_at is None and self.failures >= self.failure_threshold):
+            logger.warning(f"Home Assistant failed {self.failures} time(s) in a row, "
+                           f"failing requests fast for {self.reset_timeout:g} s")
+            self._opened_at = self.clock()
+        self._probing = False
+    
+    def release(self):
+        """A request ended without an outcome (cancelled or invalid); free the probe slot."""
+        self._probing = False
+    
+    def to_dict(self) -> Dict[str, object]:
+        """State for the status API."""
+        return {'state': self.state, 'consecutive_failures': self.failures}
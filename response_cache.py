@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+In-process cache of serialized API responses, invalidated by database writes.
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from telemetry import CACHE_REQUESTS
+
+class CachedResponse:
+    """A serialized response body with its strong ETag."""
+    
+    __slots__ = ('body', 'etag', 'generation')
+    
+    def __init__(self, body: bytes, generation: int):
+        """Initialize the entry and derive the ETag from the body."""
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.generation = generation
+    
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header value matches this entry."""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            # If-None-Match uses weak comparison, so a W/ prefix is ignored
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == '*' or tag == self.etag:
+                return True
+        return False
+
+class ResponseCache:
+    """LRU cache of responses keyed by endpoint and parameters.
+    
+    Entries remember the database generation they were built from and are
+    treated as missing once any write has bumped the generation.
+    """
+    
+    def __init__(self, max_entries: int = 64, max_bytes: int = 2 * 1024 * 1024):
+        """Initialize the cache with entry count and total size limits."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, CachedResponse]' = OrderedDict()
+    
+    def get(self, key: Hashable, generation: int) -> Optional[CachedResponse]:
+        """Return the entry for key if it was built from the current generation."""
+        entry = self._entries.get(key)
+        if entry is None or entry.generation != generation:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache='response', result='miss')
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        CACHE_REQUESTS.inc(cache='response', result='hit')
+        return entry
+    
+    def put(self, key: Hashable, generation: int, body: bytes) -> CachedResponse:
+        """Store a response body and evict least recently used entries over the limits."""
+        entry = CachedResponse(body, generation)
+        if key in self._entries:
+            self._remove(key)
+        if len(body) > self.max_bytes:
+            return entry
+        self._entries[key] = entry
+        self.size += len(body)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        return entry
+    
+    def clear(self):
+        """Drop all entries."""
+        self._entries.clear()
+        self.size = 0
+    
+    def _remove(self, key: Hashable):
+        """Remove one entry and update the size."""
+        entry = self._entries.pop(key)
+        self.size -= len(entry.body)
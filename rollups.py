@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+PV Rollups
+Incrementally maintained hourly, daily and monthly aggregate tables.
+"""
+
+import sqlite3
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sites import DEFAULT_SITE
+
+# Series name of the daily_production comparison; time slot series are 'slot:<time_slot>'
+DAILY_SERIES = 'daily_production'
+SLOT_SERIES_PREFIX = 'slot:'
+# Comparison series of other sites than the default one are prefixed 'site/<name>/'
+SITE_SERIES_PREFIX = 'site/'
+
+ROLLUP_TABLES = ('rollup_hourly', 'rollup_daily', 'rollup_monthly')
+
+# Bucket formats: hourly 'YYYY-MM-DDTHH', daily 'YYYY-MM-DD', monthly 'YYYY-MM' (local time)
+HOUR_FORMAT = '%Y-%m-%dT%H'
+
+AGGREGATE_COLUMNS = '''
+    SUM(value_sum), MIN(value_min), MAX(value_max), SUM(value_count),
+    SUM(forecast_sum), SUM(actual_sum), SUM(error_sum),
+    SUM(abs_error_sum), SUM(sq_error_sum), SUM(error_count)
+'''
+
+def create_rollup_tables(conn: sqlite3.Connection):
+    """Create the rollup tables if they do not exist."""
+    for table in ROLLUP_TABLES:
+        # value_* aggregate sample series, the other columns forecast-vs-actual series
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                series TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                value_sum REAL,
+                value_min REAL,
+                value_max REAL,
+                value_count INTEGER NOT NULL DEFAULT 0,
+                forecast_sum REAL,
+                actual_sum REAL,
+                error_sum REAL,
+                abs_error_sum REAL,
+                sq_error_sum REAL,
+                error_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (series, bucket)
+            ) WITHOUT ROWID
+        ''')
+    # Comparison updates look up all series of one site and day
+    conn.execute('CREATE INDEX IF NOT EXISTS rollup_daily_bucket ON rollup_daily (bucket, series)')
+
+def site_series(site: str, series: str) -> str:
+    """Rollup series name of a comparison series of a site (the default site keeps the plain names)."""
+    if site == DEFAULT_SITE:
+        return series
+    return f'{SITE_SERIES_PREFIX}{site}/{series}'
+
+def _prefix_range(prefix: str) -> Tuple[str, str]:
+    """Bounds [first, end) of the strings starting with prefix, usable by an index range scan."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def _month_bounds(month: str) -> Tuple[str, str]:
+    """First and last possible daily bucket of a 'YYYY-MM' month."""
+    return f'{month}-01', f'{month}-31'
+
+def _rollup_months(conn: sqlite3.Connection, keys: Set[Tuple[str, str]]):
+    """Recompute monthly buckets from the daily rollup for (series, month) keys."""
+    for series, month in sorted(keys):
+        first, last = _month_bounds(month)
+        conn.execute('DELETE FROM rollup_monthly WHERE series = ? AND bucket = ?', (series, month))
+        conn.execute(f'''
+            INSERT INTO rollup_monthly
+            SELECT series, ?, {AGGREGATE_COLUMNS}
+            FROM rollup_daily
+            WHERE series = ? AND bucket BETWEEN ? AND ?
+            GROUP BY series
+        ''', (month, series, first, last))
+
+def update_sample_rollups(conn: sqlite3.Connection, rows: Iterable[Tuple[str, float, float]]):
+    """Update the buckets touched by newly inserted (entity_id, ts, value) samples.
+    
+    Only the affected hours are re-aggregated from pv_samples, then only the
+    affected days from those hours and the affected months from those days.
+    Recomputing whole buckets keeps the result exact even when a batch
+    contains samples that already existed.
+    """
+    hours: Set[Tuple[str, datetime]] = set()
+    for entity_id, ts, _ in rows:
+        local = datetime.fromtimestamp(ts)
+        hours.add((entity_id, local.replace(minute=0, second=0, microsecond=0)))
+    if not hours:
+        return
+    
+    days: Set[Tuple[str, str]] = set()
+    for entity_id, hour in sorted(hours):
+        # Naive local arithmetic makes a repeated DST hour cover both occurrences
+        start = hour.timestamp()
+        end = (hour + timedelta(hours=1)).timestamp()
+        conn.execute('''
+            INSERT OR REPLACE INTO rollup_hourly
+                (series, bucket, value_sum, value_min, value_max, value_count)
+            SELECT entity_id, ?, SUM(value), MIN(value), MAX(value), COUNT(*)
+            FROM pv_samples
+            WHERE entity_id = ? AND ts >= ? AND ts < ?
+            GROUP BY entity_id
+        ''', (hour.strftime(HOUR_FORMAT), entity_id, start, end))
+        days.add((entity_id, hour.date().isoformat()))
+    
+    months: Set[Tuple[str, str]] = set()
+    for series, day in sorted(days):
+        conn.execute(f'''
+            INSERT OR REPLACE INTO rollup_daily
+            SELECT series, ?, {AGGREGATE_COLUMNS}
+            FROM rollup_hourly
+            WHERE series = ? AND bucket BETWEEN ? AND ?
+            GROUP BY series
+        ''', (day, series, f'{day}T00', f'{day}T23'))
+        months.add((series, day[:7]))
+    
+    _rollup_months(conn, months)
+
+def update_comparison_rollups(conn: sqlite3.Connection, days: Iterable[str], site: str = DEFAULT_SITE):
+    """Update the forecast-vs-actual buckets of the given days of one site.
+    
+    Covers the daily_production totals and every time slot of pv_forecast.
+    Only the site's own rows and series are read and rewritten, through the
+    (site, date) unique indexes.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    
+    daily_series = site_series(site, DAILY_SERIES)
+    slot_prefix = site_series(site, SLOT_SERIES_PREFIX)
+    series_filter = '(series = ? OR (series >= ? AND series < ?))'
+    series_params = (daily_series, *_prefix_range(slot_prefix))
+    months: Set[Tuple[str, str]] = set()
+    for day in days:
+        # Months of series that had or now have a row for this day must be refreshed
+        previous = conn.execute(f'SELECT series FROM rollup_daily WHERE bucket = ? AND {series_filter}',
+                                (day, *series_params)).fetchall()
+        conn.execute(f'DELETE FROM rollup_daily WHERE bucket = ? AND {series_filter}',
+                     (day, *series_params))
+        conn.execute('''
+            INSERT INTO rollup_daily
+                (series, bucket, forecast_sum, actual_sum, error_sum,
+                 abs_error_sum, sq_error_sum, error_count)
+            SELECT ?, date, total_forecast_wh, total_actual_wh,
+                   total_actual_wh - total_forecast_wh,
+                   ABS(total_actual_wh - total_forecast_wh),
+                   (total_actual_wh - total_forecast_wh) * (total_actual_wh - total_forecast_wh),
+                   total_actual_wh IS NOT NULL AND total_forecast_wh IS NOT NULL
+            FROM daily_production
+            WHERE site = ? AND date = ?
+        ''', (daily_series, site, day))
+        conn.execute('''
+            INSERT INTO rollup_daily
+                (series, bucket, forecast_sum, actual_sum, error_sum,
+                 abs_error_sum, sq_error_sum, error_count)
+            SELECT ? || time_slot, date, forecast_wh, actual_wh,
+                   actual_wh - forecast_wh,
+                   ABS(actual_wh - forecast_wh),
+                   (actual_wh - forecast_wh) * (actual_wh - forecast_wh),
+                   actual_wh IS NOT NULL AND forecast_wh IS NOT NULL
+            FROM pv_forecast
+            WHERE site = ? AND date = ?
+        ''', (slot_prefix, site, day))
+        current = conn.execute(f'SELECT series FROM rollup_daily WHERE bucket = ? AND {series_filter}',
+                               (day, *series_params)).fetchall()
+        months.update((series, day[:7]) for (series,) in previous + current)
+    
+    _rollup_months(conn, months)
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """Rebuild all rollups from the raw tables (used once for existing databases)."""
+    for table in ROLLUP_TABLES:
+        conn.execute(f'DELETE FROM {table}')
+    
+    site_days: Dict[str, List[str]] = {}
+    for site, day in conn.execute('''
+        SELECT site, date FROM daily_production
+        UNION
+        SELECT site, date FROM pv_forecast
+    '''):
+        site_days.setdefault(site, []).append(day)
+    for site, days in site_days.items():
+        update_comparison_rollups(conn, days, site)
+    
+    cursor = conn.execute('SELECT entity_id, ts, value FROM pv_samples ORDER BY entity_id, ts')
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        update_sample_rollups(conn, rows)
+
+def rollups_need_rebuild(conn: sqlite3.Connection) -> bool:
+    """Whether raw data exists but the rollups have never been built."""
+    if conn.execute('SELECT 1 FROM rollup_daily LIMIT 1').fetchone():
+        return False
+    return any(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone()
+               for table in ('daily_production', 'pv_forecast', 'pv_samples'))
+
+def choose_resolution(start: date, end: date) -> str:
+    """Pick the coarsest rollup that still gives a useful number of points for a range."""
+    days = (end - start).days + 1
+    if days <= 2:
+        return 'hour'
+    if days <= 366:
+        return 'day'
+    return 'month'
+
+def bucket_range(start: date, end: date, resolution: str) -> Tuple[str, str]:
+    """First and last bucket label covering a date range at a resolution."""
+    if resolution == 'hour':
+        return f'{start.isoformat()}T00', f'{end.isoformat()}T23'
+    if resolution == 'month':
+        return start.isoformat()[:7], end.isoformat()[:7]
+    return start.isoformat(), end.isoformat()
+
+def bucket_labels(start: date, end: date, resolution: str) -> List[str]:
+    """All bucket labels covering a date range, in order."""
+    labels = []
+    if resolution == 'month':
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            labels.append(f'{year:04d}-{month:02d}')
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    elif resolution == 'hour':
+        current = start
+        while current <= end:
+            labels.extend(f'{current.isoformat()}T{hour:02d}' for hour in range(24))
+            current += timedelta(days=1)
+    else:
+        current = start
+        while current <= end:
+            labels.append(current.isoformat())
+            current += timedelta(days=1)
+    return labels
+
+ROLLUP_TABLE_BY_RESOLUTION: Dict[str, str] = {
+    'hour': 'rollup_hourly',
+    'day': 'rollup_daily',
+    'month': 'rollup_monthly'
+}
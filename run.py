@@ -9,31 +9,67 @@ import sys
 import json
 import logging
 import asyncio
-import aiohttp
-from datetime import datetime
+import functools
+from aiohttp import web
+from datetime import datetime, date, timedelta
 import yaml
 
 # Add the app directory to Python path
 sys.path.append('/app')
 
 from pv_forecast_comparison import PVForecastComparison
+from ha_client import create_session
+from ha_websocket import HAStateStream, websocket_url
+from collection_queue import CollectionQueue
+from pv_database import PVDatabase
+from pv_data_retriever import PVDataRetriever
+from sample_buffer import SampleBuffer
+from response_cache import ResponseCache
+from event_stream import EventBroadcaster
+from static_bundle import StaticBundle, build_bundle
+from metrics import GROUP_BY, SOURCES
+from data_export import EXPORT_TABLES, FORMATS, ExportWriter, export_query
+from backfill import HistoryBackfill
+from recorder_import import RecorderImport
+import resilience
+import telemetry
+import tracing
+from profiler import Profiler
+from scheduler import IntervalRule, Scheduler, ScheduleStore, local_timezone, parse_rule
+from db_stats import update_table_sizes
+from sites import load_sites
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('/data/pv_forecast.log')
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging():
+    """Log to stdout and to /data/pv_forecast.log (only when run as the add-on, not on import)."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('/data/pv_forecast.log'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
 class PVForecastAddon:
-    def __init__(self):
-        self.config = self.load_config()
+    def __init__(self, config=None):
+        """Initialize the add-on with config, or with the add-on options if not given."""
+        self.config = self.load_config() if config is None else config
+        self.sites = load_sites(self.config)
         self.pv_comparison = None
+        self.db = None
+        self.retriever = None
         self.session = None
+        self.state_stream = None
+        self.sample_buffer = None
+        self.response_cache = ResponseCache()
+        self.events = EventBroadcaster()
+        self.profiler = Profiler(enabled=self.config.get('profiling', False))
+        self.collection_queue = None
+        self.backfill = None
+        self.recorder_import = None
+        self.scheduler = None
         
     def load_config(self):
         """Load configuration from add-on options."""
@@ -47,8 +83,12 @@ class PVForecastAddon:
             except Exception as e:
                 logger.error(f"Error loading config from options.json: {e}")
         
-        # Default configuration
         logger.info("Using default configuration")
+        return self.default_config()
+    
+    @staticmethod
+    def default_config():
+        """Default configuration, used without add-on options."""
         return {
             'ha_url': 'http://supervisor/core',
             'ha_token': '',
@@ -76,6 +116,29 @@ class PVForecastAddon:
                 '3pm': '15:00:00',
                 '11pm': '23:00:00'
             },
+            'max_concurrent_requests': 4,
+            'collection_mode': 'auto',
+            'snapshot_threshold': 8,
+            'websocket_ingestion': True,
+            'collection_workers': 1,
+            'site_concurrency': 8,
+            'collection_deadline': 120,
+            'request_timeout': 10,
+            'request_retries': 2,
+            'circuit_breaker_threshold': 5,
+            'circuit_breaker_reset': 60,
+            'entity_discovery': True,
+            'entity_cache_ttl': 3600,
+            'record_samples': True,
+            'sample_flush_rows': 500,
+            'sample_flush_interval': 30,
+            'backfill_concurrency': 2,
+            'backfill_requests_per_second': 2,
+            'schedule_jitter': 0,
+            'catch_up_window': 7200,
+            'tracing': False,
+            'slow_query_ms': 0,
+            'profiling': False,
             'log_level': 'INFO'
         }
     
@@ -87,15 +150,73 @@ class PVForecastAddon:
         log_level = getattr(logging, self.config.get('log_level', 'INFO').upper())
         logging.getLogger().setLevel(log_level)
         
+        # Optional span tracing of collections, off unless configured
+        if self.config.get('tracing', False):
+            tracing.TRACER.configure(self.config.get('trace_path', '/data/traces.jsonl'),
+                                     self.config.get('trace_max_bytes', 5 * 1024 * 1024))
+            logger.info(f"Tracing spans to {tracing.TRACER.path}")
+        
+        # Create the shared keep-alive session used for all Home Assistant calls
+        self.session = create_session()
+        
+        # Shared database layer used by the collector and all request handlers
+        self.db = PVDatabase(self.config.get('db_path', '/data/pv_forecast.db'),
+                             slow_query_ms=self.config.get('slow_query_ms', 0))
+        self.retriever = PVDataRetriever(self.db)
+        
         # Initialize PV comparison
-        self.pv_comparison = PVForecastComparison(
-            ha_url=self.config['ha_url'],
-            ha_token=self.config['ha_token'],
-            db_path='/data/pv_forecast.db'
+        self.pv_comparison = PVForecastComparison(self.config, session=self.session, db=self.db,
+                                                 events=self.events)
+        self.sites = self.pv_comparison.sites
+        
+        # Check the configured entities against /api/states before subscribing to them
+        if self.pv_comparison.entity_discovery:
+            with resilience.deadline(self.config.get('request_timeout', 10)):
+                await self.pv_comparison.discover_entities()
+        
+        # Start push-based ingestion; REST requests are used while it is not connected
+        if self.config.get('websocket_ingestion', True):
+            self.state_stream = HAStateStream(
+                self.config.get('ha_websocket_url') or websocket_url(self.config['ha_url']),
+                self.config['ha_token'],
+                self.pv_comparison.all_entities,
+                session=self.session
+            )
+            self.pv_comparison.state_stream = self.state_stream
+            
+            # Record every pushed value in the samples table through a write-behind buffer
+            if self.config.get('record_samples', True):
+                self.sample_buffer = SampleBuffer(
+                    self.db,
+                    flush_rows=self.config.get('sample_flush_rows', 500),
+                    flush_interval=self.config.get('sample_flush_interval', 30)
+                )
+                self.state_stream.add_listener(self.sample_buffer.add)
+                await self.sample_buffer.start()
+            
+            await self.state_stream.start()
+        
+        # Collections run in background workers; duplicate requests share one job
+        self.collection_queue = CollectionQueue(
+            self.pv_comparison.collect_data,
+            workers=self.config.get('collection_workers', 1)
         )
+        await self.collection_queue.start()
         
-        # Create aiohttp session
-        self.session = aiohttp.ClientSession()
+        # History backfill and recorder import, started on demand through the API
+        self.backfill = HistoryBackfill(
+            self.pv_comparison,
+            self.db,
+            self.config['collection_times'],
+            concurrency=self.config.get('backfill_concurrency', 2),
+            requests_per_second=self.config.get('backfill_requests_per_second', 2)
+        )
+        self.recorder_import = RecorderImport(
+            self.pv_comparison,
+            self.db,
+            self.config['collection_times'],
+            recorder_path=self.config.get('recorder_db_path', '/config/home-assistant_v2.db')
+        )
         
         # Start the web interface
         await self.start_web_interface()
@@ -109,384 +230,70 @@ class PVForecastAddon:
     
     async def start_web_interface(self):
         """Start the web interface for configuration and monitoring."""
-        from aiohttp import web
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        
+        site = web.TCPSite(runner, '0.0.0.0', 8123)
+        await site.start()
         
-        app = web.Application()
+        logger.info("Web interface started on port 8123")
+    
+    def create_app(self) -> web.Application:
+        """Create the web application with all routes."""
+        app = web.Application(middlewares=[telemetry.middleware])
+        
+        # Web interface from the prebuilt static bundle
+        bundle = self.load_static_bundle()
+        app.router.add_get('/', bundle.handle_index)
+        app.router.add_get('/static/{path:.+}', bundle.handle_asset)
         
         # API routes
-        app.router.add_get('/', self.handle_home)
         app.router.add_get('/api/status', self.handle_status)
+        app.router.add_get('/api/sites', self.handle_sites)
+        app.router.add_get('/api/entities', self.handle_entities)
+        app.router.add_get('/api/dashboard', self.handle_dashboard)
         app.router.add_get('/api/data', self.handle_data)
         app.router.add_get('/api/historical', self.handle_historical)
+        app.router.add_get('/api/metrics', self.handle_metrics)
+        app.router.add_get('/api/export', self.handle_export)
+        app.router.add_post('/api/backfill', self.handle_backfill)
+        app.router.add_get('/api/backfill', self.handle_backfill_status)
+        app.router.add_post('/api/import/recorder', self.handle_recorder_import)
+        app.router.add_get('/api/import/recorder', self.handle_recorder_import_status)
         app.router.add_post('/api/collect', self.handle_collect)
+        app.router.add_get('/api/collect/{job_id}', self.handle_collect_status)
         app.router.add_get('/api/config', self.handle_config)
-        
-        # Static files
-        app.router.add_static('/static', '/app/static')
-        
-        runner = web.AppRunner(app)
-        await runner.setup()
-        
-        site = web.TCPSite(runner, '0.0.0.0', 8123)
-        await site.start()
-        
-        logger.info("Web interface started on port 8123")
+        app.router.add_get('/api/events', self.events.handle)
+        app.router.add_get('/metrics', telemetry.handle_metrics)
+        app.router.add_post('/api/admin/profile', self.profiler.handle)
+        return app
     
-    async def handle_home(self, request):
-        """Handle the home page."""
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>PV Forecast Comparison</title>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1">
-            <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; background: #f8f9fa; }
-                .container { max-width: 1200px; margin: 0 auto; }
-                .card { background: white; padding: 20px; margin: 10px 0; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-                .button { background: #007cba; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer; margin: 5px; }
-                .button:hover { background: #005a87; }
-                .button:disabled { background: #ccc; cursor: not-allowed; }
-                .status { padding: 15px; margin: 10px 0; border-radius: 5px; }
-                .status.success { background: #d4edda; color: #155724; border: 1px solid #c3e6cb; }
-                .status.error { background: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; }
-                .grid { display: grid; grid-template-columns: 1fr 1fr; gap: 20px; }
-                .chart-container { position: relative; height: 400px; }
-                .data-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 10px; }
-                .data-item { background: #f8f9fa; padding: 10px; border-radius: 5px; text-align: center; }
-                .data-value { font-size: 1.5em; font-weight: bold; color: #007cba; }
-                .data-label { font-size: 0.9em; color: #666; }
-                .accuracy { font-size: 1.2em; font-weight: bold; }
-                .accuracy.good { color: #28a745; }
-                .accuracy.warning { color: #ffc107; }
-                .accuracy.poor { color: #dc3545; }
-                .header { text-align: center; margin-bottom: 30px; }
-                .header h1 { color: #333; margin-bottom: 10px; }
-                .header p { color: #666; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🌞 PV Forecast Comparison</h1>
-                    <p>Monitor and compare PV production forecasts with actual data</p>
-                </div>
-                
-                <div class="card">
-                    <h2>📊 Manual Data Collection</h2>
-                    <button class="button" onclick="collectData('4am')" id="btn-4am">Collect 4 AM Data</button>
-                    <button class="button" onclick="collectData('11am')" id="btn-11am">Collect 11 AM Data</button>
-                    <button class="button" onclick="collectData('3pm')" id="btn-3pm">Collect 3 PM Data</button>
-                    <button class="button" onclick="collectData('11pm')" id="btn-11pm">Collect 11 PM Data</button>
-                </div>
-                
-                <div class="grid">
-                    <div class="card">
-                        <h2>📈 Today's Forecast vs Actual</h2>
-                        <div class="chart-container">
-                            <canvas id="todayChart"></canvas>
-                        </div>
-                    </div>
-                    
-                    <div class="card">
-                        <h2>📊 Daily Comparison</h2>
-                        <div class="chart-container">
-                            <canvas id="dailyChart"></canvas>
-                        </div>
-                    </div>
-                </div>
-                
-                <div class="card">
-                    <h2>📋 Today's Data Points</h2>
-                    <div class="data-grid" id="dataGrid">
-                        <!-- Data points will be populated here -->
-                    </div>
-                </div>
-                
-                <div class="card">
-                    <h2>⚙️ System Status</h2>
-                    <div id="status"></div>
-                </div>
-            </div>
-            
-            <script>
-                let todayChart, dailyChart;
-                
-                async function collectData(timeSlot) {
-                    const button = document.getElementById(`btn-${timeSlot}`);
-                    button.disabled = true;
-                    button.textContent = 'Collecting...';
-                    
-                    try {
-                        const response = await fetch('/api/collect', {
-                            method: 'POST',
-                            headers: {'Content-Type': 'application/json'},
-                            body: JSON.stringify({time_slot: timeSlot})
-                        });
-                        const result = await response.json();
-                        
-                        if (result.success) {
-                            showNotification('✅ ' + result.message, 'success');
-                        } else {
-                            showNotification('❌ ' + result.error, 'error');
-                        }
-                        
-                        loadStatus();
-                        loadData();
-                        updateCharts();
-                    } catch (error) {
-                        showNotification('❌ Error: ' + error.message, 'error');
-                    } finally {
-                        button.disabled = false;
-                        button.textContent = `Collect ${timeSlot.toUpperCase()} Data`;
-                    }
-                }
-                
-                function showNotification(message, type) {
-                    const notification = document.createElement('div');
-                    notification.className = `status ${type}`;
-                    notification.textContent = message;
-                    notification.style.position = 'fixed';
-                    notification.style.top = '20px';
-                    notification.style.right = '20px';
-                    notification.style.zIndex = '1000';
-                    document.body.appendChild(notification);
-                    
-                    setTimeout(() => {
-                        notification.remove();
-                    }, 3000);
-                }
-                
-                async function loadStatus() {
-                    try {
-                        const response = await fetch('/api/status');
-                        const status = await response.json();
-                        document.getElementById('status').innerHTML = 
-                            `<div class="status ${status.online ? 'success' : 'error'}">
-                                <strong>Status:</strong> ${status.online ? '🟢 Online' : '🔴 Offline'}<br>
-                                <strong>Last Update:</strong> ${status.last_update}<br>
-                                <strong>Database Records:</strong> ${status.db_records}
-                            </div>`;
-                    } catch (error) {
-                        document.getElementById('status').innerHTML = 
-                            '<div class="status error">❌ Error loading status</div>';
-                    }
-                }
-                
-                async function loadData() {
-                    try {
-                        const response = await fetch('/api/data');
-                        const data = await response.json();
-                        updateDataGrid(data);
-                    } catch (error) {
-                        console.error('Error loading data:', error);
-                    }
-                }
-                
-                function updateDataGrid(data) {
-                    const grid = document.getElementById('dataGrid');
-                    const timeSlots = ['4am', '11am', '3pm', '11pm'];
-                    
-                    let html = '';
-                    timeSlots.forEach(slot => {
-                        const slotData = data[slot] || { forecast: 0, actual: 0 };
-                        const forecast = slotData.forecast || 0;
-                        const actual = slotData.actual || 0;
-                        const accuracy = forecast > 0 ? ((actual / forecast) * 100).toFixed(1) : 0;
-                        
-                        html += `
-                            <div class="data-item">
-                                <div class="data-label">${slot.toUpperCase()}</div>
-                                <div class="data-value">${forecast.toFixed(1)} Wh</div>
-                                <div class="data-label">Forecast</div>
-                                <div class="data-value">${actual.toFixed(1)} Wh</div>
-                                <div class="data-label">Actual</div>
-                                <div class="accuracy ${accuracy > 90 ? 'good' : accuracy > 70 ? 'warning' : 'poor'}">
-                                    ${accuracy}% Accuracy
-                                </div>
-                            </div>
-                        `;
-                    });
-                    
-                    // Add daily totals
-                    const dailyData = data.daily || { forecast: 0, actual: 0 };
-                    const dailyForecast = dailyData.forecast || 0;
-                    const dailyActual = dailyData.actual || 0;
-                    const dailyAccuracy = dailyForecast > 0 ? ((dailyActual / dailyForecast) * 100).toFixed(1) : 0;
-                    
-                    html += `
-                        <div class="data-item">
-                            <div class="data-label">DAILY TOTAL</div>
-                            <div class="data-value">${dailyForecast.toFixed(1)} Wh</div>
-                            <div class="data-label">Forecast</div>
-                            <div class="data-value">${dailyActual.toFixed(1)} Wh</div>
-                            <div class="data-label">Actual</div>
-                            <div class="accuracy ${dailyAccuracy > 90 ? 'good' : dailyAccuracy > 70 ? 'warning' : 'poor'}">
-                                ${dailyAccuracy}% Accuracy
-                            </div>
-                        </div>
-                    `;
-                    
-                    grid.innerHTML = html;
-                }
-                
-                function updateCharts() {
-                    updateTodayChart();
-                    updateDailyChart();
-                }
-                
-                async function updateTodayChart() {
-                    try {
-                        const response = await fetch('/api/data');
-                        const data = await response.json();
-                        
-                        const timeSlots = ['4am', '11am', '3pm', '11pm'];
-                        const forecastData = timeSlots.map(slot => data[slot]?.forecast || 0);
-                        const actualData = timeSlots.map(slot => data[slot]?.actual || 0);
-                        
-                        if (todayChart) {
-                            todayChart.destroy();
-                        }
-                        
-                        const ctx = document.getElementById('todayChart').getContext('2d');
-                        todayChart = new Chart(ctx, {
-                            type: 'bar',
-                            data: {
-                                labels: timeSlots.map(slot => slot.toUpperCase()),
-                                datasets: [{
-                                    label: 'Forecast (Wh)',
-                                    data: forecastData,
-                                    backgroundColor: 'rgba(54, 162, 235, 0.6)',
-                                    borderColor: 'rgba(54, 162, 235, 1)',
-                                    borderWidth: 1
-                                }, {
-                                    label: 'Actual (Wh)',
-                                    data: actualData,
-                                    backgroundColor: 'rgba(75, 192, 192, 0.6)',
-                                    borderColor: 'rgba(75, 192, 192, 1)',
-                                    borderWidth: 1
-                                }]
-                            },
-                            options: {
-                                responsive: true,
-                                maintainAspectRatio: false,
-                                scales: {
-                                    y: {
-                                        beginAtZero: true,
-                                        title: {
-                                            display: true,
-                                            text: 'Energy (Wh)'
-                                        }
-                                    }
-                                },
-                                plugins: {
-                                    title: {
-                                        display: true,
-                                        text: 'Today\'s Forecast vs Actual'
-                                    }
-                                }
-                            }
-                        });
-                    } catch (error) {
-                        console.error('Error updating today chart:', error);
-                    }
-                }
-                
-                async function updateDailyChart() {
-                    try {
-                        const response = await fetch('/api/historical?days=7');
-                        const data = await response.json();
-                        
-                        if (dailyChart) {
-                            dailyChart.destroy();
-                        }
-                        
-                        const ctx = document.getElementById('dailyChart').getContext('2d');
-                        dailyChart = new Chart(ctx, {
-                            type: 'line',
-                            data: {
-                                labels: data.dates || [],
-                                datasets: [{
-                                    label: 'Daily Forecast (Wh)',
-                                    data: data.forecast || [],
-                                    borderColor: 'rgba(54, 162, 235, 1)',
-                                    backgroundColor: 'rgba(54, 162, 235, 0.1)',
-                                    tension: 0.1
-                                }, {
-                                    label: 'Daily Actual (Wh)',
-                                    data: data.actual || [],
-                                    borderColor: 'rgba(75, 192, 192, 1)',
-                                    backgroundColor: 'rgba(75, 192, 192, 0.1)',
-                                    tension: 0.1
-                                }]
-                            },
-                            options: {
-                                responsive: true,
-                                maintainAspectRatio: false,
-                                scales: {
-                                    y: {
-                                        beginAtZero: true,
-                                        title: {
-                                            display: true,
-                                            text: 'Energy (Wh)'
-                                        }
-                                    }
-                                },
-                                plugins: {
-                                    title: {
-                                        display: true,
-                                        text: '7-Day Historical Comparison'
-                                    }
-                                }
-                            }
-                        });
-                    } catch (error) {
-                        console.error('Error updating daily chart:', error);
-                    }
-                }
-                
-                // Load initial data
-                loadStatus();
-                loadData();
-                updateCharts();
-                
-                // Refresh every 30 seconds
-                setInterval(() => {
-                    loadStatus();
-                    loadData();
-                    updateCharts();
-                }, 30000);
-            </script>
-        </body>
-        </html>
-        """
-        return web.Response(text=html, content_type='text/html')
+    def load_static_bundle(self):
+        """Load the web interface bundle, building it first if it is missing."""
+        bundle = StaticBundle(self.config.get('static_dir', '/app/static'))
+        if not bundle.load():
+            logger.warning(f"No web interface bundle in {bundle.bundle_dir}, building it")
+            try:
+                build_bundle(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend'),
+                             str(bundle.bundle_dir))
+                bundle.load()
+            except Exception as e:
+                logger.error(f"Error building web interface bundle: {e}")
+        return bundle
     
     async def handle_status(self, request):
         """Handle status API request."""
         try:
-            # Check if database exists and has data
-            db_records = 0
-            last_update = "Never"
-            
-            if os.path.exists('/data/pv_forecast.db'):
-                import sqlite3
-                conn = sqlite3.connect('/data/pv_forecast.db')
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM pv_forecast")
-                db_records = cursor.fetchone()[0]
-                cursor.execute("SELECT MAX(timestamp) FROM pv_forecast")
-                result = cursor.fetchone()
-                if result and result[0]:
-                    last_update = result[0]
-                conn.close()
+            # Check if database has data
+            status = await self.retriever.get_status()
             
             return web.json_response({
                 'online': True,
-                'last_update': last_update,
-                'db_records': db_records
+                'last_update': status['last_update'],
+                'db_records': status['db_records'],
+                'scope': 'all_sites',
+                'home_assistant': self.pv_comparison.ha_client.status() if self.pv_comparison else None,
+                'schedule': [job.to_dict() for job in self.scheduler.jobs.values()] if self.scheduler else []
             })
         except Exception as e:
             logger.error(f"Error getting status: {e}")
@@ -495,13 +302,60 @@ class PVForecastAddon:
                 'error': str(e)
             })
     
+    async def handle_sites(self, request):
+        """Handle the list of configured sites; the first one is the default of every endpoint."""
+        return web.json_response({'sites': [site.to_dict() for site in self.sites]})
+    
+    async def handle_entities(self, request):
+        """Handle the discovered energy and power sensors and the entity resolver state."""
+        if self.pv_comparison is None:
+            return web.json_response({'error': 'Not started'}, status=503)
+        return web.json_response(self.pv_comparison.resolver.to_dict())
+    
+    def request_site(self, request):
+        """Site named by ?site=, the first configured site without it, or None if unknown."""
+        name = request.query.get('site') or self.sites[0].name
+        return name if any(site.name == name for site in self.sites) else None
+    
+    async def cached_json_response(self, request, key, producer):
+        """Serve a JSON response from the cache, or build and cache it.
+        
+        Entries are valid until the next database write. Responses carry a
+        strong ETag, and a matching If-None-Match is answered with 304.
+        """
+        generation = self.db.generation
+        entry = self.response_cache.get(key, generation)
+        if entry is None:
+            data = await producer()
+            entry = self.response_cache.put(key, generation, json.dumps(data).encode('utf-8'))
+        
+        headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+        if entry.matches(request.headers.get('If-None-Match')):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=entry.body, content_type='application/json', headers=headers)
+    
+    async def handle_dashboard(self, request):
+        """Handle the combined dashboard request (status, today and history)."""
+        try:
+            days = int(request.query.get('days', 7))
+            site = self.request_site(request)
+            if site is None:
+                return web.json_response({'error': 'Unknown site'}, status=400)
+            key = ('dashboard', date.today().isoformat(), days, site)
+            return await self.cached_json_response(request, key,
+                                                   lambda: self.retriever.get_dashboard_data(days, site))
+        except Exception as e:
+            logger.error(f"Error getting dashboard data: {e}")
+            return web.json_response({'error': str(e)})
+    
     async def handle_data(self, request):
         """Handle data API request."""
         try:
-            from pv_data_retriever import PVDataRetriever
-            retriever = PVDataRetriever('/data/pv_forecast.db')
-            data = retriever.get_today_data()
-            return web.json_response(data)
+            site = self.request_site(request)
+            if site is None:
+                return web.json_response({'error': 'Unknown site'}, status=400)
+            key = ('data', date.today().isoformat(), site)
+            return await self.cached_json_response(request, key, lambda: self.retriever.get_today_data(site))
         except Exception as e:
             logger.error(f"Error getting data: {e}")
             return web.json_response({'error': str(e)})
@@ -509,17 +363,154 @@ class PVForecastAddon:
     async def handle_historical(self, request):
         """Handle historical data API request."""
         try:
-            from pv_data_retriever import PVDataRetriever
-            retriever = PVDataRetriever('/data/pv_forecast.db')
-            
-            # Get days parameter from query string
+            # Get days, resolution and optional sample series from query string
             days = int(request.query.get('days', 7))
-            data = retriever.get_historical_data(days)
-            return web.json_response(data)
+            resolution = request.query.get('resolution', 'auto')
+            if resolution not in ('auto', 'hour', 'day', 'month'):
+                return web.json_response({'error': 'Invalid resolution'}, status=400)
+            
+            # Optional LTTB downsampling to a bounded number of points
+            max_points = int(request.query.get('max_points', 0)) or None
+            if max_points is not None and max_points < 3:
+                return web.json_response({'error': 'max_points must be at least 3'}, status=400)
+            
+            site = self.request_site(request)
+            if site is None:
+                return web.json_response({'error': 'Unknown site'}, status=400)
+            series = request.query.get('series')
+            if resolution == 'hour' and not series:
+                # Time slot and daily comparisons are only rolled up per day and month
+                return web.json_response({'error': 'resolution=hour requires series'}, status=400)
+            # Samples are recorded per entity; a site only scopes them to its own entities
+            if series and 'site' in request.query and (
+                    series not in self.pv_comparison.get_site(site).all_entities):
+                return web.json_response({'error': 'series is not an entity of site'}, status=400)
+            key = ('historical', date.today().isoformat(), days, resolution, series, max_points, site)
+            if series:
+                producer = lambda: self.retriever.get_series_history(series, days, resolution, max_points)
+            else:
+                producer = lambda: self.retriever.get_historical_data(days, resolution, max_points, site)
+            return await self.cached_json_response(request, key, producer)
         except Exception as e:
             logger.error(f"Error getting historical data: {e}")
             return web.json_response({'error': str(e)})
     
+    async def handle_metrics(self, request):
+        """Handle forecast accuracy metrics request (?from=&to=&group_by=&source=&site=)."""
+        try:
+            end = date.fromisoformat(request.query['to']) if 'to' in request.query else date.today()
+            start = (date.fromisoformat(request.query['from']) if 'from' in request.query
+                     else end - timedelta(days=29))
+        except ValueError:
+            return web.json_response({'error': 'Invalid date, expected YYYY-MM-DD'}, status=400)
+        group_by = request.query.get('group_by', 'none')
+        source = request.query.get('source', 'daily')
+        if group_by not in GROUP_BY:
+            return web.json_response({'error': f'Invalid group_by, expected one of {", ".join(GROUP_BY)}'},
+                                     status=400)
+        if source not in SOURCES:
+            return web.json_response({'error': f'Invalid source, expected one of {", ".join(SOURCES)}'},
+                                     status=400)
+        if start > end:
+            return web.json_response({'error': 'from must not be after to'}, status=400)
+        site = self.request_site(request)
+        if site is None:
+            return web.json_response({'error': 'Unknown site'}, status=400)
+        
+        try:
+            key = ('metrics', start, end, group_by, source, site)
+            return await self.cached_json_response(
+                request, key, lambda: self.retriever.get_metrics(start, end, group_by, source, site))
+        except Exception as e:
+            logger.error(f"Error computing metrics: {e}")
+            return web.json_response({'error': str(e)}, status=500)
+    
+    async def handle_export(self, request):
+        """Handle table export (?table=&from=&to=&site=&format=csv|ndjson&gzip=1), streamed in chunks."""
+        table = request.query.get('table')
+        fmt = request.query.get('format', 'csv')
+        if table not in EXPORT_TABLES:
+            return web.json_response({'error': f'Invalid table, expected one of {", ".join(EXPORT_TABLES)}'},
+                                     status=400)
+        if fmt not in FORMATS:
+            return web.json_response({'error': f'Invalid format, expected one of {", ".join(FORMATS)}'},
+                                     status=400)
+        try:
+            start = date.fromisoformat(request.query['from']) if 'from' in request.query else None
+            end = date.fromisoformat(request.query['to']) if 'to' in request.query else None
+        except ValueError:
+            return web.json_response({'error': 'Invalid date, expected YYYY-MM-DD'}, status=400)
+        # Without ?site= every site is exported
+        site = request.query.get('site')
+        if site is not None and self.request_site(request) is None:
+            return web.json_response({'error': 'Unknown site'}, status=400)
+        
+        columns, sql, params = export_query(table, start, end, site)
+        writer = ExportWriter(columns, fmt, request.query.get('gzip', '').lower() in ('1', 'true', 'yes'))
+        response = web.StreamResponse(headers={
+            'Content-Type': writer.content_type,
+            'Content-Disposition': f'attachment; filename="{writer.filename(table)}"',
+            'Cache-Control': 'no-store'
+        })
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        
+        rows = self.db.stream(sql, params)
+        try:
+            await response.write(writer.header())
+            async for chunk in rows:
+                await response.write(writer.rows(chunk))
+            await response.write(writer.finish())
+            await response.write_eof()
+        except ConnectionResetError:
+            logger.info(f"Export of {table} cancelled by the client")
+        except Exception as e:
+            # Headers are already sent; all we can do is end the stream early
+            logger.error(f"Error exporting {table}: {e}")
+        finally:
+            await rows.aclose()
+        return response
+    
+    async def handle_backfill(self, request):
+        """Handle a history backfill request ({"from": ..., "to": ...}), run in the background."""
+        return await self.start_backfill(request, self.backfill)
+    
+    async def handle_backfill_status(self, request):
+        """Handle backfill status request."""
+        return await self.backfill_status(self.backfill)
+    
+    async def handle_recorder_import(self, request):
+        """Handle a recorder statistics import request ({"from": ..., "to": ...})."""
+        return await self.start_backfill(request, self.recorder_import)
+    
+    async def handle_recorder_import_status(self, request):
+        """Handle recorder import status request."""
+        return await self.backfill_status(self.recorder_import)
+    
+    async def start_backfill(self, request, backfill):
+        """Validate a backfill date range and start the backfill in the background."""
+        try:
+            data = await request.json()
+            start = date.fromisoformat(data['from'])
+            end = date.fromisoformat(data.get('to') or (date.today() - timedelta(days=1)).isoformat())
+        except (KeyError, ValueError, TypeError):
+            return web.json_response({'error': 'Expected JSON with "from" (and optional "to") as YYYY-MM-DD'},
+                                     status=400)
+        if start > end or end >= date.today():
+            return web.json_response({'error': 'Range must be in the past and from must not be after to'},
+                                     status=400)
+        
+        if not backfill.start(start, end):
+            return web.json_response({'error': 'A backfill is already running'}, status=409)
+        return web.json_response({'success': True, 'message': f'Backfill of {start} to {end} started'},
+                                 status=202)
+    
+    async def backfill_status(self, backfill):
+        """Report the progress and checkpoint of a backfill."""
+        status = dict(backfill.status)
+        status['checkpoint'] = await backfill.get_checkpoint()
+        return web.json_response(status)
+    
     async def handle_collect(self, request):
         """Handle manual data collection."""
         try:
@@ -529,17 +520,34 @@ class PVForecastAddon:
             if time_slot not in ['4am', '11am', '3pm', '11pm']:
                 return web.json_response({'error': 'Invalid time slot'})
             
-            # Run data collection
-            self.pv_comparison.collect_data(time_slot)
+            # Queue data collection; the client polls /api/collect/{job_id}
+            job, created = self.collection_queue.submit(time_slot)
             
-            return web.json_response({
+            response = job.to_dict()
+            response.update({
                 'success': True,
-                'message': f'Data collected for {time_slot}'
+                'message': f'Collection for {time_slot} ' + ('queued' if created else 'already in progress')
             })
+            return web.json_response(response, status=202)
         except Exception as e:
             logger.error(f"Error collecting data: {e}")
             return web.json_response({'error': str(e)})
     
+    async def handle_collect_status(self, request):
+        """Handle collection job status request, optionally waiting up to ?wait= seconds."""
+        job = self.collection_queue.get(request.match_info['job_id'])
+        if job is None:
+            return web.json_response({'error': 'Unknown job'}, status=404)
+        
+        try:
+            wait = min(float(request.query.get('wait', 0)), 30)
+        except ValueError:
+            return web.json_response({'error': 'Invalid wait parameter'}, status=400)
+        if wait > 0 and not job.finished:
+            await job.wait(wait)
+        
+        return web.json_response(job.to_dict())
+    
     async def handle_config(self, request):
         """Handle configuration API request."""
         return web.json_response(self.config)
@@ -547,38 +555,58 @@ class PVForecastAddon:
     async def start_scheduled_tasks(self):
         """Start scheduled data collection tasks."""
         logger.info("Starting scheduled tasks")
+        catch_up = self.config.get('catch_up_window', 7200)
+        self.scheduler = Scheduler(
+            ScheduleStore(self.db),
+            max_jitter=self.config.get('schedule_jitter', 0)
+        )
         
-        # Schedule tasks for each collection time
+        # One job per collection time, all driven by the scheduler's single timer
+        tz = local_timezone()
         for time_slot, time_str in self.config['collection_times'].items():
-            asyncio.create_task(self.schedule_task(time_slot, time_str))
+            self.scheduler.add(
+                f'collect_{time_slot}',
+                parse_rule(time_str, tz),
+                functools.partial(self.run_scheduled_collection, time_slot),
+                jitter=self.config.get('schedule_jitter', 0),
+                catch_up=catch_up if catch_up > 0 else None
+            )
+        # Table sizes walk every page; checked off the write path, refreshed when older than an hour
+        self.scheduler.add('table_sizes', IntervalRule(600), functools.partial(update_table_sizes, self.db))
+        await self.scheduler.start()
+        for job in self.scheduler.jobs.values():
+            logger.info(f"Scheduling {job.name} for {datetime.fromtimestamp(job.next_run)}")
     
-    async def schedule_task(self, time_slot, time_str):
-        """Schedule a task for a specific time."""
-        while True:
-            now = datetime.now()
-            target_time = datetime.strptime(time_str, '%H:%M:%S').time()
-            target_datetime = datetime.combine(now.date(), target_time)
-            
-            # If target time has passed today, schedule for tomorrow
-            if target_datetime <= now:
-                target_datetime = target_datetime.replace(day=target_datetime.day + 1)
-            
-            # Wait until target time
-            wait_seconds = (target_datetime - now).total_seconds()
-            logger.info(f"Scheduling {time_slot} collection for {target_datetime}")
-            await asyncio.sleep(wait_seconds)
-            
-            # Execute collection
-            try:
-                logger.info(f"Executing scheduled collection for {time_slot}")
-                self.pv_comparison.collect_data(time_slot)
-            except Exception as e:
-                logger.error(f"Error in scheduled collection for {time_slot}: {e}")
+    async def run_scheduled_collection(self, time_slot):
+        """Run one scheduled collection through the collection queue."""
+        logger.info(f"Executing scheduled collection for {time_slot}")
+        job, _ = self.collection_queue.submit(time_slot)
+        await job.wait()
 
 async def main():
     """Main function."""
+    configure_logging()
     addon = PVForecastAddon()
-    await addon.start()
+    try:
+        await addon.start()
+    finally:
+        if addon.scheduler is not None:
+            await addon.scheduler.stop()
+        if addon.backfill is not None:
+            await addon.backfill.stop()
+        if addon.recorder_import is not None:
+            await addon.recorder_import.stop()
+        if addon.collection_queue is not None:
+            await addon.collection_queue.stop()
+        if addon.state_stream is not None:
+            await addon.state_stream.stop()
+        if addon.sample_buffer is not None:
+            await addon.sample_buffer.stop()
+        if addon.session is not None:
+            await addon.session.close()
+        if addon.db is not None:
+            addon.db.close()
+        tracing.TRACER.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Sample Buffer
+Write-behind buffer that stores high-resolution entity samples in batches.
+"""
+
+import asyncio
+import logging
+import sqlite3
+from typing import Optional, List, Tuple
+
+from pv_database import PVDatabase
+from rollups import update_sample_rollups
+
+logger = logging.getLogger(__name__)
+
+class SampleBuffer:
+    """Collects (entity_id, timestamp, value) samples and writes them in batches.
+    
+    Samples are flushed with a single executemany in one transaction once
+    flush_rows samples are pending or flush_interval seconds have passed,
+    so a burst of updates costs one commit instead of one per value.
+    """
+    
+    def __init__(self, db: PVDatabase, flush_rows: int = 500, flush_interval: float = 30,
+                 max_pending: int = 50000):
+        """Initialize the buffer."""
+        self.db = db
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.flush_rows, max_pending)
+        self._pending: List[Tuple[str, float, float]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._timer_task: Optional[asyncio.Task] = None
+    
+    def add(self, entity_id: str, timestamp: float, value: Optional[float]):
+        """Queue a sample; None values (unavailable states) are skipped."""
+        if value is None:
+            return
+        self._pending.append((entity_id, timestamp, value))
+        if len(self._pending) >= self.flush_rows and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+    
+    async def start(self):
+        """Start the periodic flush task."""
+        if self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._flush_periodically())
+    
+    async def stop(self):
+        """Stop the periodic flush task and write everything still pending."""
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            try:
+                await self._timer_task
+            except asyncio.CancelledError:
+                pass
+            self._timer_task = None
+        await self.flush()
+    
+    async def _flush_periodically(self):
+        """Flush every flush_interval seconds."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    async def flush(self) -> int:
+        """Write all pending samples in one transaction and return how many were written."""
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                await self.db.write(self._insert_samples, rows)
+                logger.debug(f"Flushed {len(rows)} samples")
+                return len(rows)
+            except Exception as e:
+                logger.error(f"Error flushing {len(rows)} samples: {e}")
+                # Keep the samples for the next attempt, dropping the oldest beyond the cap
+                self._pending = (rows + self._pending)[-self.max_pending:]
+                return 0
+    
+    @staticmethod
+    def _insert_samples(conn: sqlite3.Connection, rows: List[Tuple[str, float, float]]):
+        """Insert a batch of samples, ignoring duplicates, and update rollups."""
+        conn.executemany('''
+            INSERT OR IGNORE INTO pv_samples (entity_id, ts, value)
+            VALUES (?, ?, ?)
+        ''', rows)
+        update_sample_rollups(conn, rows)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Scheduler
+Single-timer job scheduler with interval and cron-like rules.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import random
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, time as dtime, tzinfo
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from pv_database import PVDatabase
+
+logger = logging.getLogger(__name__)
+
+def local_timezone() -> tzinfo:
+    """The configured local time zone with its DST rules (TZ, then /etc/localtime, then UTC)."""
+    name = os.environ.get('TZ')
+    if name:
+        try:
+            return ZoneInfo(name.lstrip(':'))
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Unknown time zone {name}, trying /etc/localtime")
+    try:
+        with open('/etc/localtime', 'rb') as f:
+            return ZoneInfo.from_file(f, key='localtime')
+    except (OSError, ValueError):
+        return ZoneInfo('UTC')
+
+class IntervalRule:
+    """Fires every interval seconds at fixed multiples from an anchor time.
+    
+    Times are computed from the anchor rather than from the previous run,
+    so delays never accumulate.
+    """
+    
+    def __init__(self, interval: float, anchor: float = 0):
+        """Initialize the rule; the anchor defaults to the Unix epoch."""
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = interval
+        self.anchor = anchor
+    
+    def next_after(self, after: float) -> float:
+        """First fire time strictly after the given Unix time."""
+        steps = (after - self.anchor) // self.interval + 1
+        return self.anchor + steps * self.interval
+    
+    def __repr__(self) -> str:
+        return f'every {self.interval:g}s'
+
+def _parse_cron_field(field: str, low: int, high: int) -> List[int]:
+    """Parse one cron field (*, a, a-b, with optional /step, comma separated)."""
+    values: Set[int] = set()
+    for part in field.split(','):
+        spec, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if spec == '*':
+            first, last = low, high
+        elif '-' in spec:
+            first, last = (int(value) for value in spec.split('-', 1))
+        else:
+            first = int(spec)
+            last = high if step > 1 else first
+        if not low <= first <= last <= high or step < 1:
+            raise ValueError(f"Invalid cron field '{field}'")
+        values.update(range(first, last + 1, step))
+    return sorted(values)
+
+class CronRule:
+    """Fires at wall-clock times matching a cron expression in a time zone.
+    
+    Accepts 'minute hour day month weekday' or a leading seconds field;
+    weekday 0 and 7 are Sunday, and like cron a day matches when either the
+    day of month or the weekday matches if both are restricted. Wall-clock
+    times skipped when DST starts fire one hour later; times repeated when
+    DST ends fire once.
+    """
+    
+    def __init__(self, expression: str, tz: Optional[tzinfo] = None):
+        """Parse the expression."""
+        fields = expression.split()
+        if len(fields) == 5:
+            fields = ['0'] + fields
+        if len(fields) != 6:
+            raise ValueError(f"Cron expression needs 5 or 6 fields: '{expression}'")
+        self.expression = expression
+        self.tz = tz or local_timezone()
+        self.seconds = _parse_cron_field(fields[0], 0, 59)
+        self.minutes = _parse_cron_field(fields[1], 0, 59)
+        self.hours = _parse_cron_field(fields[2], 0, 23)
+        self.days = set(_parse_cron_field(fields[3], 1, 31))
+        self.months = set(_parse_cron_field(fields[4], 1, 12))
+        self.weekdays = {day % 7 for day in _parse_cron_field(fields[5], 0, 7)}
+        self._any_day = fields[3] == '*'
+        self._any_weekday = fields[5] == '*'
+    
+    @classmethod
+    def daily(cls, at: dtime, tz: Optional[tzinfo] = None) -> 'CronRule':
+        """Rule firing once a day at a local time."""
+        return cls(f'{at.second} {at.minute} {at.hour} * * *', tz)
+    
+    def _day_matches(self, day: date) -> bool:
+        """Whether a date matches the day, month and weekday fields."""
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+    
+    def next_after(self, after: float) -> float:
+        """First fire time strictly after the given Unix time."""
+        # Search in naive local wall-clock time, then map back to an instant
+        start = datetime.fromtimestamp(after, self.tz).replace(tzinfo=None)
+        day = start.date()
+        for _ in range(366 * 8):
+            if self._day_matches(day):
+                first_day = day == start.date()
+                for hour in self.hours:
+                    if first_day and hour < start.hour:
+                        continue
+                    for minute in self.minutes:
+                        if first_day and (hour, minute) < (start.hour, start.minute):
+                            continue
+                        for second in self.seconds:
+                            candidate = datetime.combine(day, dtime(hour, minute, second))
+                            if candidate <= start:
+                                continue
+                            ts = candidate.replace(tzinfo=self.tz).timestamp()
+                            if ts > after:
+                                return ts
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+    
+    def __repr__(self) -> str:
+        return f"cron '{self.expression}'"
+
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_rule(spec: str, tz: Optional[tzinfo] = None):
+    """Build a rule from 'HH:MM[:SS]' (daily), 'every N[s|m|h|d]' or a cron expression."""
+    spec = spec.strip()
+    if re.fullmatch(r'\d{1,2}:\d{2}(:\d{2})?', spec):
+        parts = [int(part) for part in spec.split(':')]
+        return CronRule.daily(dtime(*parts), tz)
+    match = re.fullmatch(r'every\s+(\d+(?:\.\d+)?)\s*([smhd]?)', spec)
+    if match:
+        return IntervalRule(float(match.group(1)) * INTERVAL_UNITS[match.group(2) or 's'])
+    return CronRule(spec, tz)
+
+class ScheduledJob:
+    """A callback with its rule and run bookkeeping."""
+    
+    def __init__(self, name: str, rule, callback: Callable[[], Awaitable], jitter: float = 0,
+                 catch_up: Optional[float] = None):
+        """Initialize the job."""
+        self.name = name
+        self.rule = rule
+        self.callback = callback
+        self.jitter = jitter
+        # Maximum lateness in seconds for running a missed occurrence at startup
+        self.catch_up = catch_up
+        self.next_run: Optional[float] = None
+        self.last_run: Optional[float] = None
+        self.last_lateness: Optional[float] = None
+        self.removed = False
+    
+    def to_dict(self) -> Dict:
+        """Job state for status output."""
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat(timespec='seconds') if ts else None
+        return {
+            'name': self.name,
+            'rule': repr(self.rule),
+            'next_run': iso(self.next_run),
+            'last_run': iso(self.last_run),
+            'last_lateness': self.last_lateness
+        }
+
+class ScheduleStore:
+    """Persists the last run time of every job in the database."""
+    
+    def __init__(self, db: PVDatabase):
+        """Initialize the store and create its table."""
+        self.db = db
+        db.write_sync(self._create_table)
+    
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        """Create the scheduler_state table."""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_state (
+                name TEXT PRIMARY KEY,
+                last_run REAL NOT NULL
+            )
+        ''')
+    
+    async def load(self) -> Dict[str, float]:
+        """Last run time per job name."""
+        return await self.db.read(lambda conn: dict(conn.execute('SELECT name, last_run FROM scheduler_state')))
+    
+    async def save(self, name: str, last_run: float):
+        """Record a run."""
+        await self.db.write(lambda conn: conn.execute(
+            'INSERT OR REPLACE INTO scheduler_state (name, last_run) VALUES (?, ?)', (name, last_run)))
+
+class Scheduler:
+    """Runs any number of jobs from one timer over a heap of due times.
+    
+    The timer sleeps on the event loop's monotonic clock for at most
+    max_sleep seconds at a time and compares against the wall clock after
+    every wake-up, so clock changes and suspends are corrected instead of
+    accumulating. Each run may be delayed by a random jitter of up to the
+    job's jitter, capped at max_jitter. Missed occurrences are coalesced
+    into one run.
+    """
+    
+    def __init__(self, store: Optional[ScheduleStore] = None, max_jitter: float = 0,
+                 max_sleep: float = 60):
+        """Initialize the scheduler."""
+        self.store = store
+        self.max_jitter = max_jitter
+        self.max_sleep = max_sleep
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._heap: List[tuple] = []
+        self._counter = 0
+        self._wakeup = asyncio.Event()
+        self._timer: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+    
+    def add(self, name: str, rule, callback: Callable[[], Awaitable], jitter: float = 0,
+            catch_up: Optional[float] = None) -> ScheduledJob:
+        """Add a job, replacing any job with the same name."""
+        self.remove(name)
+        job = ScheduledJob(name, rule, callback, jitter, catch_up)
+        self.jobs[name] = job
+        if self._timer is not None:
+            self._push(job, rule.next_after(time.time()))
+        return job
+    
+    def remove(self, name: str):
+        """Remove a job; its queued timer entry is skipped lazily."""
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            job.removed = True
+    
+    def _push(self, job: ScheduledJob, due: float):
+        """Queue the next occurrence of a job."""
+        jitter = min(job.jitter, self.max_jitter)
+        fire_at = due + (random.uniform(0, jitter) if jitter > 0 else 0)
+        job.next_run = fire_at
+        self._counter += 1
+        heapq.heappush(self._heap, (fire_at, self._counter, due, job))
+        self._wakeup.set()
+    
+    async def start(self):
+        """Catch up missed runs and start the timer."""
+        if self._timer is not None:
+            return
+        now = time.time()
+        last_runs = await self.store.load() if self.store else {}
+        for job in self.jobs.values():
+            job.last_run = last_runs.get(job.name)
+            missed = self._latest_missed(job, now)
+            if missed is not None:
+                logger.info(f"Catching up {job.name}, missed at {datetime.fromtimestamp(missed)}")
+                self._launch(job, missed, now)
+            self._push(job, job.rule.next_after(now))
+        self._timer = asyncio.create_task(self._run())
+    
+    @staticmethod
+    def _latest_missed(job: ScheduledJob, now: float) -> Optional[float]:
+        """Most recent occurrence since the last run that is still within the catch-up window.
+        
+        Only occurrences of the current local day qualify: a collection is
+        stored under today's date and reads daily sensors that reset at
+        midnight, so a run missed before midnight cannot be made up after it.
+        """
+        if job.catch_up is None or job.last_run is None:
+            return None
+        latest = None
+        due = job.rule.next_after(job.last_run)
+        for _ in range(10000):
+            if due > now:
+                break
+            latest = due
+            due = job.rule.next_after(due)
+        if latest is None or now - latest > job.catch_up:
+            return None
+        tz = getattr(job.rule, 'tz', None) or local_timezone()
+        if datetime.fromtimestamp(latest, tz).date() != datetime.fromtimestamp(now, tz).date():
+            logger.info(f"Not catching up {job.name}, missed at {datetime.fromtimestamp(latest)} on an earlier day")
+            return None
+        return latest
+    
+    async def stop(self):
+        """Stop the timer and cancel running callbacks."""
+        tasks = list(self._running)
+        if self._timer is not None:
+            tasks.append(self._timer)
+            self._timer = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _run(self):
+        """Timer loop."""
+        while True:
+            while self._heap and self._heap[0][3].removed:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            
+            fire_at, _, due, job = self._heap[0]
+            delay = fire_at - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, self.max_sleep))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            heapq.heappop(self._heap)
+            now = time.time()
+            self._launch(job, due, now)
+            # Skip occurrences that passed while we were late instead of running each
+            self._push(job, job.rule.next_after(max(due, now)))
+    
+    def _launch(self, job: ScheduledJob, due: float, now: float):
+        """Run a job's callback in its own task."""
+        job.last_lateness = round(now - due, 3)
+        task = asyncio.create_task(self._execute(job, due))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+    
+    async def _execute(self, job: ScheduledJob, due: float):
+        """Run the callback and record the run."""
+        try:
+            await job.callback()
+        except Exception as e:
+            logger.error(f"Error in scheduled job {job.name}: {e}")
+        job.last_run = due
+        if self.store:
+            try:
+                await self.store.save(job.name, due)
+            except Exception as e:
+                logger.warning(f"Could not record run of {job.name}: {e}")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+PV Sites
+Configuration of the PV systems (roofs, arrays or inverters) compared by the add-on.
+"""
+
+import re
+from typing import Any, Dict, List
+
+# Site of the top-level entity lists and of rows written before sites existed
+DEFAULT_SITE = 'default'
+
+SITE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+class Site:
+    """One PV system with its own forecast, production and daily fallback chains."""
+    
+    def __init__(self, name: str, forecast_entities: List[str], production_entities: List[str],
+                 daily_entities: List[str]):
+        """Initialize the site."""
+        self.name = name
+        self.forecast_entities = list(forecast_entities)
+        self.production_entities = list(production_entities)
+        self.daily_entities = list(daily_entities)
+    
+    @property
+    def all_entities(self) -> List[str]:
+        """All entities across the site's three fallback chains."""
+        return list(dict.fromkeys(self.forecast_entities + self.production_entities + self.daily_entities))
+    
+    def slot_chains(self, time_slot: str) -> List[List[str]]:
+        """Fallback chains a collection of time_slot needs; the daily chain only at 11pm."""
+        chains = [self.forecast_entities, self.production_entities]
+        if time_slot == '11pm':
+            chains.append(self.daily_entities)
+        return chains
+    
+    def slot_entities(self, time_slot: str) -> List[str]:
+        """Entities a collection of time_slot needs."""
+        return list(dict.fromkeys(entity for chain in self.slot_chains(time_slot) for entity in chain))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the site for the API."""
+        return {
+            'name': self.name,
+            'forecast_entities': self.forecast_entities,
+            'production_entities': self.production_entities,
+            'daily_entities': self.daily_entities
+        }
+
+def load_sites(config: Dict[str, Any]) -> List[Site]:
+    """Build the sites from the 'sites' option.
+    
+    Without it, the top-level entity lists form the single default site, so
+    existing configurations keep working unchanged. Raises ValueError on
+    invalid or duplicate names.
+    """
+    entries = config.get('sites') or [{
+        'name': DEFAULT_SITE,
+        'forecast_entities': config.get('forecast_entities', []),
+        'production_entities': config.get('production_entities', []),
+        'daily_entities': config.get('daily_entities', [])
+    }]
+    sites = []
+    for entry in entries:
+        name = str(entry.get('name', ''))
+        if not SITE_NAME.match(name):
+            raise ValueError(f"Invalid site name {name!r}: use 1-64 letters, digits, '_' or '-'")
+        if any(site.name == name for site in sites):
+            raise ValueError(f"Duplicate site name {name!r}")
+        sites.append(Site(
+            name,
+            entry.get('forecast_entities', []),
+            entry.get('production_entities', []),
+            entry.get('daily_entities', [])
+        ))
+    return sites
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Static Bundle
+Builds the web interface into hashed, precompressed files and serves them.
+
+Run as a script at image build time:
+    python3 static_bundle.py <source_dir> <output_dir>
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.html'
+COMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+def _hashed_name(relative: str, content: bytes) -> str:
+    """Insert a content hash before the extension, e.g. app.js -> app.1a2b3c4d5e.js."""
+    path = Path(relative)
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    return str(path.with_name(f'{path.stem}.{digest}{path.suffix}').as_posix())
+
+def _write_compressed(path: Path, content: bytes):
+    """Write gzip and brotli variants next to a file when they are smaller."""
+    content_type = mimetypes.guess_type(path.name)[0] or ''
+    if not content_type.startswith(COMPRESSIBLE_TYPES):
+        return
+    variants = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+    for encoding, data in variants.items():
+        if len(data) < len(content):
+            path.with_name(path.name + COMPRESSED_SUFFIXES[encoding]).write_bytes(data)
+
+def build_bundle(source_dir: str, output_dir: str) -> List[str]:
+    """Build the bundle and return the written asset names.
+    
+    Every asset gets a content-hashed file name and index.html is rewritten
+    to reference those names, so assets can be cached forever while the
+    small index is revalidated on each load. The output directory is
+    replaced completely.
+    """
+    source = Path(source_dir)
+    output = Path(output_dir)
+    if output.exists():
+        shutil.rmtree(output)
+    output.mkdir(parents=True)
+    
+    if brotli is None:
+        logger.warning("brotli is not installed; building gzip variants only")
+    
+    index = (source / INDEX_FILE).read_text(encoding='utf-8')
+    written = []
+    for path in sorted(source.rglob('*')):
+        relative = path.relative_to(source).as_posix()
+        if not path.is_file() or relative == INDEX_FILE:
+            continue
+        content = path.read_bytes()
+        hashed = _hashed_name(relative, content)
+        target = output / hashed
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        _write_compressed(target, content)
+        index = index.replace(f'"{relative}"', f'"static/{hashed}"')
+        written.append(hashed)
+    
+    index_bytes = index.encode('utf-8')
+    (output / INDEX_FILE).write_bytes(index_bytes)
+    _write_compressed(output / INDEX_FILE, index_bytes)
+    return written
+
+def preferred_encodings(accept_encoding: str) -> List[str]:
+    """Content codings the client accepts, in the order we prefer them."""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    return [encoding for encoding in ('br', 'gzip') if accepted.get(encoding, wildcard) > 0]
+
+class StaticFile:
+    """One bundle file with its precompressed variants, held in memory."""
+    
+    __slots__ = ('content_type', 'variants', 'digest')
+    
+    def __init__(self, path: Path):
+        """Load a file and any .br/.gz variants next to it."""
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        self.variants: Dict[Optional[str], bytes] = {None: path.read_bytes()}
+        for encoding, suffix in COMPRESSED_SUFFIXES.items():
+            compressed = path.with_name(path.name + suffix)
+            if compressed.exists():
+                self.variants[encoding] = compressed.read_bytes()
+        self.digest = hashlib.sha1(self.variants[None]).hexdigest()[:20]
+    
+    def response(self, request: web.Request, cache_control: str) -> web.Response:
+        """Build the response for a request, choosing the best encoding."""
+        encoding = next((e for e in preferred_encodings(request.headers.get('Accept-Encoding', ''))
+                         if e in self.variants), None)
+        # Each representation needs its own strong ETag
+        etag = f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+        headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        
+        if_none_match = request.headers.get('If-None-Match', '')
+        if any(tag.strip() in (etag, 'W/' + etag, '*') for tag in if_none_match.split(',')):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=self.variants[encoding], content_type=self.content_type,
+                            headers=headers)
+
+class StaticBundle:
+    """Serves a built bundle from memory.
+    
+    index.html is revalidated with its ETag on every load; the hashed assets
+    are marked immutable. Precompressed variants are picked by
+    Accept-Encoding, so nothing is compressed per request.
+    """
+    
+    def __init__(self, bundle_dir: str):
+        """Initialize the bundle; call load() to read the files."""
+        self.bundle_dir = Path(bundle_dir)
+        self.files: Dict[str, StaticFile] = {}
+    
+    def load(self) -> int:
+        """Read every bundle file into memory and return the file count."""
+        self.files = {}
+        if not self.bundle_dir.is_dir():
+            return 0
+        compressed = tuple(COMPRESSED_SUFFIXES.values())
+        for path in sorted(self.bundle_dir.rglob('*')):
+            if path.is_file() and not path.name.endswith(compressed):
+                self.files[path.relative_to(self.bundle_dir).as_posix()] = StaticFile(path)
+        return len(self.files)
+    
+    async def handle_index(self, request: web.Request) -> web.Response:
+        """Serve index.html."""
+        index = self.files.get(INDEX_FILE)
+        if index is None:
+            return web.Response(status=503, text="Web interface bundle is not built")
+        return index.response(request, 'no-cache')
+    
+    async def handle_asset(self, request: web.Request) -> web.Response:
+        """Serve a hashed asset."""
+        path = request.match_info['path']
+        asset = self.files.get(path)
+        if asset is None or path == INDEX_FILE:
+            raise web.HTTPNotFound()
+        return asset.response(request, IMMUTABLE_CACHE)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(f"Usage: {os.path.basename(sys.argv[0])} <source_dir> <output_dir>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    for name in build_bundle(sys.argv[1], sys.argv[2]):
+        print(name)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Telemetry
+Counters and latency histograms exposed in the Prometheus text format.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    """Render label pairs as {a="x",b="y"}."""
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value: float) -> str:
+    """Render a sample value."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base class of a labelled metric family.
+    
+    Observations may come from the event loop and from database threads,
+    so every update takes the metric's lock.
+    """
+    
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Initialize the family."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Label values in declaration order."""
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def _pairs(self, key: Tuple[str, ...]) -> List[Tuple[str, str]]:
+        """Label name/value pairs of a key."""
+        return list(zip(self.labelnames, key))
+    
+    def samples(self) -> Iterator[str]:
+        """Sample lines of the family."""
+        raise NotImplementedError
+    
+    def render(self) -> str:
+        """HELP, TYPE and sample lines."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    """Monotonically increasing count per label set."""
+    
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Initialize the counter."""
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        """Add amount to the label set's count."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        """Current count of a label set."""
+        return self._values.get(self._key(labels), 0)
+    
+    def samples(self) -> Iterator[str]:
+        """Sample lines of the counter."""
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self._pairs(key))} {_format_value(value)}'
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets per label set."""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Initialize the histogram with upper bucket bounds in seconds."""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, value: float, **labels):
+        """Record one observation."""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+    
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    def count(self, **labels) -> int:
+        """Number of observations of a label set."""
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+    
+    def samples(self) -> Iterator[str]:
+        """Bucket, sum and count lines of the histogram."""
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            pairs = self._pairs(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(pairs + [('le', _format_value(float(bound)))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(pairs)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(pairs)} {cumulative}'
+
+class Registry:
+    """Ordered collection of metric families."""
+    
+    def __init__(self):
+        """Initialize an empty registry."""
+        self.metrics: Dict[str, Metric] = {}
+    
+    def register(self, metric: Metric) -> Metric:
+        """Add a family; names must be unique."""
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+    
+    def render(self) -> str:
+        """The whole registry in the Prometheus text format."""
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+REGISTRY = Registry()
+
+HA_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'pv_ha_request_seconds', 'Duration of Home Assistant API requests.',
+    ('call', 'entity', 'status')))
+SQL_SECONDS = REGISTRY.register(Histogram(
+    'pv_sql_seconds', 'Duration of database operations, each one statement or transaction.',
+    ('kind', 'operation'), buckets=SQL_BUCKETS))
+COLLECTION_SECONDS = REGISTRY.register(Histogram(
+    'pv_collection_seconds', 'Duration of end-to-end data collections.',
+    ('time_slot', 'result')))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'pv_http_request_seconds', 'Duration of HTTP requests to the web interface and API.',
+    ('method', 'route', 'status')))
+FALLBACK_DEPTH = REGISTRY.register(Counter(
+    'pv_fallback_depth_total',
+    'Position in the fallback chain of the entity that supplied a value (0 is the first; none if no entity had one).',
+    ('chain', 'depth')))
+HA_RESILIENCE_EVENTS = REGISTRY.register(Counter(
+    'pv_ha_resilience_events_total',
+    'Home Assistant request retries, timeouts, circuit breaker rejections and exhausted deadlines.',
+    ('call', 'event')))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'pv_cache_requests_total', 'Cache lookups by cache and result (hit or miss).',
+    ('cache', 'result')))
+
+@web.middleware
+async def middleware(request: web.Request, handler):
+    """Record the duration of every HTTP request by route."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                     method=request.method, route=route, status=status)
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Serve the registry in the Prometheus text format."""
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
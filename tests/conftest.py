@@ -0,0 +1,11 @@
+"""
+Test configuration
+Makes the add-on modules and the benchmark helpers (Home Assistant stub) importable.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,159 @@
+"""
+Tests of the history backfill against the Home Assistant stub.
+"""
+
+import asyncio
+import time
+from datetime import date, timedelta
+
+from backfill import HistoryBackfill
+from ha_client import create_session
+from ha_stub import HAStub
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+from resilience import Backoff, CircuitBreaker
+
+COLLECTION_TIMES = {'4am': '04:00:00', '11am': '11:00:00', '3pm': '15:00:00', '11pm': '23:00:00'}
+START = date(2024, 3, 1)
+END = date(2024, 3, 10)
+ENTITIES = {
+    'forecast_entities': ['sensor.pv_production_forecast', 'sensor.solar_forecast'],
+    'production_entities': ['sensor.pv_power'],
+    'daily_entities': ['sensor.pv_daily_energy']
+}
+
+class RecordingBackfill(HistoryBackfill):
+    """Backfill that records the batches it writes."""
+    
+    batches = []
+    
+    @classmethod
+    def _store_batch(cls, conn, forecast_rows, daily_rows, start, end, completed_through):
+        cls.batches.append((completed_through, len(forecast_rows), len(daily_rows)))
+        super()._store_batch(conn, forecast_rows, daily_rows, start, end, completed_through)
+
+async def setup(tmp_path, latency=0.05):
+    """Start the stub and create a comparison, a session and a backfill using it."""
+    stub = HAStub(latency=latency)
+    url = await stub.start()
+    session = create_session()
+    db = PVDatabase(str(tmp_path / 'pv.db'))
+    comparison = PVForecastComparison({'ha_url': url, 'entity_discovery': False, **ENTITIES}, session=session, db=db)
+    RecordingBackfill.batches = []
+    backfill = RecordingBackfill(comparison, db, COLLECTION_TIMES, chunk_days=2, concurrency=2,
+                                 requests_per_second=0, batch_days=4)
+    return stub, session, db, backfill
+
+async def teardown(stub, session, db):
+    await session.close()
+    await stub.stop()
+    db.close()
+
+async def row_counts(db):
+    return await db.read(lambda conn: (
+        conn.execute('SELECT COUNT(*) FROM pv_forecast').fetchone()[0],
+        conn.execute('SELECT COUNT(*) FROM daily_production').fetchone()[0]
+    ))
+
+def test_backfill_chunks_concurrency_and_batches(tmp_path):
+    async def run():
+        stub, session, db, backfill = await setup(tmp_path)
+        try:
+            assert await backfill.run(START, END) == 10
+            
+            # Ten days in chunks of two days, one history request each, two at a time
+            starts = sorted(date.fromisoformat(request['start'][:10]) for request in stub.history_requests)
+            assert starts == [START + timedelta(days=day) for day in range(0, 10, 2)]
+            assert stub.max_history_in_flight == 2
+            
+            # Written in date order in batches of (at least) four days, the last one shorter
+            assert RecordingBackfill.batches == [
+                (date(2024, 3, 4), 16, 4), (date(2024, 3, 8), 16, 4), (date(2024, 3, 10), 8, 2)]
+            assert await row_counts(db) == (40, 10)
+            
+            row = await db.read(lambda conn: conn.execute('''
+                SELECT site, forecast_wh, actual_wh, provider FROM pv_forecast
+                WHERE date = '2024-03-05' AND time_slot = '11am'
+            ''').fetchone())
+            assert row == ('default', 25000.0, 3500.0, 'sensor.pv_production_forecast')
+            daily = await db.read(lambda conn: conn.execute(
+                "SELECT total_actual_wh FROM daily_production WHERE date = '2024-03-05'").fetchone())
+            assert daily == (18000.0,)
+            
+            checkpoint = await backfill.get_checkpoint()
+            assert checkpoint['completed_through'] == END.isoformat()
+            assert backfill.status['state'] == 'completed'
+        finally:
+            await teardown(stub, session, db)
+    asyncio.run(run())
+
+def test_backfill_resumes_from_checkpoint(tmp_path):
+    async def run():
+        stub, session, db, backfill = await setup(tmp_path, latency=0.1)
+        try:
+            # Interrupt the first run once its first batch is committed
+            backfill.start(START, END)
+            deadline = time.monotonic() + 10
+            while ((await backfill.get_checkpoint()) or {}).get('completed_through') is None:
+                assert time.monotonic() < deadline
+                await asyncio.sleep(0.005)
+            await backfill.stop()
+            assert backfill.status['state'] == 'cancelled'
+            # A batch write already handed to the writer thread still commits; wait for it
+            await db.write(lambda conn: None)
+            
+            checkpoint = await backfill.get_checkpoint()
+            done = date.fromisoformat(checkpoint['completed_through'])
+            assert START <= done < END
+            assert (await row_counts(db))[1] == (done - START).days + 1
+            
+            # The second run only fetches and writes the days after the checkpoint
+            stub.history_requests.clear()
+            written = await backfill.run(START, END)
+            assert written == (END - done).days
+            assert min(request['start'][:10] for request in stub.history_requests) == (
+                done + timedelta(days=1)).isoformat()
+            assert await row_counts(db) == (40, 10)
+            
+            # Nothing left to do
+            stub.history_requests.clear()
+            assert await backfill.run(START, END) == 0
+            assert stub.history_requests == []
+        finally:
+            await teardown(stub, session, db)
+    asyncio.run(run())
+
+def test_backfill_fails_on_history_errors_and_keeps_checkpoint(tmp_path):
+    async def run():
+        stub, session, db, backfill = await setup(tmp_path, latency=0)
+        backfill.comparison.ha_client.retries = 0
+        stub.failure_rate = 1.0
+        try:
+            assert await backfill.run(START, END) == 0
+            assert backfill.status['state'] == 'failed'
+            assert (await backfill.get_checkpoint())['completed_through'] is None
+            assert await row_counts(db) == (0, 0)
+        finally:
+            await teardown(stub, session, db)
+    asyncio.run(run())
+
+def test_failing_backfill_leaves_live_requests_working(tmp_path):
+    async def run():
+        stub, session, db, backfill = await setup(tmp_path, latency=0)
+        client = backfill.comparison.ha_client
+        client.retries = 4
+        client.backoff = Backoff(0.01)
+        stub.failure_rate = 1.0
+        try:
+            assert await backfill.run(START, END) == 0
+            assert client.history_breaker.state == CircuitBreaker.OPEN
+            
+            # Home Assistant answers again: live requests are not rejected by the backfill's failures
+            stub.failure_rate = 0
+            requests = stub.requests
+            assert client.breaker.state == CircuitBreaker.CLOSED
+            assert await client.get_value('sensor.pv_power') is not None
+            assert stub.requests == requests + 1
+        finally:
+            await teardown(stub, session, db)
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+"""
+Tests of the database statistics.
+"""
+
+import asyncio
+import time
+
+from db_stats import update_table_sizes
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+from sample_buffer import SampleBuffer
+
+def size_rows(db):
+    return db.read(lambda conn: conn.execute(
+        'SELECT table_name, size_bytes, size_updated FROM db_stats ORDER BY table_name').fetchall())
+
+def test_table_sizes_are_measured_off_the_write_path(tmp_path):
+    async def run():
+        db = PVDatabase(str(tmp_path / 'pv.db'))
+        PVForecastComparison({'entity_discovery': False}, db=db)
+        try:
+            # Flushing samples leaves the sizes alone
+            buffer = SampleBuffer(db)
+            now = time.time()
+            for index in range(1000):
+                buffer.add('sensor.pv_power', now - index, index)
+            assert await buffer.flush() == 1000
+            assert all(size is None and updated is None for _, size, updated in await size_rows(db))
+            
+            assert await update_table_sizes(db)
+            sizes = {table: size for table, size, _ in await size_rows(db)}
+            assert sizes['pv_samples'] > 0 and sizes['pv_forecast'] > 0
+            
+            # Fresh sizes are not measured again
+            assert not await update_table_sizes(db)
+        finally:
+            db.close()
+    asyncio.run(run())
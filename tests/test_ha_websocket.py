@@ -0,0 +1,152 @@
+"""
+Tests of the WebSocket state stream against the Home Assistant stub.
+"""
+
+import asyncio
+import time
+
+from ha_client import create_session
+from ha_stub import HAStub
+from ha_websocket import HAStateStream, websocket_url
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+
+ENTITIES = {'sensor.pv_production_forecast': 25000, 'sensor.pv_power': 3500}
+
+async def wait_for(condition, timeout: float = 5):
+    """Wait until condition() is true."""
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+def test_stream_receives_initial_states_and_changes():
+    async def run():
+        stub = HAStub(entities=ENTITIES, token='secret')
+        url = await stub.start()
+        stream = HAStateStream(websocket_url(url), 'secret', list(ENTITIES))
+        await stream.start()
+        try:
+            await wait_for(lambda: stream.ready)
+            assert stream.get_values(list(ENTITIES)) == {'sensor.pv_production_forecast': 25000.0,
+                                                        'sensor.pv_power': 3500.0}
+            await stub.set_state('sensor.pv_power', 1200)
+            await wait_for(lambda: stream.values['sensor.pv_power'] == 1200.0)
+        finally:
+            await stream.stop()
+            await stub.stop()
+    asyncio.run(run())
+
+def test_stream_resubscribes_after_connection_drop():
+    async def run():
+        stub = HAStub(entities=ENTITIES)
+        url = await stub.start()
+        stream = HAStateStream(websocket_url(url), 'token', list(ENTITIES), reconnect_delay=0.2)
+        await stream.start()
+        try:
+            await wait_for(lambda: stream.ready)
+            await stub.drop_connections()
+            await wait_for(lambda: not stream.ready)
+            assert stream.get_values(list(ENTITIES)) is None
+            
+            # Changed while disconnected: the new subscription delivers it with the initial states
+            stub.entities['sensor.pv_power'] = 800
+            await wait_for(lambda: stream.ready)
+            assert stub.ws_connections == 2 and stub.subscriptions == 2
+            assert stream.values['sensor.pv_power'] == 800.0
+            
+            await stub.set_state('sensor.pv_power', 900)
+            await wait_for(lambda: stream.values['sensor.pv_power'] == 900.0)
+        finally:
+            await stream.stop()
+            await stub.stop()
+    asyncio.run(run())
+
+def test_stream_rejected_token_stays_down():
+    async def run():
+        stub = HAStub(entities=ENTITIES, token='secret')
+        url = await stub.start()
+        stream = HAStateStream(websocket_url(url), 'wrong', list(ENTITIES), reconnect_delay=0.05)
+        await stream.start()
+        try:
+            await wait_for(lambda: stub.ws_connections >= 2)
+            assert not stream.ready
+        finally:
+            await stream.stop()
+            await stub.stop()
+    asyncio.run(run())
+
+def test_collection_falls_back_to_rest_while_stream_is_down(tmp_path):
+    async def run():
+        stub = HAStub(entities=ENTITIES)
+        url = await stub.start()
+        session = create_session()
+        db = PVDatabase(str(tmp_path / 'pv.db'))
+        stream = HAStateStream(websocket_url(url), 'token', list(ENTITIES), reconnect_delay=1)
+        comparison = PVForecastComparison({'ha_url': url, 'collection_mode': 'per_entity',
+                                           'entity_discovery': False}, session=session, db=db,
+                                          state_stream=stream)
+        try:
+            # Not connected yet: values come from REST requests
+            values = await comparison.fetch_entity_values(list(ENTITIES))
+            assert all(value is not None for value in values.values())
+            assert stub.requests == len(ENTITIES)
+            
+            # Live: no REST requests
+            await stream.start()
+            await wait_for(lambda: stream.ready)
+            assert await comparison.fetch_entity_values(list(ENTITIES)) == {
+                'sensor.pv_production_forecast': 25000.0, 'sensor.pv_power': 3500.0}
+            assert stub.requests == len(ENTITIES)
+            
+            # Dropped: REST again until the stream is back
+            await stub.drop_connections()
+            await wait_for(lambda: not stream.ready)
+            values = await comparison.fetch_entity_values(list(ENTITIES))
+            assert all(value is not None for value in values.values())
+            assert stub.requests == 2 * len(ENTITIES)
+        finally:
+            await stream.stop()
+            await session.close()
+            await stub.stop()
+            db.close()
+    asyncio.run(run())
+
+def test_stream_resubscribes_to_discovered_entities(tmp_path):
+    async def run():
+        stub = HAStub(entities=dict(ENTITIES, **{'sensor.pv_daily_energy': 18000}))
+        url = await stub.start()
+        session = create_session()
+        db = PVDatabase(str(tmp_path / 'pv.db'))
+        comparison = PVForecastComparison({'ha_url': url, 'collection_mode': 'per_entity',
+                                           'forecast_entities': ['sensor.pv_production_forecast'],
+                                           'production_entities': ['sensor.pv_power'],
+                                           'daily_entities': ['sensor.missing_daily']},
+                                          session=session, db=db)
+        # Built before discovery succeeded, as when it fails at startup
+        stream = HAStateStream(websocket_url(url), 'token', comparison.all_entities, reconnect_delay=0.2)
+        comparison.state_stream = stream
+        await stream.start()
+        try:
+            await wait_for(lambda: stream.ready)
+            
+            # Entities the stream does not cover are read over REST
+            assert stream.get_values(['sensor.pv_daily_energy']) is None
+            values = await comparison.fetch_entity_values(['sensor.pv_daily_energy'])
+            assert values['sensor.pv_daily_energy'] is not None
+            
+            # Discovery extends the daily chain and the stream subscribes to it
+            assert await comparison.discover_entities()
+            assert 'sensor.pv_daily_energy' in comparison.all_entities
+            await wait_for(lambda: stream.ready and 'sensor.pv_daily_energy' in stream.values)
+            assert stub.subscriptions == 2
+            requests = stub.requests
+            values = await comparison.fetch_entity_values(comparison.all_entities)
+            assert values['sensor.pv_daily_energy'] == 18000.0
+            assert stub.requests == requests
+        finally:
+            await stream.stop()
+            await session.close()
+            await stub.stop()
+            db.close()
+    asyncio.run(run())
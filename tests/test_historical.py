@@ -0,0 +1,34 @@
+"""
+Tests of the historical data queries behind /api/historical.
+"""
+
+import asyncio
+import time
+
+from pv_data_retriever import PVDataRetriever
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+from sample_buffer import SampleBuffer
+
+def test_series_history_is_downsampled(tmp_path):
+    async def run():
+        db = PVDatabase(str(tmp_path / 'pv.db'))
+        PVForecastComparison({'entity_discovery': False}, db=db)
+        buffer = SampleBuffer(db)
+        now = time.time()
+        for day in range(30):
+            buffer.add('sensor.pv_power', now - day * 86400, 1000 + (day % 7) * 100)
+        await buffer.flush()
+        retriever = PVDataRetriever(db)
+        try:
+            full = await retriever.get_series_history('sensor.pv_power', 30, 'day')
+            assert len(full['dates']) == 30
+            reduced = await retriever.get_series_history('sensor.pv_power', 30, 'day', max_points=10)
+            assert len(reduced['dates']) == 10
+            assert all(len(reduced[key]) == 10 for key in ('sum', 'min', 'max', 'avg'))
+            # The first and last buckets are always kept
+            assert reduced['dates'][0] == full['dates'][0] and reduced['dates'][-1] == full['dates'][-1]
+            assert reduced['resolution'] == 'day'
+        finally:
+            db.close()
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+"""
+Known-answer tests of the forecast accuracy metrics.
+"""
+
+import math
+import sqlite3
+from datetime import date
+
+import pytest
+
+from metrics import query_metrics
+from pv_forecast_comparison import COMPARISON_TABLES
+
+# (site, date, time slot, forecast, actual); the 4am row has no forecast and February only another site
+ROWS = [
+    ('default', '2024-01-30', '11am', 100, 80),
+    ('default', '2024-01-31', '11am', 90, 100),
+    ('default', '2024-01-31', '3pm', 50, 50),
+    ('default', '2024-03-01', '11am', 200, 100),
+    ('default', '2024-03-01', '4am', None, 10),
+    ('default', '2024-03-01', '11pm', 0, 0),
+    ('garage', '2024-02-10', '11am', 1, 2),
+]
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(COMPARISON_TABLES['pv_forecast'])
+    conn.executemany('INSERT INTO pv_forecast (site, date, time_slot, forecast_wh, actual_wh) VALUES (?, ?, ?, ?, ?)',
+                     ROWS)
+    yield conn
+    conn.close()
+
+def approx(metrics):
+    return {key: pytest.approx(value) if isinstance(value, float) else value for key, value in metrics.items()}
+
+def test_metrics_by_time_slot(conn):
+    result = query_metrics(conn, 'slots', date(2024, 1, 1), date(2024, 3, 31), 'time_slot')
+    # 4am has no complete row and is left out; slots are in chronological order
+    assert result['groups'] == [
+        approx({'group': '11am', 'count': 3, 'mae': 130 / 3, 'rmse': math.sqrt(3500), 'mape': 45.0,
+                'bias': 110 / 3, 'skill': 0.75, 'forecast_total': 390.0, 'actual_total': 280.0}),
+        approx({'group': '3pm', 'count': 1, 'mae': 0.0, 'rmse': 0.0, 'mape': 0.0, 'bias': 0.0,
+                'skill': None, 'forecast_total': 50.0, 'actual_total': 50.0}),
+        approx({'group': '11pm', 'count': 1, 'mae': 0.0, 'rmse': 0.0, 'mape': None, 'bias': 0.0,
+                'skill': None, 'forecast_total': 0.0, 'actual_total': 0.0}),
+    ]
+    assert result['overall'] == approx({'count': 5, 'mae': 26.0, 'rmse': math.sqrt(2100), 'mape': 33.75,
+                                        'bias': 22.0, 'skill': 0.75, 'forecast_total': 440.0,
+                                        'actual_total': 330.0})
+
+def test_metrics_by_month_skips_empty_months(conn):
+    result = query_metrics(conn, 'slots', date(2024, 1, 1), date(2024, 3, 31), 'month')
+    assert result['groups'] == [
+        approx({'group': '2024-01', 'count': 3, 'mae': 10.0, 'rmse': math.sqrt(500 / 3), 'mape': 35 / 3,
+                'bias': 10 / 3, 'skill': 0.75, 'forecast_total': 240.0, 'actual_total': 230.0}),
+        approx({'group': '2024-03', 'count': 2, 'mae': 50.0, 'rmse': math.sqrt(5000), 'mape': 100.0,
+                'bias': 50.0, 'skill': None, 'forecast_total': 200.0, 'actual_total': 100.0}),
+    ]
+
+@pytest.mark.parametrize('group_by', ['month', 'time_slot'])
+def test_metrics_of_empty_range(conn, group_by):
+    # February only has rows of another site
+    result = query_metrics(conn, 'slots', date(2024, 2, 1), date(2024, 2, 29), group_by)
+    assert result['groups'] == []
+    assert result['overall'] == {'count': 0, 'mae': None, 'rmse': None, 'mape': None, 'bias': None,
+                                 'skill': None, 'forecast_total': 0.0, 'actual_total': 0.0}
+    garage = query_metrics(conn, 'slots', date(2024, 2, 1), date(2024, 2, 29), group_by, site='garage')
+    assert garage['overall']['count'] == 1 and len(garage['groups']) == 1
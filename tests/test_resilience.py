@@ -0,0 +1,176 @@
+"""
+Tests of the resilience layer of the Home Assistant client against the stub.
+"""
+
+import asyncio
+import random
+import time
+
+import resilience
+from ha_client import HAClient
+from ha_stub import HAStub
+from resilience import Backoff, CircuitBreaker
+
+ENTITIES = {'sensor.pv_power': 3500}
+
+class RecordingBackoff(Backoff):
+    """Backoff that remembers every delay it returned."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delays = []
+    
+    def delay(self, retry: int) -> float:
+        delay = super().delay(retry)
+        self.delays.append((retry, delay))
+        return delay
+
+class FakeClock:
+    """Manually advanced clock for the circuit breaker."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+def test_deadline_cuts_off_slow_request():
+    async def run():
+        stub = HAStub(entities=ENTITIES, latency=2)
+        url = await stub.start()
+        client = HAClient(url, 'token', timeout=10, retries=3)
+        try:
+            start = time.monotonic()
+            with resilience.deadline(0.3):
+                assert await client.get_value('sensor.pv_power') is None
+            assert time.monotonic() - start < 1
+            # No time was left to retry
+            assert stub.requests == 1
+            
+            # Without time left, the request is not sent at all
+            with resilience.deadline(0.1):
+                await asyncio.sleep(0.15)
+                assert await client.get_value('sensor.pv_power') is None
+            assert stub.requests == 1
+        finally:
+            await client.close()
+            await stub.stop()
+    asyncio.run(run())
+
+def test_adaptive_timeout_follows_latency():
+    async def run():
+        stub = HAStub(entities=ENTITIES, latency=0.02)
+        url = await stub.start()
+        client = HAClient(url, 'token', timeout=5, min_timeout=0.05, retries=4)
+        try:
+            assert client.timeouts.timeout('state') == 5
+            for _ in range(5):
+                assert await client.get_value('sensor.pv_power') is not None
+            fast = client.timeouts.timeout('state')
+            assert fast < 1
+            
+            # The first slow requests only get through on retries with doubled timeouts
+            stub.latency = 0.3
+            for _ in range(4):
+                assert await client.get_value('sensor.pv_power') is not None
+            slow = client.timeouts.timeout('state')
+            assert slow > fast
+            
+            stub.latency = 0.02
+            for _ in range(10):
+                assert await client.get_value('sensor.pv_power') is not None
+            assert client.timeouts.timeout('state') < slow
+            # Retries double the timeout, up to the configured timeout
+            assert client.timeouts.timeout('state', 1) == 2 * client.timeouts.timeout('state')
+            assert client.timeouts.timeout('state', 20) == 5
+        finally:
+            await client.close()
+            await stub.stop()
+    asyncio.run(run())
+
+def test_timed_out_request_is_retried():
+    async def run():
+        stub = HAStub(entities=ENTITIES, timeout_rate=1, timeout_delay=2)
+        url = await stub.start()
+        client = HAClient(url, 'token', timeout=0.2, retries=2, backoff=0.01, failure_threshold=10)
+        try:
+            start = time.monotonic()
+            assert await client.get_value('sensor.pv_power') is None
+            assert stub.requests == 3
+            assert time.monotonic() - start < 2
+        finally:
+            await client.close()
+            await stub.stop()
+    asyncio.run(run())
+
+def test_backoff_uses_full_jitter():
+    backoff = Backoff(base=0.5, maximum=2, rng=random.Random(1))
+    for retry, cap in ((1, 0.5), (2, 1), (3, 2), (6, 2)):
+        delays = [backoff.delay(retry) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+        # Spread over the whole range instead of clustering at the cap
+        assert min(delays) < cap * 0.1 and max(delays) > cap * 0.9
+
+def test_retries_back_off_within_deadline():
+    async def run():
+        stub = HAStub(entities=ENTITIES, failure_rate=1)
+        url = await stub.start()
+        client = HAClient(url, 'token', min_timeout=0.05, retries=3, failure_threshold=100)
+        client.backoff = RecordingBackoff(base=0.05, maximum=1, rng=random.Random(2))
+        try:
+            assert await client.get_value('sensor.pv_power') is None
+            assert stub.requests == 4
+            assert [retry for retry, _ in client.backoff.delays] == [1, 2, 3]
+            assert all(0 <= delay <= 0.05 * 2 ** (retry - 1) for retry, delay in client.backoff.delays)
+            
+            # Unlimited retries stop when the deadline leaves no time for another one
+            stub.requests = 0
+            client.retries = 1000
+            client.backoff = RecordingBackoff(base=0.05, maximum=0.1, rng=random.Random(3))
+            start = time.monotonic()
+            with resilience.deadline(0.5):
+                assert await client.get_value('sensor.pv_power') is None
+            assert time.monotonic() - start < 0.6
+            assert 1 < stub.requests < 100
+            assert len(client.backoff.delays) == stub.requests
+        finally:
+            await client.close()
+            await stub.stop()
+    asyncio.run(run())
+
+def test_circuit_breaker_opens_half_opens_and_closes():
+    async def run():
+        stub = HAStub(entities=ENTITIES, failure_rate=1)
+        url = await stub.start()
+        client = HAClient(url, 'token', retries=0)
+        clock = FakeClock()
+        client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        try:
+            for _ in range(2):
+                assert await client.get_value('sensor.pv_power') is None
+            assert client.breaker.state == CircuitBreaker.OPEN
+            
+            # Open: rejected without a request
+            assert await client.get_value('sensor.pv_power') is None
+            assert stub.requests == 2
+            
+            # Half-open: a failed probe opens the circuit again
+            clock.now = 30
+            assert client.breaker.state == CircuitBreaker.HALF_OPEN
+            assert await client.get_value('sensor.pv_power') is None
+            assert stub.requests == 3
+            assert client.breaker.state == CircuitBreaker.OPEN
+            
+            # A successful probe closes it
+            stub.failure_rate = 0
+            clock.now = 60
+            assert client.breaker.state == CircuitBreaker.HALF_OPEN
+            assert await client.get_value('sensor.pv_power') is not None
+            assert client.breaker.state == CircuitBreaker.CLOSED
+            assert client.status()['circuit'] == {'state': 'closed', 'consecutive_failures': 0}
+            assert await client.get_value('sensor.pv_power') is not None
+            assert stub.requests == 5
+        finally:
+            await client.close()
+            await stub.stop()
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+"""
+Tests of the response cache and the conditional requests it serves.
+"""
+
+import asyncio
+from datetime import date
+
+import aiohttp
+from aiohttp import web
+
+from pv_data_retriever import PVDataRetriever
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+from response_cache import CachedResponse, ResponseCache
+from run import PVForecastAddon
+
+def test_cache_entries_expire_with_the_generation():
+    cache = ResponseCache()
+    cache.put('a', 1, b'{"a": 1}')
+    assert cache.get('a', 1).body == b'{"a": 1}'
+    assert cache.get('a', 2) is None
+    # The stale entry is dropped, not kept for the old generation
+    assert cache.get('a', 1) is None
+    assert cache.size == 0 and (cache.hits, cache.misses) == (1, 2)
+
+def test_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put('a', 0, b'aaaa')
+    cache.put('b', 0, b'bbbb')
+    cache.get('a', 0)
+    cache.put('c', 0, b'cccc')
+    assert cache.get('b', 0) is None and cache.get('a', 0) is not None
+    # Over the byte limit: evicted until it fits; bodies larger than the limit are not stored
+    cache.put('d', 0, b'dddddd')
+    assert cache.size <= 10 and cache.get('d', 0) is not None
+    cache.put('e', 0, b'e' * 11)
+    assert cache.get('e', 0) is None
+
+def test_if_none_match_uses_weak_comparison():
+    entry = CachedResponse(b'body', 0)
+    assert entry.matches(entry.etag)
+    assert entry.matches(f'W/{entry.etag}')
+    assert entry.matches(f'"other", W/{entry.etag}')
+    assert entry.matches('*')
+    assert not entry.matches('"other"')
+    assert not entry.matches(None) and not entry.matches('')
+
+def test_dashboard_304_until_a_write(tmp_path):
+    async def run():
+        db = PVDatabase(str(tmp_path / 'pv.db'))
+        PVForecastComparison({'entity_discovery': False}, db=db)
+        addon = PVForecastAddon(dict(PVForecastAddon.default_config(), static_dir=str(tmp_path / 'static')))
+        addon.db = db
+        addon.retriever = PVDataRetriever(db)
+        runner = web.AppRunner(addon.create_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        try:
+            async with aiohttp.ClientSession(f'http://127.0.0.1:{runner.addresses[0][1]}') as session:
+                async with session.get('/api/dashboard') as response:
+                    assert response.status == 200
+                    etag = response.headers['ETag']
+                    assert (await response.json())['today']['11am'] == {'forecast': 0, 'actual': 0}
+                
+                # Unchanged: 304 without a body, also for the weak form the browser may send
+                for tag in (etag, f'W/{etag}'):
+                    async with session.get('/api/dashboard', headers={'If-None-Match': tag}) as response:
+                        assert response.status == 304
+                        assert await response.read() == b''
+                        assert response.headers['ETag'] == etag
+                assert addon.response_cache.hits == 2
+                
+                # A write bumps the generation, so the cached body is rebuilt with a new ETag
+                generation = db.generation
+                await db.write(lambda conn: conn.execute('''
+                    INSERT INTO pv_forecast (date, time_slot, forecast_wh, actual_wh) VALUES (?, '11am', 5000, 4000)
+                ''', (date.today().isoformat(),)))
+                assert db.generation == generation + 1
+                async with session.get('/api/dashboard', headers={'If-None-Match': etag}) as response:
+                    assert response.status == 200
+                    assert response.headers['ETag'] != etag
+                    assert (await response.json())['today']['11am'] == {'forecast': 5000, 'actual': 4000}
+        finally:
+            await runner.cleanup()
+            db.close()
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+"""
+Tests of the scheduler's catch-up of runs missed while the add-on was stopped.
+"""
+
+from datetime import datetime, time as dtime
+from zoneinfo import ZoneInfo
+
+from scheduler import CronRule, ScheduledJob, Scheduler
+
+TZ = ZoneInfo('Europe/Berlin')
+
+def ts(*args) -> float:
+    """Timestamp of a local time in TZ."""
+    return datetime(*args, tzinfo=TZ).timestamp()
+
+async def noop():
+    """Job callback doing nothing."""
+
+def make_job(at: dtime, last_run: float, catch_up: float = 7200) -> ScheduledJob:
+    """Daily job at the given time that last ran at last_run."""
+    job = ScheduledJob('collect', CronRule.daily(at, TZ), noop, catch_up=catch_up)
+    job.last_run = last_run
+    return job
+
+def test_catches_up_run_missed_earlier_today():
+    """A run missed an hour ago on the same day is caught up."""
+    job = make_job(dtime(12, 0), ts(2024, 6, 9, 12, 0))
+    assert Scheduler._latest_missed(job, ts(2024, 6, 10, 13, 0)) == ts(2024, 6, 10, 12, 0)
+
+def test_skips_run_missed_before_midnight():
+    """A 23:00 run missed within the window but on the previous day is not caught up."""
+    job = make_job(dtime(23, 0), ts(2024, 6, 9, 23, 0))
+    assert Scheduler._latest_missed(job, ts(2024, 6, 11, 0, 30)) is None
+
+def test_skips_run_outside_window():
+    """A run missed longer ago than the catch-up window is not caught up."""
+    job = make_job(dtime(8, 0), ts(2024, 6, 9, 8, 0))
+    assert Scheduler._latest_missed(job, ts(2024, 6, 10, 11, 0)) is None
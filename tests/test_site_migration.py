@@ -0,0 +1,128 @@
+"""
+Tests of the migration of comparison tables created before sites existed.
+"""
+
+import sqlite3
+
+import pytest
+
+from db_stats import create_stats_table
+from pv_database import PVDatabase
+from pv_forecast_comparison import PVForecastComparison
+from rollups import DAILY_SERIES, create_rollup_tables
+
+# Schema of the add-on before this series: no provider, site, rollups or statistics
+BASELINE_SCHEMA = '''
+    CREATE TABLE pv_forecast (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        time_slot TEXT NOT NULL,
+        forecast_wh REAL,
+        actual_wh REAL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(date, time_slot)
+    );
+    CREATE TABLE daily_production (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        total_forecast_wh REAL,
+        total_actual_wh REAL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(date)
+    );
+'''
+
+FORECAST_ROWS = [('2024-05-01', '11am', 5000, 5200), ('2024-05-01', '3pm', 3000, 2800),
+                 ('2024-05-02', '11am', 4000, 4100)]
+DAILY_ROWS = [('2024-05-01', 20000, 21000), ('2024-05-02', 18000, 17500)]
+
+def create_baseline(path, stats=False):
+    """Create a database with the baseline tables and rows, optionally with the statistics of later versions."""
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    if stats:
+        # Rows stored by a version with providers, samples, rollups and db_stats but no sites
+        for table in ('pv_forecast', 'daily_production'):
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN provider TEXT')
+        conn.execute('CREATE TABLE pv_samples (entity_id TEXT NOT NULL, ts REAL NOT NULL, '
+                     'value REAL NOT NULL, PRIMARY KEY (entity_id, ts)) WITHOUT ROWID')
+        create_rollup_tables(conn)
+        create_stats_table(conn)
+    conn.executemany('INSERT INTO pv_forecast (date, time_slot, forecast_wh, actual_wh) VALUES (?, ?, ?, ?)',
+                     FORECAST_ROWS)
+    conn.executemany('INSERT INTO daily_production (date, total_forecast_wh, total_actual_wh) VALUES (?, ?, ?)',
+                     DAILY_ROWS)
+    if stats:
+        conn.execute('''
+            INSERT INTO rollup_daily (series, bucket, forecast_sum, actual_sum, error_count)
+            SELECT ?, date, total_forecast_wh, total_actual_wh, 1 FROM daily_production
+        ''', (DAILY_SERIES,))
+    conn.commit()
+    conn.close()
+
+def migrate(path):
+    """Open the database as the add-on does at startup."""
+    db = PVDatabase(path)
+    PVForecastComparison({'entity_discovery': False}, db=db)
+    db.close()
+
+def snapshot(path):
+    """Schema and contents of every table."""
+    conn = sqlite3.connect(path)
+    try:
+        schema = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+        tables = [name for kind, name, _ in schema if kind == 'table' and not name.startswith('sqlite_')]
+        rows = {table: conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall() for table in tables
+                if table != 'db_stats'}
+        stats = conn.execute('SELECT table_name, row_count FROM db_stats ORDER BY 1').fetchall()
+        return schema, rows, stats
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize('stats', [False, True], ids=['baseline', 'with_stats'])
+def test_migration_keeps_rows_constraints_triggers_and_rollups(tmp_path, stats):
+    path = str(tmp_path / 'pv.db')
+    create_baseline(path, stats)
+    migrate(path)
+    
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute('''
+            SELECT date, time_slot, forecast_wh, actual_wh, site FROM pv_forecast ORDER BY date, time_slot
+        ''').fetchall() == [row + ('default',) for row in FORECAST_ROWS]
+        assert conn.execute('''
+            SELECT date, total_forecast_wh, total_actual_wh, site FROM daily_production ORDER BY date
+        ''').fetchall() == [row + ('default',) for row in DAILY_ROWS]
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%before_sites'").fetchall()
+        
+        # Rollups were built (or kept) for the existing rows
+        assert conn.execute('SELECT bucket, forecast_sum, actual_sum FROM rollup_daily WHERE series = ? '
+                            'ORDER BY bucket', (DAILY_SERIES,)).fetchall() == DAILY_ROWS
+        
+        # Statistics count the migrated rows once, and the triggers keep them current
+        triggers = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        assert {f'{table}_stats_{event}' for table in ('pv_forecast', 'daily_production')
+                for event in ('insert', 'update', 'delete')} <= triggers
+        counts = dict(conn.execute('SELECT table_name, row_count FROM db_stats'))
+        assert counts['pv_forecast'] == 3 and counts['daily_production'] == 2
+        
+        # The unique keys include the site: another site may store the same day, the same site may not
+        conn.execute("INSERT INTO daily_production (date, site) VALUES ('2024-05-01', 'garage')")
+        conn.execute("INSERT INTO pv_forecast (date, time_slot, site) VALUES ('2024-05-01', '11am', 'garage')")
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO daily_production (date, site) VALUES ('2024-05-01', 'default')")
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO pv_forecast (date, time_slot) VALUES ('2024-05-02', '11am')")
+        counts = dict(conn.execute('SELECT table_name, row_count FROM db_stats'))
+        assert counts['pv_forecast'] == 4 and counts['daily_production'] == 3
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_migration_runs_once(tmp_path):
+    path = str(tmp_path / 'pv.db')
+    create_baseline(path, stats=True)
+    migrate(path)
+    before = snapshot(path)
+    migrate(path)
+    assert snapshot(path) == before
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tracing
+Opt-in spans for the collection hot path, written to a bounded JSON lines file.
+"""
+
+import json
+import logging
+import os
+import queue
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Callable, Dict, Optional
+
+_current: ContextVar[Optional['Span']] = ContextVar('pv_trace_span', default=None)
+
+class Span:
+    """One timed operation; spans opened inside it (also in tasks it creates) become its children."""
+    
+    __slots__ = ('tracer', 'name', 'attrs', 'trace_id', 'span_id', 'parent_id', '_start', '_wall', '_token')
+    
+    def __init__(self, tracer: 'Tracer', name: str, attrs: Dict[str, Any]):
+        """Initialize the span; it starts when entered."""
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+    
+    def __enter__(self) -> 'Span':
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = os.urandom(4).hex()
+        self._token = _current.set(self)
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = time.perf_counter() - self._start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.emit({
+            'trace': self.trace_id,
+            'span': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start': round(self._wall, 6),
+            'duration_ms': round(duration * 1000, 3),
+            'attrs': self.attrs
+        })
+        return False
+    
+    def set(self, **attrs):
+        """Add attributes to the span."""
+        self.attrs.update(attrs)
+    
+    def wrap(self, call: Callable[[], Any]) -> Callable[[], Any]:
+        """Wrap a call handed to a worker thread so the span records how long it was queued."""
+        submitted = time.perf_counter()
+        
+        def run():
+            self.attrs['queued_ms'] = round((time.perf_counter() - submitted) * 1000, 3)
+            return call()
+        return run
+
+class NullSpan:
+    """Span used while tracing is disabled; every method does nothing."""
+    
+    __slots__ = ()
+    
+    def __enter__(self) -> 'NullSpan':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+    
+    def set(self, **attrs):
+        """Ignore attributes."""
+    
+    def wrap(self, call: Callable[[], Any]) -> Callable[[], Any]:
+        """Return the call unchanged."""
+        return call
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+    """Writes finished spans as JSON lines to a size-limited file.
+    
+    Lines are handed to a background thread through a queue, so the event
+    loop never waits for the disk. The file is rotated at max_bytes with a
+    single backup, bounding the disk use to twice that size.
+    """
+    
+    def __init__(self):
+        """Initialize a disabled tracer."""
+        self.enabled = False
+        self.path: Optional[str] = None
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[QueueListener] = None
+    
+    def configure(self, path: str, max_bytes: int = 5 * 1024 * 1024):
+        """Enable tracing to path."""
+        self.close()
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=1, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        self._listener = QueueListener(records, handler)
+        self._listener.start()
+        self._logger = logging.getLogger('pv_trace')
+        self._logger.handlers = [QueueHandler(records)]
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self.path = path
+        self.enabled = True
+    
+    def span(self, name: str, **attrs):
+        """A span context manager, or the shared no-op span while disabled."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+    
+    def emit(self, record: Dict[str, Any]):
+        """Queue one finished span for writing."""
+        self._logger.info(json.dumps(record, default=str))
+    
+    def close(self):
+        """Disable tracing and flush the file."""
+        self.enabled = False
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+TRACER = Tracer()
+
+def span(name: str, **attrs):
+    """Open a span on the shared tracer."""
+    return TRACER.span(name, **attrs)